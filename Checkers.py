@@ -1,27 +1,135 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, abort, jsonify
+from flask import Flask, Request, Response, render_template, request, redirect, url_for, send_file, abort, jsonify, stream_with_context
 import os
 import tempfile
-import ifcopenshell
-import ifcopenshell.util.element
 import uuid
 import time
-import pandas as pd
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, Counter
 from openpyxl import Workbook
-from openpyxl.chart import BarChart, PieChart, Reference
-from openpyxl.chart.label import DataLabelList
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+from openpyxl.styles import Font, PatternFill, Border, Side, Alignment, NamedStyle
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from openpyxl.utils import get_column_letter
 import concurrent.futures
-from typing import Dict, List, Set, Tuple
+import multiprocessing
+from typing import Dict, List, Set, Tuple, NamedTuple
 import shutil
 import re
+import json
+import hashlib
+import contextlib
+import functools
+import heapq
+import gzip
+import csv
+import cProfile
+import pickle
+import sqlite3
+import base64
+import sys
+from array import array
 from datetime import datetime
 import threading
+import zipfile
+import importlib
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# pandas (lecture des classeurs), ifcopenshell (lecture des modèles) et les graphiques openpyxl
+# sont importés à leur première utilisation : les workers web n'en ont pas besoin
+
+try:
+    # Moteur de validation Rust optionnel (voir rust_analyzer/), repli automatique sur Python
+    import ifc_analyzer
+except ImportError:
+    ifc_analyzer = None
+
+try:
+    # Export Parquet optionnel des lignes de détail
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    # Verrou du nettoyage de TEMP_FOLDER partagé entre workers (POSIX)
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class InvalidUpload(Exception):
+    """Levée pendant la réception d'un fichier dont le contenu est refusé."""
+
+# En-tête STEP d'un fichier IFC, vérifié dès la réception des premiers Ko
+IFC_MAGIC = b'ISO-10303-21;'
+IFC_HEADER_SCAN_BYTES = 64 * 1024
+IFC_SCHEMA_PATTERN = re.compile(rb"FILE_SCHEMA\s*\(\s*\(\s*'([^']*)'", re.IGNORECASE)
+
+class UploadStream:
+    """Fichier reçu écrit directement dans le dossier d'analyse et haché au fil de l'écriture.
+    
+    Pour un fichier .ifc, l'en-tête ISO-10303-21 et le FILE_SCHEMA sont contrôlés sans
+    attendre la fin du transfert.
+    """
+    def __init__(self, directory, filename):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.is_ifc = filename.lower().endswith('.ifc')
+        self.header = b''
+        self.schema = None
+    
+    def write(self, data):
+        if self.is_ifc and self.schema is None:
+            self.header += data[:IFC_HEADER_SCAN_BYTES - len(self.header)]
+            self.check_header(complete=False)
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+    
+    def check_header(self, complete=True):
+        """Lève InvalidUpload dès que l'en-tête reçu ne peut plus être celui d'un fichier IFC."""
+        if self.schema is not None:
+            return
+        header = self.header.lstrip()
+        if (complete or len(header) >= len(IFC_MAGIC)) and not header.startswith(IFC_MAGIC):
+            raise InvalidUpload("Invalid IFC file: missing ISO-10303-21 header")
+        match = IFC_SCHEMA_PATTERN.search(header)
+        if match:
+            self.schema = match.group(1).decode('ascii', 'replace').upper()
+        elif complete or b'ENDSEC;' in header or len(self.header) >= IFC_HEADER_SCAN_BYTES:
+            raise InvalidUpload("Invalid IFC file: missing FILE_SCHEMA")
+    
+    def save(self, destination):
+        """Termine la réception et déplace le fichier ; retourne le SHA-256 du contenu."""
+        if self.is_ifc:
+            self.check_header()
+        self.file.close()
+        os.replace(self.path, destination)
+        return self.sha256.hexdigest()
+    
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class CheckersRequest(Request):
+    # Dossier où /upload fait écrire les fichiers reçus, sans copie temporaire intermédiaire
+    upload_dir = None
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_dir is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return UploadStream(self.upload_dir, filename or '')
+    
+    @property
+    def max_content_length(self):
+        # Un lot porte plusieurs modèles : sa limite est celle de la requête entière
+        if self.endpoint == 'upload_batch':
+            return BATCH_MAX_UPLOAD_BYTES
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = CheckersRequest
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 300 * 1024 * 1024  # 300 Mo
@@ -29,60 +137,150 @@ UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 TEMP_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
 
-# Créer les dossiers nécessaires
-print(f"Creating folders: {UPLOAD_FOLDER}, {TEMP_FOLDER}")
-for folder in [UPLOAD_FOLDER, TEMP_FOLDER]:
-    if not os.path.exists(folder):
-        try:
-            os.makedirs(folder, mode=0o777, exist_ok=True)
-            print(f"Created folder: {folder}")
-        except Exception as e:
-            print(f"Error creating folder {folder}: {str(e)}")
+def create_folders():
+    """Crée les dossiers nécessaires."""
+    print(f"Creating folders: {UPLOAD_FOLDER}, {TEMP_FOLDER}")
+    for folder in [UPLOAD_FOLDER, TEMP_FOLDER]:
+        if not os.path.exists(folder):
+            try:
+                os.makedirs(folder, mode=0o777, exist_ok=True)
+                print(f"Created folder: {folder}")
+            except Exception as e:
+                print(f"Error creating folder {folder}: {str(e)}")
 
 ALLOWED_EXTENSIONS = {'ifc', 'xlsx'}
 
+# Configuration de la file d'analyses
+MAX_CONCURRENT_JOBS = int(os.environ.get('CHECKERS_MAX_JOBS', 2))  # Analyses exécutées en parallèle
+MAX_QUEUED_JOBS = int(os.environ.get('CHECKERS_MAX_QUEUE', 10))  # Analyses en attente au-delà
+STATUS_FILENAME = 'status.json'
+RESULT_FILENAME = 'result.json'
+PROFILE_FILENAME = 'profile.pstats'
+PROFILE_ANALYSES = os.environ.get('CHECKERS_PROFILE', '0') == '1'  # Profil cProfile de chaque analyse
+
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def load_element_types(file):
-    element_types = {}
-    df = pd.read_excel(file, sheet_name="Element_Types", engine='openpyxl')
-    for index, row in df.iterrows():
-        ifc_class = row["IFC_Class"]
-        element_types[ifc_class] = ifc_class
-    return element_types
-
-def load_required_psets_and_params(file):
-    required_psets_and_params = {}
-    xls = pd.ExcelFile(file, engine='openpyxl')
-    for sheet_name in xls.sheet_names:
-        if sheet_name != "Element_Types":
-            df = pd.read_excel(file, sheet_name=sheet_name, engine='openpyxl')
-            for index, row in df.iterrows():
-                ifc_class = row["IFC_Class"]
-                param_name = row["Parametre"]
-                param_type = row["Type"]
-                if ifc_class not in required_psets_and_params:
-                    required_psets_and_params[ifc_class] = {}
-                if sheet_name not in required_psets_and_params[ifc_class]:
-                    required_psets_and_params[ifc_class][sheet_name] = {}
-                required_psets_and_params[ifc_class][sheet_name][param_name] = param_type
-    return required_psets_and_params
-
-def str_to_type(param_type_str):
-    param_type_str = param_type_str.lower()
-    if param_type_str.lower() == 'string':
-        return str
-    elif param_type_str.lower() == 'int':
-        return int
-    elif param_type_str.lower() == 'float':
-        return float
-    elif param_type_str == 'number':
-        return float
-    elif param_type_str.lower() == 'bool':
-        return bool
-    else:
-        raise ValueError(f"Unsupported parameter type '{param_type_str}'")
+# Validateurs associés aux types de la colonne "Type" du fichier d'exigences
+PARAM_TYPE_VALIDATORS = {
+    'string': str,
+    'int': int,
+    'float': float,
+    'number': float,
+    'bool': bool,
+}
+
+RULEBOOK_CACHE_DIR = os.path.join(TEMP_FOLDER, '.rulebooks')
+RULEBOOK_CACHE_SIZE = 32  # Règles compilées gardées en mémoire par processus
+RULEBOOK_CACHE_VERSION = 2  # À incrémenter quand Rulebook ou la lecture du classeur change
+
+class Rulebook(NamedTuple):
+    """Fichier d'exigences compilé, immuable et picklable."""
+    digest: str  # Empreinte du contenu compilé (indépendante de la mise en forme du classeur)
+    element_types: frozenset  # Classes IFC à analyser (onglet Element_Types)
+    rules: Dict[str, tuple]  # Classe IFC -> ((PSet, ((paramètre, type, validateur), ...)), ...)
+    required_params: Dict[str, frozenset]  # PSet -> paramètres requis, toutes classes confondues
+    carbon: "CarbonDatabase" = None  # Onglets carbone du classeur, qui surchargent la base par défaut
+
+_rulebook_cache = OrderedDict()
+_rulebook_cache_lock = threading.Lock()
+
+def reject_unsupported_type(value):
+    raise ValueError("Unsupported parameter type")
+
+def type_validator(param_type):
+    if isinstance(param_type, str):
+        return PARAM_TYPE_VALIDATORS.get(param_type.lower(), reject_unsupported_type)
+    return reject_unsupported_type
+
+def parse_requirements(file):
+    """Lit le classeur d'exigences en une seule ouverture et le compile en Rulebook."""
+    import pandas as pd
+    sheets = pd.read_excel(file, sheet_name=None, engine='openpyxl')
+    element_types = frozenset(sheets["Element_Types"]["IFC_Class"].dropna())
+    
+    requirements = {}
+    for sheet_name, df in sheets.items():
+        if sheet_name in ("Element_Types", CARBON_FACTORS_SHEET, CARBON_MAPPING_SHEET):
+            continue
+        for ifc_class, param_name, param_type in zip(df["IFC_Class"], df["Parametre"], df["Type"]):
+            if pd.isna(ifc_class) or pd.isna(param_name):
+                continue
+            requirements.setdefault(ifc_class, {}).setdefault(sheet_name, {})[param_name] = param_type
+    
+    rules = {}
+    required_params = defaultdict(set)
+    for ifc_class, psets in requirements.items():
+        rules[ifc_class] = tuple(
+            (pset_name, tuple((param_name, param_type, type_validator(param_type)) for param_name, param_type in params.items()))
+            for pset_name, params in psets.items()
+        )
+        for pset_name, params in psets.items():
+            required_params[pset_name].update(params)
+    
+    carbon = parse_carbon_sheets(sheets)
+    canonical = [sorted(map(str, element_types)), sorted(
+        [str(ifc_class), [[pset_name, [[str(p), str(t)] for p, t, _ in params]] for pset_name, params in class_rules]]
+        for ifc_class, class_rules in rules.items()
+    )]
+    if carbon is not None:
+        canonical.append(carbon.digest)
+    canonical = json.dumps(canonical, ensure_ascii=False)
+    return Rulebook(
+        digest=hashlib.sha256(canonical.encode('utf-8')).hexdigest(),
+        element_types=element_types,
+        rules=rules,
+        required_params={pset_name: frozenset(params) for pset_name, params in required_params.items()},
+        carbon=carbon,
+    )
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def compile_requirements(file):
+    """Retourne le Rulebook d'un classeur d'exigences, en cache selon le hash de son contenu."""
+    file_digest = file_sha256(file)
+    with _rulebook_cache_lock:
+        if file_digest in _rulebook_cache:
+            _rulebook_cache.move_to_end(file_digest)
+            return _rulebook_cache[file_digest]
+    
+    cache_path = os.path.join(RULEBOOK_CACHE_DIR, f"{file_digest}.v{RULEBOOK_CACHE_VERSION}.pickle")
+    header = (RULEBOOK_CACHE_VERSION, Rulebook._fields)
+    rulebook = None
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_header, cached = pickle.load(f)
+        # Un Rulebook écrit par une autre version du code est recompilé
+        if cached_header == header and isinstance(cached, Rulebook):
+            rulebook = cached
+        else:
+            print(f"Ignoring outdated rulebook cache {cache_path}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Ignoring unreadable rulebook cache {cache_path}: {str(e)}")
+    
+    if rulebook is None:
+        rulebook = parse_requirements(file)
+        try:
+            os.makedirs(RULEBOOK_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((header, rulebook), f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Could not cache rulebook: {str(e)}")
+    
+    with _rulebook_cache_lock:
+        _rulebook_cache[file_digest] = rulebook
+        while len(_rulebook_cache) > RULEBOOK_CACHE_SIZE:
+            _rulebook_cache.popitem(last=False)
+    return rulebook
 
 def gray_empty_cells(worksheet):
     gray_fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
@@ -91,21 +289,241 @@ def gray_empty_cells(worksheet):
             if cell.value is None or cell.value == "":
                 cell.fill = gray_fill
 
-def get_building_storey(ifc_file, element):
-    try:
-        if element is not None:
-            if hasattr(element, 'ContainedInStructure') and element.ContainedInStructure:
-                for rel in element.ContainedInStructure:
-                    if rel.RelatingStructure.is_a("IfcBuildingStorey"):
-                        return rel.RelatingStructure.Name if rel.RelatingStructure.Name else "Sans étage"
-                    elif rel.RelatingStructure.is_a("IfcBuilding") or rel.RelatingStructure.is_a("IfcSite"):
-                        return "Sans étage"
-                    else:
-                        return get_building_storey(ifc_file, rel.RelatingStructure)
-        return "Sans étage"
-    except Exception as e:
-        print(f"Error getting building storey: {str(e)}")
-        return "Sans étage"
+# Chargement du modèle borné en mémoire
+MODEL_LOADING = os.environ.get('CHECKERS_MODEL_LOADING', 'auto')  # auto, full ou lazy
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('CHECKERS_MODEL_MEMORY_MB', 0))  # Mémoire estimée maximale d'un modèle ouvert (0 : illimitée)
+# Mémoire par entité d'un modèle ouvert, mesurée avec ifcopenshell 0.9 (version installée, la seule dont
+# ifcopenshell.open accepte lazy=True) sur les modèles de benchmarks/ ;
+# en chargement paresseux, seules les instances lues (éléments à valider, PSet, étages...) sont décodées
+ENTITY_MEMORY_BYTES = {"full": 450, "lazy": 240}
+STEP_ENTITY_PATTERN = re.compile(rb"#\d+\s*=\s*([A-Za-z][A-Za-z0-9_]*)\s*\(")
+
+class ModelTooLarge(Exception):
+    """Levée quand l'ouverture d'un modèle dépasserait le budget mémoire."""
+
+class ModelScan(NamedTuple):
+    entities: int
+    classes: Counter  # classe en majuscules -> nombre d'instances
+
+class ModelLoading(NamedTuple):
+    mode: str  # "full" ou "lazy"
+    estimated_mb: float
+    max_copies: int  # Copies du modèle ouvertes en même temps dans le budget (analyse + workers de validation)
+
+def scan_model(path, chunk_size=4 * 1024 * 1024):
+    """Compte les entités de chaque classe d'un fichier STEP par lecture en flux, sans l'ouvrir."""
+    counts = Counter()
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            data = tail + chunk
+            # Une instance coupée par la fin du bloc est comptée avec le bloc suivant
+            end = data.rfind(b';') + 1 if chunk else len(data)
+            counts.update(STEP_ENTITY_PATTERN.findall(data, 0, end))
+            if not chunk:
+                break
+            tail = data[end:]
+    classes = Counter()
+    for name, count in counts.items():
+        classes[name.decode('ascii').upper()] += count
+    return ModelScan(entities=sum(classes.values()), classes=classes)
+
+def plan_model_loading(scan):
+    """Choisit le mode d'ouverture d'un modèle d'après sa taille estimée et le budget mémoire.
+    
+    En mode auto, un modèle dont l'ouverture complète dépasserait le budget est ouvert en
+    chargement paresseux ; s'il le dépasse encore, ModelTooLarge est levée.
+    """
+    estimates = {mode: scan.entities * bytes_per_entity / (1024 * 1024) for mode, bytes_per_entity in ENTITY_MEMORY_BYTES.items()}
+    mode = MODEL_LOADING if MODEL_LOADING in estimates else "full"
+    if MODEL_LOADING == 'auto' and MODEL_MEMORY_BUDGET_MB and estimates["full"] > MODEL_MEMORY_BUDGET_MB:
+        mode = "lazy"
+    if not MODEL_MEMORY_BUDGET_MB:
+        return ModelLoading(mode, estimates[mode], VALIDATION_WORKERS + 1)
+    if estimates[mode] > MODEL_MEMORY_BUDGET_MB:
+        raise ModelTooLarge(f"Model too large: {scan.entities} entities, about {estimates[mode]:.0f} MB once loaded "
+                            f"(budget {MODEL_MEMORY_BUDGET_MB} MB)")
+    return ModelLoading(mode, estimates[mode], max(1, int(MODEL_MEMORY_BUDGET_MB // max(estimates[mode], 1))))
+
+def open_model(path, mode="full"):
+    import ifcopenshell
+    return ifcopenshell.open(path, lazy=True) if mode == "lazy" else ifcopenshell.open(path)
+
+def model_elements(ifc_file, element_types):
+    """Éléments des classes du Rulebook, lus classe par classe sans instancier les autres produits."""
+    elements = []
+    for ifc_class in element_types:
+        try:
+            instances = ifc_file.by_type(ifc_class, include_subtypes=False)
+        except RuntimeError:
+            # Classe absente du schéma du modèle
+            continue
+        elements += [element for element in instances if element.is_a() == ifc_class and element.is_a('IfcProduct')]
+    elements.sort(key=lambda element: element.id())
+    return elements
+
+def build_storey_index(ifc_file):
+    """Construit en une passe l'index id d'élément -> nom d'étage."""
+    structure_storeys = {}
+    
+    def resolve_structure(structure):
+        # Remonte l'arborescence spatiale (espaces, zones...) jusqu'à l'étage
+        chain = []
+        name = "Sans étage"
+        while structure is not None:
+            if structure.id() in structure_storeys:
+                name = structure_storeys[structure.id()]
+                break
+            if structure.id() in chain:
+                break
+            chain.append(structure.id())
+            if structure.is_a("IfcBuildingStorey"):
+                name = structure.Name if structure.Name else "Sans étage"
+                break
+            if structure.is_a("IfcBuilding") or structure.is_a("IfcSite") or structure.is_a("IfcProject"):
+                break
+            parent = None
+            for rel in getattr(structure, 'Decomposes', None) or ():
+                parent = rel.RelatingObject
+            if parent is None:
+                for rel in getattr(structure, 'ContainedInStructure', None) or ():
+                    parent = rel.RelatingStructure
+            structure = parent
+        for structure_id in chain:
+            structure_storeys[structure_id] = name
+        return name
+    
+    storey_index = {}
+    for rel in ifc_file.by_type('IfcRelContainedInSpatialStructure'):
+        try:
+            name = resolve_structure(rel.RelatingStructure)
+        except Exception as e:
+            print(f"Error getting building storey: {str(e)}")
+            name = "Sans étage"
+        for element in rel.RelatedElements:
+            storey_index.setdefault(element.id(), name)
+    
+    # Les sous-éléments (volées d'escalier, parties de murs...) héritent de l'étage de leur assemblage
+    parents = {}
+    for rel in ifc_file.by_type('IfcRelAggregates'):
+        for child in rel.RelatedObjects:
+            parents[child.id()] = rel.RelatingObject.id()
+    for child_id in parents:
+        if child_id in storey_index:
+            continue
+        chain = []
+        current = child_id
+        while current not in storey_index and current in parents and current not in chain:
+            chain.append(current)
+            current = parents[current]
+        name = storey_index.get(current)
+        if name is not None:
+            for element_id in chain:
+                storey_index[element_id] = name
+    
+    return storey_index
+
+# Attributs lus par position (comme ifcopenshell.util.element.get_properties) : l'accès par nom
+# passe par entity_instance.__getattr__, qui domine sinon le temps d'indexation
+def _property_value(prop):
+    ifc_class = prop.is_a()
+    if ifc_class == 'IfcPropertySingleValue':
+        value = prop[2]  # NominalValue
+        return value.wrappedValue if value else None
+    if ifc_class == 'IfcPropertyEnumeratedValue':
+        values = prop[2]  # EnumerationValues
+        return [v.wrappedValue for v in values] if values else None
+    if prop.is_a('IfcPhysicalSimpleQuantity'):
+        return prop[3]
+    # Propriétés plus rares (listes, bornes, tables...) : on délègue à ifcopenshell
+    import ifcopenshell.util.element
+    return ifcopenshell.util.element.get_properties([prop]).get(prop[0])
+
+def _property_definitions(definition):
+    # IFC4 : RelatingPropertyDefinition peut être un IfcPropertySetDefinitionSet
+    if isinstance(definition, (list, tuple)):
+        return definition
+    return (definition,)
+
+def _element_quantity(definition):
+    """Premier volume, ou à défaut première surface rencontrée, d'un IfcElementQuantity."""
+    for q in definition[5] or ():  # Quantities
+        ifc_class = q.is_a()
+        if ifc_class == 'IfcQuantityVolume' or ifc_class == 'IfcQuantityArea':
+            return float(q[3])
+    return None
+
+def build_property_index(ifc_file, rulebook):
+    """Indexe en une passe les PSet requis et les quantités de chaque élément.
+    
+    Retourne (property_index, quantity_index) :
+    - property_index : id d'élément -> {PSet: {paramètre: valeur}}, limité aux PSet et
+      paramètres du Rulebook (mêmes valeurs que get_psets)
+    - quantity_index : id d'élément -> volume ou surface issu de ses IfcElementQuantity
+    Seuls les éléments des classes du Rulebook sont indexés : en chargement paresseux, les
+    PSet des autres produits ne sont jamais décodés.
+    """
+    required_params = rulebook.required_params
+    
+    # Ids des éléments à indexer, pour écarter une relation avant de lire ses définitions
+    element_ids = set()
+    for ifc_class in rulebook.element_types:
+        try:
+            element_ids.update(element.id() for element in ifc_file.by_type(ifc_class, include_subtypes=False))
+        except RuntimeError:
+            # Classe absente du schéma du modèle
+            continue
+    
+    def related_ids(rel):
+        return [element.id() for element in rel[4] if element.id() in element_ids]  # RelatedObjects
+    
+    def extract(definition, is_quantity_set):
+        params = required_params[definition[2]]
+        props = definition[5] if is_quantity_set else definition[4]  # Quantities / HasProperties
+        return {prop[0]: _property_value(prop) for prop in props or () if prop[0] in params}  # Name
+    
+    def merge(index, element_id, psets):
+        element_psets = index.setdefault(element_id, {})
+        for pset_name, values in psets.items():
+            element_psets.setdefault(pset_name, {}).update(values)
+    
+    # PSet hérités des types, surchargés ensuite par ceux des occurrences
+    property_index = {}
+    for rel in ifc_file.by_type('IfcRelDefinesByType'):
+        related = related_ids(rel)
+        relating_type = rel[5]  # RelatingType
+        if not related or relating_type is None:
+            continue
+        type_psets = {}
+        for definition in relating_type[5] or ():  # HasPropertySets
+            ifc_class = definition.is_a()
+            if definition[2] in required_params and ifc_class in ('IfcPropertySet', 'IfcElementQuantity'):
+                type_psets[definition[2]] = extract(definition, ifc_class == 'IfcElementQuantity')
+        if type_psets:
+            for element_id in related:
+                merge(property_index, element_id, type_psets)
+    
+    quantity_index = {}
+    for rel in ifc_file.by_type('IfcRelDefinesByProperties'):
+        related = related_ids(rel)
+        if not related:
+            continue
+        for definition in _property_definitions(rel[5]):  # RelatingPropertyDefinition
+            ifc_class = definition.is_a()
+            is_quantity_set = ifc_class == 'IfcElementQuantity'
+            quantity = _element_quantity(definition) if is_quantity_set else None
+            required = (is_quantity_set or ifc_class == 'IfcPropertySet') and definition[2] in required_params
+            if quantity is None and not required:
+                continue
+            psets = {definition[2]: extract(definition, is_quantity_set)} if required else None
+            for element_id in related:
+                if quantity is not None:
+                    quantity_index[element_id] = quantity
+                if psets:
+                    merge(property_index, element_id, psets)
+    
+    return property_index, quantity_index
 
 def sort_floor_name(floor_name):
     if floor_name == "Sans étage":
@@ -127,61 +545,108 @@ def sort_floor_name(floor_name):
     else:
         return f"DDD_{floor_name}"
 
-def create_summary_sheet(workbook, total_elements, valid_elements, missing_elements, missing_psets, missing_params, floor_stats, elements_by_class, required_psets_and_params):
+# Styles nommés partagés par toutes les feuilles du rapport
+_thin_border = dict(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+_center = dict(horizontal='center', vertical='center')
+_left = dict(horizontal='left', vertical='center')
+_right = dict(horizontal='right', vertical='center')
+_fills = {
+    "title": "2F75B5",
+    "header": "BDD7EE",
+    "ok": "C6EFCE",
+    "ko": "FFC7CE",
+    "total": "E2EFDA",
+}
+
+REPORT_STYLES = {
+    # Résumé
+    "title": dict(font=dict(size=14, bold=True, color="FFFFFF"), fill="title", alignment=_center, border=True),
+    "section": dict(font=dict(size=12, bold=True), fill="header"),
+    "header": dict(font=dict(size=12, bold=True), fill="header", alignment=_center, border=True),
+    "label": dict(font=dict(size=11), alignment=_left, border=True),
+    "value": dict(font=dict(size=11), alignment=_center, border=True),
+    "rate": dict(font=dict(size=11), alignment=_center, border=True, number_format='0.0%'),
+    "rate_ok": dict(font=dict(size=11), fill="ok", alignment=_center, border=True, number_format='0.0%'),
+    "rate_ko": dict(font=dict(size=11), fill="ko", alignment=_center, border=True, number_format='0.0%'),
+    # Détails
+    "cell_left": dict(font=dict(size=11), alignment=_left, border=True),
+    "cell_center": dict(font=dict(size=11), alignment=_center, border=True),
+    "status_ok": dict(font=dict(size=11), fill="ok", alignment=_center, border=True),
+    "status_ko": dict(font=dict(size=11), fill="ko", alignment=_center, border=True),
+    # Empreinte carbone
+    "carbon_title": dict(font=dict(size=14, bold=True, color="FFFFFF"), fill="title", alignment=_center),
+    "carbon_header": dict(font=dict(size=12, bold=True), fill="header", alignment=dict(_center, wrap_text=True), border=True),
+    "carbon_subheader": dict(font=dict(size=12, bold=True), fill="header", alignment=_center, border=True),
+    "carbon_left": dict(font=dict(size=11), alignment=_left, border=True),
+    "carbon_right": dict(font=dict(size=11), alignment=_right, border=True),
+    "carbon_wrap_left": dict(font=dict(size=11), alignment=dict(_left, wrap_text=True), border=True),
+    "carbon_wrap_right": dict(font=dict(size=11), alignment=dict(_right, wrap_text=True), border=True),
+    "carbon_total": dict(font=dict(size=12, bold=True), fill="total", alignment=_right, border=True),
+}
+
+def register_report_styles(workbook):
+    """Déclare les styles nommés du rapport dans un classeur."""
+    for name, spec in REPORT_STYLES.items():
+        style = NamedStyle(name=name)
+        style.font = Font(**spec["font"])
+        if "fill" in spec:
+            color = _fills[spec["fill"]]
+            style.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        if "alignment" in spec:
+            style.alignment = Alignment(**spec["alignment"])
+        if spec.get("border"):
+            style.border = Border(**_thin_border)
+        if "number_format" in spec:
+            style.number_format = spec["number_format"]
+        workbook.add_named_style(style)
+
+def styled_cell(worksheet, value, style=None):
+    cell = WriteOnlyCell(worksheet, value=value)
+    if style:
+        cell.style = style
+    return cell
+
+def column_widths(rows):
+    """Largeur de chaque colonne d'après la plus longue valeur (lignes de (valeur, style))."""
+    widths = {}
+    for row in rows:
+        for col, (value, _) in enumerate(row, 1):
+            if value is not None:
+                widths[col] = max(widths.get(col, 0), len(str(value)))
+    return widths
+
+def set_column_widths(worksheet, widths):
+    for col, width in widths.items():
+        worksheet.column_dimensions[get_column_letter(col)].width = width + 2
+
+def write_styled_rows(worksheet, rows):
+    """Écrit des lignes [(valeur, style), ...] dans une feuille en écriture seule.
+    
+    Les dimensions et volets doivent être définis avant l'appel : ils sont écrits avec la première ligne.
+    """
+    for row in rows:
+        worksheet.append([styled_cell(worksheet, value, style) for value, style in row])
+
+def rate_style(valid_rate):
+    if valid_rate >= 0.8:
+        return "rate_ok"
+    elif valid_rate < 0.5:
+        return "rate_ko"
+    return "rate"
+
+def create_summary_sheet(workbook, total_elements, valid_elements, missing_elements, missing_psets, missing_params, floor_stats, elements_by_class, requirements):
     # Créer l'onglet de résumé
     summary = workbook.create_sheet("Résumé", 0)
     
-    # Styles
-    title_font = Font(size=14, bold=True, color="FFFFFF")
-    header_font = Font(size=12, bold=True)
-    normal_font = Font(size=11)
-    
-    title_fill = PatternFill(start_color="2F75B5", end_color="2F75B5", fill_type="solid")
-    header_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")
-    ok_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    ko_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    
-    center_alignment = Alignment(horizontal='center', vertical='center')
-    left_alignment = Alignment(horizontal='left', vertical='center')
-    
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    percent_format = '0.0%'
-    
-    def apply_style_to_range(start_cell, end_cell, font=None, fill=None, alignment=None, border=None, value=None, number_format=None):
-        start_col = ord(start_cell[0].upper()) - ord('A') + 1
-        end_col = ord(end_cell[0].upper()) - ord('A') + 1
-        start_row = int(start_cell[1:])
-        end_row = int(end_cell[1:])
-        
-        for row in range(start_row, end_row + 1):
-            for col in range(start_col, end_col + 1):
-                cell = summary.cell(row=row, column=col)
-                if font:
-                    cell.font = font
-                if fill:
-                    cell.fill = fill
-                if alignment:
-                    cell.alignment = alignment
-                if border:
-                    cell.border = border
-                if number_format:
-                    cell.number_format = number_format
-                if value and col == start_col and row == start_row:
-                    cell.value = value
-    
     # Titre principal
-    apply_style_to_range('A1', 'E1', font=title_font, fill=title_fill, alignment=center_alignment, border=border, value="Rapport de validation IFC")
-    summary.merge_cells('A1:E1')
+    rows = [
+        [("Rapport de validation IFC", "title")] + [(None, "title")] * 4,
+        [],
+        [("Statistiques globales", "section")],
+    ]
+    summary.merged_cells.add('A1:E1')
     
     # Statistiques globales
-    apply_style_to_range('A3', 'A3', font=header_font, fill=header_fill, value="Statistiques globales")
-    
     stats = [
         ("Total d'éléments", total_elements),
         ("Éléments valides", valid_elements, valid_elements/total_elements if total_elements > 0 else 0),
@@ -189,126 +654,62 @@ def create_summary_sheet(workbook, total_elements, valid_elements, missing_eleme
         ("PSet manquants", missing_psets),
         ("Paramètres manquants", missing_params)
     ]
-    
-    for i, stat in enumerate(stats, 4):
-        label = stat[0]
-        value = stat[1]
-        percent = stat[2] if len(stat) > 2 else None
-        
-        apply_style_to_range(f'A{i}', f'A{i}', font=normal_font, alignment=left_alignment, border=border, value=label)
-        apply_style_to_range(f'B{i}', f'B{i}', font=normal_font, alignment=center_alignment, border=border, value=value)
-        if percent is not None:
-            apply_style_to_range(f'C{i}', f'C{i}', font=normal_font, alignment=center_alignment, border=border, value=percent, number_format=percent_format)
+    for stat in stats:
+        row = [(stat[0], "label"), (stat[1], "value")]
+        if len(stat) > 2:
+            row.append((stat[2], "rate"))
+        rows.append(row)
     
     # Statistiques par étage
-    apply_style_to_range('A7', 'A7', font=header_font, fill=header_fill, value="Répartition par étage")
+    rows.append([])
+    rows.append([("Répartition par étage", "section")])
+    rows.append([(header, "header") for header in ["Étage", "Total", "Valides", "Invalides", "Taux de validité"]])
     
-    headers = ["Étage", "Total", "Valides", "Invalides", "Taux de validité"]
-    for col, header in enumerate(headers, 1):
-        apply_style_to_range(f'{chr(ord("A")+col-1)}8', f'{chr(ord("A")+col-1)}8', 
-                           font=header_font, fill=header_fill, alignment=center_alignment, border=border, value=header)
-    
-    row = 9
     sorted_floors = sorted(floor_stats.items(), key=lambda x: sort_floor_name(x[0]))
     for floor, stats in sorted_floors:
         total = stats["valid"] + stats["invalid"]
         valid_rate = stats["valid"] / total if total > 0 else 0
-        
-        cells = [
-            (floor, left_alignment),
-            (total, center_alignment),
-            (stats["valid"], center_alignment),
-            (stats["invalid"], center_alignment),
-            (valid_rate, center_alignment)
-        ]
-        
-        for col, (value, alignment) in enumerate(cells, 1):
-            cell_ref = f'{chr(ord("A")+col-1)}{row}'
-            fill = None
-            number_format = None
-            
-            if col == 5:  # Dernière colonne (taux)
-                number_format = percent_format
-                if valid_rate >= 0.8:
-                    fill = ok_fill
-                elif valid_rate < 0.5:
-                    fill = ko_fill
-            
-            apply_style_to_range(cell_ref, cell_ref, 
-                               font=normal_font, 
-                               alignment=alignment, 
-                               border=border, 
-                               fill=fill, 
-                               value=value,
-                               number_format=number_format)
-        
-        row += 1
+        rows.append([
+            (floor, "label"),
+            (total, "value"),
+            (stats["valid"], "value"),
+            (stats["invalid"], "value"),
+            (valid_rate, rate_style(valid_rate))
+        ])
     
     # Statistiques par type
-    type_title_row = row + 2
-    apply_style_to_range(f'A{type_title_row}', f'A{type_title_row}', font=header_font, fill=header_fill, value="Répartition par type")
-    
-    headers = ["Type", "Total", "Valides", "Invalides", "Taux de validité"]
-    header_row = type_title_row + 1
-    for col, header in enumerate(headers, 1):
-        apply_style_to_range(f'{chr(ord("A")+col-1)}{header_row}', f'{chr(ord("A")+col-1)}{header_row}',
-                           font=header_font, fill=header_fill, alignment=center_alignment, border=border, value=header)
+    rows.append([])
+    rows.append([])
+    rows.append([("Répartition par type", "section")])
+    rows.append([(header, "header") for header in ["Type", "Total", "Valides", "Invalides", "Taux de validité"]])
     
-    row = header_row + 1
     sorted_types = sorted(elements_by_class.items())
     for element_type, stats in sorted_types:
         total = stats["total"]
         valid_rate = stats["valid"] / total if total > 0 else 0
-        
-        cells = [
-            (element_type, left_alignment),
-            (total, center_alignment),
-            (stats["valid"], center_alignment),
-            (stats["invalid"], center_alignment),
-            (valid_rate, center_alignment)
-        ]
-        
-        for col, (value, alignment) in enumerate(cells, 1):
-            cell_ref = f'{chr(ord("A")+col-1)}{row}'
-            fill = None
-            number_format = None
-            
-            if col == 5:  # Dernière colonne (taux)
-                number_format = percent_format
-                if valid_rate >= 0.8:
-                    fill = ok_fill
-                elif valid_rate < 0.5:
-                    fill = ko_fill
-            
-            apply_style_to_range(cell_ref, cell_ref,
-                               font=normal_font,
-                               alignment=alignment,
-                               border=border,
-                               fill=fill,
-                               value=value,
-                               number_format=number_format)
-        
-        row += 1
-    
-    # Ajuster la largeur des colonnes
-    for col in range(1, 6):
-        letter = get_column_letter(col)
-        max_length = 0
-        for cell in summary[letter]:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        summary.column_dimensions[letter].width = adjusted_width
-    
-    # Figer les volets
+        rows.append([
+            (element_type, "label"),
+            (total, "value"),
+            (stats["valid"], "value"),
+            (stats["invalid"], "value"),
+            (valid_rate, rate_style(valid_rate))
+        ])
+    
+    # Ajuster la largeur des colonnes et figer les volets avant l'écriture
+    set_column_widths(summary, column_widths(rows))
     summary.freeze_panes = 'A2'
+    write_styled_rows(summary, rows)
     
     # Activer l'onglet de résumé
     workbook.active = workbook.worksheets.index(summary)
 
+def create_results_summary_sheet(workbook, results):
+    """Onglet de résumé à partir des données du dashboard (analyse ou cumul d'une analyse fédérée)."""
+    floor_stats = {floor["name"]: floor for floor in results["floors"]}
+    elements_by_class = {element_type["name"]: element_type for element_type in results["types"]}
+    create_summary_sheet(workbook, results["total_elements"], results["valid_elements"], results["missing_elements"],
+                         results["missing_psets"], results["missing_params"], floor_stats, elements_by_class, None)
+
 # Mapping des éléments IFC vers les matériaux
 IFC_TO_MATERIAL_MAPPING = {
     'IfcWall': 'Béton',
@@ -359,106 +760,351 @@ MATERIAL_CARBON_FACTORS = {
     }
 }
 
-def calculate_carbon_footprint(ifc_file, element):
-    """Calcule l'empreinte carbone d'un élément IFC."""
-    try:
-        # Obtenir le type de matériau
-        material = IFC_TO_MATERIAL_MAPPING.get(element.is_a(), 'Non spécifié')
-        if material == 'Non spécifié':
-            return 0
-        
-        # Obtenir le facteur d'émission
-        material_data = MATERIAL_CARBON_FACTORS.get(material)
-        if not material_data:
-            return 0
-        
-        emission_factor = material_data['factor']
-        
-        # Calculer le volume ou la surface
-        quantity = 0
-        
-        # Essayer d'abord d'obtenir les quantités via les propriétés
-        if hasattr(element, 'IsDefinedBy'):
-            for rel in element.IsDefinedBy:
-                if rel.is_a('IfcRelDefinesByProperties'):
-                    if rel.RelatingPropertyDefinition.is_a('IfcElementQuantity'):
-                        for q in rel.RelatingPropertyDefinition.Quantities:
-                            if q.is_a('IfcQuantityVolume'):
-                                quantity = float(q.VolumeValue)
-                                print(f"Volume found in properties for {element.is_a()}: {quantity:.2f} m³")
-                                break
-                            elif q.is_a('IfcQuantityArea'):
-                                quantity = float(q.AreaValue)
-                                print(f"Area found in properties for {element.is_a()}: {quantity:.2f} m²")
-                                break
-        
-        # Si aucune quantité n'est trouvée, essayer de calculer à partir de la géométrie
-        if quantity == 0:
-            if hasattr(element, 'Representation'):
-                try:
-                    settings = ifcopenshell.geom.settings()
-                    settings.set(settings.USE_PYTHON_OPENCASCADE, True)
-                    shape = ifcopenshell.geom.create_shape(settings, element)
-                    
-                    if material in ['Verre', 'Isolation']:  # Pour les matériaux en surface
-                        quantity = shape.surface_area
-                        print(f"Surface area calculated for {element.is_a()}: {quantity:.2f} m²")
-                        emission_factor = emission_factor / 10  # Convertir le facteur pour la surface
-                    else:  # Pour les matériaux volumiques
-                        quantity = shape.volume
-                        print(f"Volume calculated for {element.is_a()}: {quantity:.2f} m³")
-                except:
-                    # Si le calcul géométrique échoue, estimer à partir des dimensions
-                    if hasattr(element, 'OverallHeight') and hasattr(element, 'OverallWidth'):
-                        if material in ['Verre', 'Isolation']:
-                            quantity = float(element.OverallHeight) * float(element.OverallWidth)
-                        else:
-                            depth = 0.3  # Profondeur par défaut en mètres
-                            if hasattr(element, 'OverallDepth'):
-                                depth = float(element.OverallDepth)
-                            quantity = float(element.OverallHeight) * float(element.OverallWidth) * depth
-                        print(f"Quantity estimated from dimensions for {element.is_a()}: {quantity:.2f}")
-                    else:
-                        # Valeur par défaut si aucune autre méthode ne fonctionne
-                        quantity = 1.0
-                        print(f"Using default quantity for {element.is_a()}: {quantity:.2f}")
-        
-        # Calculer l'empreinte carbone
-        carbon_footprint = quantity * emission_factor
-        print(f"Carbon footprint for {element.is_a()}: {carbon_footprint:.2f} kg CO2e (Quantity: {quantity:.2f}, Factor: {emission_factor})")
+SURFACE_MATERIALS = {'Verre', 'Isolation'}  # Matériaux comptés en surface (m²) plutôt qu'en volume
+
+# Base de facteurs carbone : tables intégrées ci-dessus, surchargées par un fichier local puis
+# par les onglets optionnels du fichier d'exigences
+CARBON_DATABASE_PATH = os.environ.get('CHECKERS_CARBON_DATABASE')  # Classeur (.xlsx) ou facteurs seuls (.csv)
+CARBON_FACTORS_SHEET = 'Facteurs_Carbone'  # Materiau, Facteur, Unite (m3 ou m2), Description, Source, Details
+CARBON_MAPPING_SHEET = 'Materiaux_IFC'  # IFC_Class, PredefinedType, Materiau_IFC, Materiau
+UNSPECIFIED_MATERIAL = 'Non spécifié'
+
+class CarbonMaterial(NamedTuple):
+    name: str
+    factor: float  # kg CO2e par unité
+    unit: str  # "m3" ou "m2"
+    surface: bool  # Quantité comptée en surface plutôt qu'en volume
+    geometry_factor: float  # Facteur appliqué à la quantité issue de la géométrie
+    description: str = ''
+    source: str = ''
+    details: str = ''
+
+def carbon_material(name, factor, unit="m3", surface=None, description='', source='', details=''):
+    surface = unit == "m2" if surface is None else surface
+    # Facteur volumique d'un matériau compté en surface : converti pour 10 cm d'épaisseur
+    geometry_factor = factor / 10 if surface and unit == "m3" else factor
+    return CarbonMaterial(name, factor, unit, surface, geometry_factor, description, source, details)
+
+class CarbonDatabase(NamedTuple):
+    """Base de facteurs carbone compilée, immuable et picklable."""
+    digest: str
+    materials: Dict[str, CarbonMaterial]  # Nom -> matériau
+    by_name: Dict[str, str]  # Nom de matériau IFC en minuscules -> nom dans la base
+    by_class: Dict[tuple, str]  # (classe IFC, type prédéfini ou None) -> nom dans la base
+
+def carbon_database(materials, by_name=None, by_class=None):
+    # Les noms de la base sont reconnus tels quels (sans casse) dans les matériaux IFC
+    by_name = {**{name.casefold(): name for name in materials}, **(by_name or {})}
+    by_class = dict(by_class or {})
+    canonical = json.dumps([[list(material) for material in materials.values()], sorted(by_name.items()),
+                            sorted([ifc_class, predefined or '', name] for (ifc_class, predefined), name in by_class.items())],
+                           ensure_ascii=False)
+    return CarbonDatabase(hashlib.sha256(canonical.encode('utf-8')).hexdigest(), dict(materials), by_name, by_class)
+
+def merge_carbon_databases(base, override):
+    """Base dont les matériaux et correspondances sont surchargés par ceux d'une autre."""
+    return carbon_database({**base.materials, **override.materials}, {**base.by_name, **override.by_name},
+                           {**base.by_class, **override.by_class})
+
+BUILTIN_CARBON_DATABASE = carbon_database(
+    {name: carbon_material(name, data['factor'], surface=name in SURFACE_MATERIALS, description=data['description'],
+                           source=data['source'], details=data['details'])
+     for name, data in MATERIAL_CARBON_FACTORS.items()},
+    by_class={(ifc_class, None): material for ifc_class, material in IFC_TO_MATERIAL_MAPPING.items()},
+)
+
+def _cell_text(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    return str(value).strip()
+
+def parse_carbon_sheets(sheets):
+    """Compile les onglets de facteurs carbone et de correspondances d'un classeur.
+    
+    Retourne une CarbonDatabase à fusionner avec la base courante, ou None sans ces onglets.
+    """
+    factors = sheets.get(CARBON_FACTORS_SHEET)
+    mapping = sheets.get(CARBON_MAPPING_SHEET)
+    if factors is None and mapping is None:
+        return None
+    
+    materials = {}
+    for row in factors.to_dict('records') if factors is not None else ():
+        name = _cell_text(row.get("Materiau"))
+        if not name:
+            continue
+        try:
+            factor = float(row.get("Facteur"))
+        except (TypeError, ValueError):
+            factor = float('nan')
+        if np.isnan(factor):
+            raise ValueError(f"Invalid carbon factor for material {name}")
+        unit = _cell_text(row.get("Unite")).lower().replace('³', '3').replace('²', '2') or "m3"
+        if unit not in ("m3", "m2"):
+            raise ValueError(f"Invalid carbon factor unit for material {name}: {unit}")
+        materials[name] = carbon_material(name, int(factor) if factor.is_integer() else factor, unit,
+                                          description=_cell_text(row.get("Description")),
+                                          source=_cell_text(row.get("Source")), details=_cell_text(row.get("Details")))
+    
+    by_name = {}
+    by_class = {}
+    for row in mapping.to_dict('records') if mapping is not None else ():
+        material = _cell_text(row.get("Materiau"))
+        if not material:
+            continue
+        if _cell_text(row.get("Materiau_IFC")):
+            by_name[_cell_text(row.get("Materiau_IFC")).casefold()] = material
+        if _cell_text(row.get("IFC_Class")):
+            by_class[(_cell_text(row.get("IFC_Class")), _cell_text(row.get("PredefinedType")) or None)] = material
+    return carbon_database(materials, by_name, by_class)
+
+def load_carbon_database(path):
+    """Lit une base de facteurs locale : classeur avec les onglets carbone, ou CSV des facteurs seuls."""
+    import pandas as pd
+    if path.lower().endswith('.csv'):
+        sheets = {CARBON_FACTORS_SHEET: pd.read_csv(path, sep=None, engine='python')}
+    else:
+        sheets = pd.read_excel(path, sheet_name=None, engine='openpyxl')
+    database = parse_carbon_sheets(sheets)
+    if database is None:
+        raise ValueError(f"No {CARBON_FACTORS_SHEET} or {CARBON_MAPPING_SHEET} sheet in {path}")
+    return database
+
+@functools.lru_cache(maxsize=None)
+def default_carbon_database():
+    if not CARBON_DATABASE_PATH:
+        return BUILTIN_CARBON_DATABASE
+    database = merge_carbon_databases(BUILTIN_CARBON_DATABASE, load_carbon_database(CARBON_DATABASE_PATH))
+    print(f"Carbon database {CARBON_DATABASE_PATH}: {len(database.materials)} materials")
+    return database
+
+def analysis_carbon_database(rulebook):
+    """Base de facteurs d'une analyse : base par défaut surchargée par les onglets du fichier d'exigences."""
+    if rulebook.carbon is None:
+        return default_carbon_database()
+    return merge_carbon_databases(default_carbon_database(), rulebook.carbon)
+
+def material_components(definition):
+    """[(IfcMaterial ou None, fraction)] d'une association de matériau.
+    
+    Les couches sont pondérées par leur épaisseur, les constituants par leur fraction, les
+    profils et listes à parts égales.
+    """
+    if definition.is_a('IfcMaterial'):
+        return [(definition, 1.0)]
+    if definition.is_a('IfcMaterialLayerSetUsage'):
+        definition = definition.ForLayerSet
+    elif definition.is_a('IfcMaterialProfileSetUsage'):
+        definition = definition.ForProfileSet
+    if definition.is_a('IfcMaterialLayerSet'):
+        parts = [(layer.Material, float(layer.LayerThickness or 0)) for layer in definition.MaterialLayers]
+    elif definition.is_a('IfcMaterialConstituentSet'):
+        parts = [(constituent.Material, float(constituent.Fraction or 0)) for constituent in definition.MaterialConstituents or ()]
+    elif definition.is_a('IfcMaterialProfileSet'):
+        parts = [(profile.Material, 1.0) for profile in definition.MaterialProfiles]
+    elif definition.is_a('IfcMaterialList'):
+        parts = [(material, 1.0) for material in definition.Materials]
+    else:
+        return []
+    total = sum(weight for _, weight in parts)
+    return [(material, weight / total if total else 1 / len(parts)) for material, weight in parts]
+
+class MaterialResolver:
+    """Matériau de la base carbone de chaque élément.
+    
+    Par ordre de priorité : matériaux associés à l'élément ou à son type
+    (IfcRelAssociatesMaterial), correspondance (classe, type prédéfini), puis classe. Les
+    résolutions sont mémoïsées par association de matériau et par (classe, type prédéfini).
+    """
+    def __init__(self, ifc_file, database):
+        self.database = database
+        self.associations = {}  # id d'objet -> association de matériau
+        for rel in ifc_file.by_type('IfcRelAssociatesMaterial'):
+            for related in rel.RelatedObjects:
+                self.associations[related.id()] = rel.RelatingMaterial
+        # Types porteurs d'un matériau : leurs occurrences en héritent
+        self.element_types = {}
+        for rel in ifc_file.by_type('IfcRelDefinesByType'):
+            if rel.RelatingType.id() in self.associations:
+                for related in rel.RelatedObjects:
+                    self.element_types[related.id()] = rel.RelatingType.id()
+        self.predefined_classes = {ifc_class for ifc_class, predefined in database.by_class if predefined}
+        self.memo = {}
+    
+    def compose(self, definition):
+        """Matériau d'une association, composite pour plusieurs matériaux ; None si l'un d'eux est inconnu."""
+        fractions = {}
+        for material, fraction in material_components(definition):
+            if material is None:
+                continue  # Couche d'air : épaisseur sans émission
+            name = self.database.by_name.get((material.Name or '').casefold())
+            if name not in self.database.materials:
+                return None
+            fractions[name] = fractions.get(name, 0) + fraction
+        if len(fractions) == 1 and abs(sum(fractions.values()) - 1) < 1e-9:
+            return self.database.materials[next(iter(fractions))]
+        components = [(self.database.materials[name], fraction) for name, fraction in fractions.items()]
+        # Composition pondérée en volume : les facteurs surfaciques ne s'y additionnent pas
+        if not components or any(material.unit != "m3" for material, _ in components):
+            return None
+        label = ' + '.join(f"{material.name} {fraction * 100:.0f} %" for material, fraction in components)
+        return carbon_material(
+            label, sum(material.factor * fraction for material, fraction in components),
+            description=f"Composition : {label}",
+            source=', '.join(dict.fromkeys(material.source for material, _ in components if material.source)),
+        )
+    
+    def __call__(self, element):
+        element_id = element.id()
+        definition = self.associations.get(element_id) or self.associations.get(self.element_types.get(element_id))
+        if definition is not None:
+            key = definition.id()
+            if key not in self.memo:
+                self.memo[key] = self.compose(definition)
+            if self.memo[key] is not None:
+                return self.memo[key]
         
-        return carbon_footprint
-    except Exception as e:
-        print(f"Error calculating carbon footprint for {element.is_a()}: {str(e)}")
-        return 0
+        ifc_class = element.is_a()
+        predefined = None
+        if ifc_class in self.predefined_classes:
+            predefined = getattr(element, 'PredefinedType', None)
+            if predefined == 'USERDEFINED':
+                predefined = getattr(element, 'ObjectType', None) or predefined
+        key = (ifc_class, predefined)
+        if key not in self.memo:
+            name = self.database.by_class.get(key) or self.database.by_class.get((ifc_class, None))
+            self.memo[key] = self.database.materials.get(name)
+        return self.memo[key]
+
+def resolve_materials(ifc_file, elements, database):
+    """id d'élément -> CarbonMaterial (None si aucun facteur ne s'applique)."""
+    resolver = MaterialResolver(ifc_file, database)
+    return {element.id(): resolver(element) for element in elements}
+
+def material_catalogue(database, materials):
+    """Matériaux présentés dans le rapport : ceux des correspondances par classe, puis les autres matériaux résolus."""
+    mapped = set(database.by_class.values())
+    catalogue = [material for name, material in database.materials.items() if name in mapped]
+    catalogue += [material for material in dict.fromkeys(materials.values()) if material is not None and material not in catalogue]
+    return {material.name: {"factor": material.factor, "unit": material.unit, "description": material.description,
+                            "source": material.source, "details": material.details} for material in catalogue}
+
+GEOMETRY_THREADS = int(os.environ.get('CHECKERS_GEOMETRY_THREADS', os.cpu_count() or 1))  # Threads de l'itérateur géométrique
+
+def representation_key(element):
+    """Identité de la géométrie d'un élément.
+    
+    Les éléments qui n'instancient que des représentations types (IfcMappedItem sans mise à
+    l'échelle ni ouvertures) partagent leurs quantités : la clé est alors la liste des
+    représentations sources. Sinon la géométrie est propre à l'élément.
+    """
+    if getattr(element, 'HasOpenings', None):
+        return element.id()
+    sources = []
+    for representation in element.Representation.Representations:
+        for item in representation.Items:
+            if not item.is_a('IfcMappedItem'):
+                return element.id()
+            target = item.MappingTarget
+            if target.is_a() != 'IfcCartesianTransformationOperator3D' or target.Scale not in (None, 1.0):
+                return element.id()
+            sources.append(item.MappingSource.id())
+    return tuple(sources) or element.id()
+
+def compute_geometry_quantities(ifc_file, elements):
+    """Calcule volume et surface des éléments avec l'itérateur géométrique multi-thread.
+    
+    Une seule forme est triangulée par géométrie distincte (voir representation_key).
+    Retourne id d'élément -> (volume, surface) pour les formes obtenues.
+    """
+    keys = {}
+    representatives = {}
+    for element in elements:
+        key = representation_key(element)
+        keys[element.id()] = key
+        representatives.setdefault(key, element)
+    
+    quantities_by_key = {}
+    if representatives:
+        import ifcopenshell.geom
+        import ifcopenshell.util.shape
+        try:
+            settings = ifcopenshell.geom.settings()
+            iterator = ifcopenshell.geom.iterator(settings, ifc_file, GEOMETRY_THREADS, include=list(representatives.values()))
+            if iterator.initialize():
+                while True:
+                    shape = iterator.get()
+                    quantities_by_key[keys[shape.id]] = (ifcopenshell.util.shape.get_volume(shape.geometry),
+                                                         ifcopenshell.util.shape.get_area(shape.geometry))
+                    if not iterator.next():
+                        break
+        except Exception as e:
+            print(f"Geometry iteration failed: {str(e)}")
+    print(f"Geometry computed for {len(quantities_by_key)} distinct shapes ({len(keys)} elements)")
+    return {element_id: quantities_by_key[key] for element_id, key in keys.items() if key in quantities_by_key}
+
+def estimate_quantity(element, material):
+    """Estime la quantité à partir des dimensions hors-tout, 1.0 à défaut."""
+    height = getattr(element, 'OverallHeight', None)
+    width = getattr(element, 'OverallWidth', None)
+    if not height or not width:
+        return 1.0
+    if material.surface:
+        return float(height) * float(width)
+    depth = getattr(element, 'OverallDepth', None) or 0.3  # Profondeur par défaut en mètres
+    return float(height) * float(width) * float(depth)
+
+def compute_carbon_footprints(ifc_file, elements, quantity_index, materials):
+    """Calcule l'empreinte carbone (kg CO2e) de chaque élément.
+    
+    materials : id d'élément -> CarbonMaterial (voir resolve_materials).
+    Les quantités viennent d'abord des IfcElementQuantity (quantity_index, voir
+    build_property_index), puis de la géométrie, puis des dimensions de l'élément.
+    Retourne id d'élément -> empreinte carbone.
+    """
+    carbon_by_element = {}
+    without_quantity = []
+    for element in elements:
+        material = materials.get(element.id())
+        if material is None:
+            continue
+        quantity = quantity_index.get(element.id(), 0)
+        if quantity:
+            carbon_by_element[element.id()] = quantity * material.factor
+        else:
+            without_quantity.append((element, material))
+    from_quantity_sets = len(carbon_by_element)
+    
+    # Géométrie des éléments sans quantités
+    geometry = compute_geometry_quantities(ifc_file, [element for element, _ in without_quantity
+                                                      if getattr(element, 'Representation', None) is not None])
+    estimated = 0
+    for element, material in without_quantity:
+        if element.id() in geometry:
+            volume, area = geometry[element.id()]
+            carbon_by_element[element.id()] = (area if material.surface else volume) * material.geometry_factor
+            continue
+        try:
+            quantity = estimate_quantity(element, material)
+        except (TypeError, ValueError):
+            quantity = 1.0
+        estimated += 1
+        carbon_by_element[element.id()] = quantity * material.factor
+    
+    print(f"Carbon quantities: {from_quantity_sets} from quantity sets, "
+          f"{len(without_quantity) - estimated} from geometry, {estimated} estimated")
+    return carbon_by_element
 
 def create_carbon_footprint_sheet(workbook, carbon_data):
     """Crée un onglet pour l'empreinte carbone dans le rapport Excel."""
-    carbon_sheet = workbook.create_sheet("Empreinte_Carbone")
-    
-    # Styles
-    header_font = Font(bold=True, size=14, color="FFFFFF")
-    subheader_font = Font(bold=True, size=12)
-    normal_font = Font(size=11)
-    
-    header_fill = PatternFill(start_color="2F75B5", end_color="2F75B5", fill_type="solid")
-    subheader_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")
-    total_fill = PatternFill(start_color="E2EFDA", end_color="E2EFDA", fill_type="solid")
+    from openpyxl.chart import BarChart, PieChart, Reference
+    from openpyxl.chart.label import DataLabelList
     
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    carbon_sheet = workbook.create_sheet("Empreinte_Carbone")
     
     # Section 1: Bilan carbone du projet
-    carbon_sheet.merge_cells('A1:F1')
-    cell = carbon_sheet.cell(row=1, column=1)
-    cell.value = "BILAN CARBONE DU PROJET"
-    cell.font = header_font
-    cell.alignment = Alignment(horizontal="center", vertical="center")
-    cell.fill = header_fill
+    rows = [[("BILAN CARBONE DU PROJET", "carbon_title")] + [(None, "carbon_title")] * 5]
+    carbon_sheet.merged_cells.add('A1:F1')
     
     # En-têtes du bilan
     headers = [
@@ -469,90 +1115,57 @@ def create_carbon_footprint_sheet(workbook, carbon_data):
         "Empreinte carbone (kg CO2e)",
         "% du total"
     ]
+    rows.append([(header, "carbon_header") for header in headers])
     
-    # Ajuster la hauteur de la première ligne
+    # Ajuster la hauteur de la première ligne et de la ligne d'en-tête
     carbon_sheet.row_dimensions[1].height = 30
-    
-    for col, header in enumerate(headers, 1):
-        cell = carbon_sheet.cell(row=2, column=col)
-        cell.value = header
-        cell.font = subheader_font
-        cell.fill = subheader_fill
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        # Ajuster la largeur des colonnes
-        carbon_sheet.column_dimensions[get_column_letter(col)].width = 25
-    
-    # Ajuster la hauteur de la ligne d'en-tête
     carbon_sheet.row_dimensions[2].height = 45
     
     # Données du bilan
-    row = 3
-    row_start = row
+    row_start = len(rows) + 1
     total_carbon = carbon_data['total']
     
-    # Trier les éléments par empreinte carbone décroissante
+    # Trier les couples (type, matériau) par empreinte carbone décroissante
     sorted_elements = sorted(
-        carbon_data['by_type'].items(),
-        key=lambda x: x[1],
+        carbon_data['by_type_material'],
+        key=lambda x: x['carbon'],
         reverse=True
     )
     
-    for element_type, carbon_value in sorted_elements:
-        material = carbon_data['material_mapping'].get(element_type, "Non spécifié")
-        material_data = carbon_data['material_factors'].get(material, {'factor': 0})
+    for group in sorted_elements:
+        element_type, material, carbon_value = group['type'], group['material'], group['carbon']
+        material_data = carbon_data['materials'].get(material, {'factor': 0})
         
         # Calculer le volume/surface total pour ce type d'élément
         quantity = carbon_value / material_data['factor'] if material_data['factor'] != 0 else 0
         percentage = (carbon_value/total_carbon*100) if total_carbon != 0 else 0
         
-        cells = [
-            (element_type, "left"),
-            (material, "left"),
-            (f"{quantity:.2f}", "right"),
-            (f"{material_data['factor']}", "right"),
-            (f"{carbon_value:.2f}", "right"),
-            (f"{percentage:.1f}%", "right")
-        ]
-        
-        for col, (value, align) in enumerate(cells, 1):
-            cell = carbon_sheet.cell(row=row, column=col)
-            cell.value = value
-            cell.border = thin_border
-            cell.font = normal_font
-            cell.alignment = Alignment(horizontal=align, vertical="center")
-        row += 1
+        rows.append([
+            (element_type, "carbon_left"),
+            (material, "carbon_left"),
+            (f"{quantity:.2f}", "carbon_right"),
+            (f"{material_data['factor']}", "carbon_right"),
+            (f"{carbon_value:.2f}", "carbon_right"),
+            (f"{percentage:.1f}%", "carbon_right")
+        ])
     
     # Total
-    row_end = row
-    carbon_sheet.merge_cells(f'A{row}:C{row}')
-    cell = carbon_sheet.cell(row=row, column=1)
-    cell.value = "TOTAL"
-    cell.font = Font(bold=True, size=12)
-    cell.alignment = Alignment(horizontal="right", vertical="center")
-    cell.fill = total_fill
-    
-    # Cellules du total
-    for col in range(1, 7):
-        cell = carbon_sheet.cell(row=row, column=col)
-        cell.border = thin_border
-        cell.fill = total_fill
-        if col == 5:
-            cell.value = f"{total_carbon:.2f}"
-        elif col == 6:
-            cell.value = "100%"
-        cell.font = Font(bold=True, size=12)
-        cell.alignment = Alignment(horizontal="right", vertical="center")
+    row_end = len(rows) + 1
+    rows.append([
+        ("TOTAL", "carbon_total"),
+        (None, "carbon_total"),
+        (None, "carbon_total"),
+        (None, "carbon_total"),
+        (f"{total_carbon:.2f}", "carbon_total"),
+        ("100%", "carbon_total")
+    ])
+    carbon_sheet.merged_cells.add(f'A{row_end}:C{row_end}')
     
     # Section 2: Détails des matériaux
-    row += 3
-    carbon_sheet.merge_cells(f'A{row}:F{row}')
-    cell = carbon_sheet.cell(row=row, column=1)
-    cell.value = "DÉTAILS DES MATÉRIAUX ET FACTEURS D'ÉMISSION"
-    cell.font = header_font
-    cell.alignment = Alignment(horizontal="center", vertical="center")
-    cell.fill = header_fill
-    row += 1
+    rows.extend([[], []])
+    section_row = len(rows) + 1
+    rows.append([("DÉTAILS DES MATÉRIAUX ET FACTEURS D'ÉMISSION", "carbon_title")] + [(None, "carbon_title")] * 5)
+    carbon_sheet.merged_cells.add(f'A{section_row}:F{section_row}')
     
     # En-têtes des détails
     material_headers = [
@@ -563,58 +1176,37 @@ def create_carbon_footprint_sheet(workbook, carbon_data):
         "Détails",
         "Impact total (kg CO2e)"
     ]
+    rows.append([(header, "carbon_subheader") for header in material_headers])
     
-    for col, header in enumerate(material_headers, 1):
-        cell = carbon_sheet.cell(row=row, column=col)
-        cell.value = header
-        cell.font = subheader_font
-        cell.fill = subheader_fill
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-    row += 1
-    
-    material_row_start = row
-    
-    # Données des matériaux
-    material_totals = defaultdict(float)
-    for element_type, carbon_value in carbon_data['by_type'].items():
-        material = carbon_data['material_mapping'].get(element_type, "Non spécifié")
-        material_totals[material] += carbon_value
+    material_row_start = len(rows) + 1
     
     # Trier les matériaux par impact total
+    material_totals = carbon_data['by_material']
     sorted_materials = sorted(
         [(mat, data, material_totals.get(mat, 0)) 
-         for mat, data in carbon_data['material_factors'].items()],
+         for mat, data in carbon_data['materials'].items()],
         key=lambda x: x[2],
         reverse=True
     )
     
     for material, material_data, total in sorted_materials:
-        cells = [
-            (material, "left"),
-            (material_data['description'], "left"),
-            (f"{material_data['factor']} kg CO2e/m³", "right"),
-            (material_data['source'], "left"),
-            (material_data['details'], "left"),
-            (f"{total:.2f}", "right")
+        row = [
+            (material, "carbon_wrap_left"),
+            (material_data['description'], "carbon_wrap_left"),
+            (f"{material_data['factor']} kg CO2e/{'m²' if material_data['unit'] == 'm2' else 'm³'}", "carbon_wrap_right"),
+            (material_data['source'], "carbon_wrap_left"),
+            (material_data['details'], "carbon_wrap_left"),
+            (f"{total:.2f}", "carbon_wrap_right")
         ]
-        
-        for col, (value, align) in enumerate(cells, 1):
-            cell = carbon_sheet.cell(row=row, column=col)
-            cell.value = value
-            cell.border = thin_border
-            cell.alignment = Alignment(horizontal=align, vertical="center", wrap_text=True)
-        row += 1
-    
-    material_row_end = row
-    
-    # Ajuster la hauteur des lignes pour le texte wrappé
-    for row_idx in range(material_row_start, material_row_end):
-        max_lines = max(
-            len(str(carbon_sheet.cell(row=row_idx, column=col).value).split('\n'))
-            for col in range(1, len(material_headers) + 1)
-        )
-        carbon_sheet.row_dimensions[row_idx].height = max(15 * max_lines, 30)
+        # Ajuster la hauteur des lignes pour le texte wrappé
+        max_lines = max(len(str(value).split('\n')) for value, _ in row)
+        carbon_sheet.row_dimensions[len(rows) + 1].height = max(15 * max_lines, 30)
+        rows.append(row)
+    
+    material_row_end = len(rows) + 1
+    
+    set_column_widths(carbon_sheet, column_widths(rows))
+    write_styled_rows(carbon_sheet, rows)
     
     # Ajouter les graphiques
     # 1. Graphique à barres pour l'empreinte carbone par type d'élément
@@ -648,7 +1240,6 @@ def create_carbon_footprint_sheet(workbook, carbon_data):
     chart2.set_categories(pie_labels)
     
     # Configuration des étiquettes de données
-    from openpyxl.chart.label import DataLabelList
     chart2.dataLabels = DataLabelList()
     chart2.dataLabels.showPercent = True
     chart2.dataLabels.showVal = False
@@ -659,288 +1250,1845 @@ def create_carbon_footprint_sheet(workbook, carbon_data):
     
     carbon_sheet.add_chart(chart2, "H20")
 
-def process_files(temp_dir: str, ifc_file_path: str, excel_file_path: str, output_file_path: str):
-    start_time = time.time()
-    print(f"Starting analysis...")
-    
-    # Chargement des données
-    element_types = load_element_types(excel_file_path)
-    required_psets_and_params = load_required_psets_and_params(excel_file_path)
-    ifc_file = ifcopenshell.open(ifc_file_path)
-    model_name = os.path.basename(ifc_file_path)
+DETAILS_HEADERS = ["Type", "Étage", "ID", "Nom", "PSet", "Paramètre", "Valeur", "Statut"]
+
+# Verbosité de l'onglet Détails : toutes les lignes, défauts et récapitulatif par élément, ou défauts seuls
+REPORT_VERBOSITIES = ("full", "rollup", "failures")
+REPORT_VERBOSITY = os.environ.get('CHECKERS_REPORT_VERBOSITY', 'full')  # Verbosité par défaut des analyses
+
+def valid_params_text(count):
+    return f"{count} paramètre conforme" if count == 1 else f"{count} paramètres conformes"
+
+class Categories:
+    """Codes entiers des valeurs d'une colonne catégorielle, dans l'ordre de première apparition."""
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+    
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+class ResultTable:
+    """Résultats d'une analyse en colonnes, dont dérivent tous les rapports.
+    
+    Une ligne par élément en mémoire : classe, étage et matériau codés en entiers, statuts et empreinte
+    carbone dans des tableaux compacts. Les lignes de détail arrivent codées (voir encode_rows) :
+    code du couple (PSet, paramètre) dans slots et valeur, écrits sur disque par lots avec l'ID et
+    le nom de leurs éléments. Les statistiques sont des agrégations NumPy (np.bincount) sur ces colonnes.
+    """
+    BATCH_SIZE = 5000  # Lignes de détail par lot écrit sur disque
+    
+    def __init__(self, directory, slots, headers=DETAILS_HEADERS):
+        self.headers = headers
+        self.slots = slots.values
+        self.classes = Categories()
+        self.floors = Categories()
+        self.class_codes = array('i')
+        self.floor_codes = array('i')
+        self.valid = array('b')
+        self.missing_pset = array('b')
+        self.missing_param = array('b')
+        self.carbon = array('d')
+        self.materials = Categories()
+        self.material_codes = array('i')
+        self.row_count = 0
+        self.failure_count = 0  # Lignes KO
+        self.rollup_count = 0  # Éléments ayant au moins une ligne OK (une ligne récapitulative en rollup)
+        self._slots_seen = set()
+        # Largeurs de l'onglet Détails : en écriture seule, openpyxl doit les connaître avant la première ligne
+        self.widths = {col: len(str(header)) for col, header in enumerate(headers, 1)}
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._new_batch()
+    
+    def __len__(self):
+        return len(self.class_codes)
+    
+    def _new_batch(self):
+        self._batch_start = len(self.class_codes)
+        self._batch_ids = []
+        self._batch_names = []
+        self._row_elements = array('i')
+        self._row_codes = array('i')
+        self._row_values = []
+    
+    def _widen(self, col, value):
+        if value is not None:
+            length = len(str(value))
+            if length > self.widths[col]:
+                self.widths[col] = length
+    
+    def append(self, ifc_class, floor, global_id, name, valid, missing_pset, missing_param, carbon, material, row_codes, row_values):
+        index = len(self.class_codes)
+        self.class_codes.append(self.classes.code(ifc_class))
+        self.floor_codes.append(self.floors.code(floor))
+        self.valid.append(bool(valid))
+        self.missing_pset.append(bool(missing_pset))
+        self.missing_param.append(bool(missing_param))
+        self.carbon.append(carbon)
+        self.material_codes.append(self.materials.code(material))
+        self._batch_ids.append(global_id)
+        self._batch_names.append(name)
+        if row_codes:
+            for col, value in enumerate((ifc_class, floor, global_id, name), 1):
+                self._widen(col, value)
+            for value in row_values:
+                self._widen(7, value)
+            # Largeurs des colonnes PSet et Paramètre : une fois par couple rencontré
+            if not self._slots_seen.issuperset(row_codes):
+                for code in set(row_codes) - self._slots_seen:
+                    self._slots_seen.add(code)
+                    pset_name, param_name, status = detail_row(self.slots, code)
+                    for col, cell in ((5, pset_name), (6, param_name), (8, status)):
+                        self._widen(col, cell)
+            self._row_elements.extend([index] * len(row_codes))
+            self._row_codes.extend(row_codes)
+            self._row_values.extend(row_values)
+        self.row_count += len(row_codes)
+        failures = sum(1 for code in row_codes if code < 0)
+        self.failure_count += failures
+        self.rollup_count += failures < len(row_codes)
+        if len(self._row_values) >= self.BATCH_SIZE or len(self._batch_ids) >= self.BATCH_SIZE:
+            self._flush()
+    
+    def _flush(self):
+        if self._batch_ids:
+            batch = (self._batch_start, self._batch_ids, self._batch_names, self._row_elements,
+                     self._row_codes, self._row_values)
+            pickle.dump(batch, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            self._new_batch()
+    
+    def column(self, name):
+        """Colonne par élément sous forme de tableau NumPy (sans copie)."""
+        column = getattr(self, name)
+        return np.frombuffer(column, dtype=column.typecode) if len(column) else np.zeros(0, dtype=column.typecode)
+    
+    CODE_COLUMNS = {"classes": "class_codes", "floors": "floor_codes", "materials": "material_codes"}
+    
+    def group_counts(self, by):
+        """{valeur: {"total", "valid", "invalid"}} pour by='classes' ou by='floors'."""
+        categories = getattr(self, by)
+        codes = self.column(self.CODE_COLUMNS[by])
+        size = len(categories.values)
+        total = np.bincount(codes, minlength=size)
+        valid = np.bincount(codes, weights=self.column('valid'), minlength=size).astype(np.int64)
+        return {value: {"total": int(total[code]), "valid": int(valid[code]), "invalid": int(total[code] - valid[code])}
+                for code, value in enumerate(categories.values)}
+    
+    def carbon_by(self, by):
+        """{valeur: empreinte carbone cumulée} pour by='classes', 'floors' ou 'materials'."""
+        categories = getattr(self, by)
+        codes = self.column(self.CODE_COLUMNS[by])
+        sums = np.bincount(codes, weights=self.column('carbon'), minlength=len(categories.values))
+        return {value: float(sums[code]) for code, value in enumerate(categories.values)}
+    
+    def carbon_by_class_material(self):
+        """[{"type", "material", "carbon"}] des couples (classe, matériau) présents."""
+        materials = len(self.materials.values)
+        size = len(self.classes.values) * materials
+        pairs = self.column('class_codes').astype(np.int64) * materials + self.column('material_codes')
+        counts = np.bincount(pairs, minlength=size)
+        sums = np.bincount(pairs, weights=self.column('carbon'), minlength=size)
+        return [{"type": ifc_class, "material": material, "carbon": float(sums[c * materials + m])}
+                for c, ifc_class in enumerate(self.classes.values)
+                for m, material in enumerate(self.materials.values) if counts[c * materials + m]]
+    
+    def totals(self):
+        valid = self.column('valid').astype(bool)
+        total = len(valid)
+        valid_count = int(valid.sum())
+        return {
+            "total_elements": total,
+            "valid_elements": valid_count,
+            "missing_elements": total - valid_count,
+            "missing_psets": int(np.count_nonzero(self.column('missing_pset') & ~valid)),
+            "missing_params": int(np.count_nonzero(self.column('missing_param') & ~valid)),
+            "carbon": float(self.column('carbon').sum()),
+        }
     
-    # Préfiltrage des éléments
-    print(f"Loading elements... ({time.time() - start_time:.2f}s)")
-    elements_by_class = {}
-    missing_psets = 0
-    missing_params = 0
+    def detail_row_count(self, verbosity="full"):
+        """Nombre de lignes de l'onglet Détails produites par rows(verbosity)."""
+        if verbosity == "failures":
+            return self.failure_count
+        if verbosity == "rollup":
+            return self.failure_count + self.rollup_count
+        return self.row_count
     
-    # Statistiques par étage
-    floor_stats = defaultdict(lambda: {"valid": 0, "invalid": 0})
+    def dashboard(self, verbosity="full"):
+        """Données du dashboard (totaux, étages, types, empreinte carbone) des éléments ajoutés jusqu'ici.
+        
+        detail_rows compte les lignes de l'onglet Détails pour la verbosité du rapport (report).
+        """
+        totals = self.totals()
+        floor_stats = self.group_counts('floors')
+        return {
+            "total_elements": totals["total_elements"],
+            "valid_elements": totals["valid_elements"],
+            "missing_elements": totals["missing_elements"],
+            "missing_psets": totals["missing_psets"],
+            "missing_params": totals["missing_params"],
+            "detail_rows": self.detail_row_count(verbosity),
+            "report": verbosity,
+            "floors": [{"name": floor, "valid": stats["valid"], "invalid": stats["invalid"]}
+                       for floor, stats in sorted(floor_stats.items(), key=lambda x: sort_floor_name(x[0]))],
+            "types": [dict(stats, name=element_type) for element_type, stats in sorted(self.group_counts('classes').items())],
+            "carbon_footprint": {
+                "total": totals["carbon"],
+                "by_type": self.carbon_by('classes'),
+                "by_floor": self.carbon_by('floors'),
+                "by_material": self.carbon_by('materials'),
+                "by_type_material": self.carbon_by_class_material(),
+            },
+        }
     
-    # Analyse des éléments
-    print(f"Analyzing elements... ({time.time() - start_time:.2f}s)")
-    
-    # Préparation du rapport Excel
-    workbook = Workbook()
-    details = workbook.active
-    details.title = "Détails"
-    
-    # Styles pour l'onglet de détails
-    header_font = Font(size=12, bold=True)
-    normal_font = Font(size=11)
-    header_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")
-    ok_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    ko_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    no_fill = PatternFill(fill_type=None)
-    center_alignment = Alignment(horizontal='center', vertical='center')
-    left_alignment = Alignment(horizontal='left', vertical='center')
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    def __iter__(self):
+        return self.rows()
     
-    # En-têtes de l'onglet de détails
-    headers = ["Type", "Étage", "ID", "Nom", "PSet", "Paramètre", "Valeur", "Statut"]
-    for col, header in enumerate(headers, 1):
-        cell = details.cell(row=1, column=col)
-        cell.value = header
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-        cell.border = border
-        cell.font = header_font
-    
-    row = 2
-    total_carbon_footprint = 0
-    carbon_footprint_by_type = defaultdict(float)
-    carbon_footprint_by_floor = defaultdict(float)
-    
-    print("Analyzing elements and calculating carbon footprint...")
-    for element in ifc_file.by_type('IfcProduct'):
-        if element.is_a() in element_types:
-            if element.is_a() not in elements_by_class:
-                elements_by_class[element.is_a()] = {"total": 0, "valid": 0, "invalid": 0}
+    def rows(self, verbosity="full"):
+        """Lignes de détail (Type, Étage, ID, Nom, PSet, Paramètre, Valeur, Statut) du rapport.
+        
+        verbosity : toutes les lignes (full), les défauts seuls (failures), ou les défauts suivis,
+        pour chaque élément, d'une ligne comptant ses paramètres valides (rollup).
+        """
+        self._flush()
+        classes, floors, slots = self.classes.values, self.floors.values, self.slots
+        class_codes, floor_codes = self.class_codes, self.floor_codes
+        full, rollup = verbosity == "full", verbosity == "rollup"
+        self._file.seek(0)
+        while True:
+            try:
+                start, ids, names, row_elements, row_codes, values = pickle.load(self._file)
+            except EOFError:
+                break
             
-            elements_by_class[element.is_a()]["total"] += 1
-            floor = get_building_storey(ifc_file, element)
-            element_psets = ifcopenshell.util.element.get_psets(element)
-            element_valid = True
-            has_missing_pset = False
-            has_missing_param = False
+            def element_columns(index):
+                return classes[class_codes[index]], floors[floor_codes[index]], ids[index - start], names[index - start]
             
-            # Vérification des PSet et paramètres requis
-            for pset_name, params in required_psets_and_params[element.is_a()].items():
-                if pset_name not in element_psets:
-                    element_valid = False
-                    has_missing_pset = True
-                    
-                    cells = [
-                        (1, element.is_a(), left_alignment),
-                        (2, str(floor), left_alignment),
-                        (3, element.GlobalId, center_alignment),
-                        (4, getattr(element, 'Name', ''), left_alignment),
-                        (5, pset_name, left_alignment),
-                        (6, "TOUS", center_alignment),
-                        (7, "MANQUANT", center_alignment),
-                        (8, "KO", center_alignment)
-                    ]
-                    
-                    for col, value, alignment in cells:
-                        cell = details.cell(row=row, column=col)
-                        cell.value = value
-                        cell.alignment = alignment
-                        cell.border = border
-                        cell.font = normal_font
-                        cell.fill = ko_fill if col == 8 else no_fill
-                    
-                    row += 1
-                else:
-                    for param_name, param_type in params.items():
-                        actual_value = element_psets[pset_name].get(param_name)
-                        
-                        if actual_value is None:
-                            element_valid = False
-                            has_missing_param = True
-                            
-                            cells = [
-                                (1, element.is_a(), left_alignment),
-                                (2, str(floor), left_alignment),
-                                (3, element.GlobalId, center_alignment),
-                                (4, getattr(element, 'Name', ''), left_alignment),
-                                (5, pset_name, left_alignment),
-                                (6, param_name, left_alignment),
-                                (7, "MANQUANT", center_alignment),
-                                (8, "KO", center_alignment)
-                            ]
-                            
-                            for col, value, alignment in cells:
-                                cell = details.cell(row=row, column=col)
-                                cell.value = value
-                                cell.alignment = alignment
-                                cell.border = border
-                                cell.font = normal_font
-                                cell.fill = ko_fill if col == 8 else no_fill
-                            
-                            row += 1
-                        else:
-                            try:
-                                param_type_class = str_to_type(param_type)
-                                param_type_class(actual_value)
-                                
-                                cells = [
-                                    (1, element.is_a(), left_alignment),
-                                    (2, str(floor), left_alignment),
-                                    (3, element.GlobalId, center_alignment),
-                                    (4, getattr(element, 'Name', ''), left_alignment),
-                                    (5, pset_name, left_alignment),
-                                    (6, param_name, left_alignment),
-                                    (7, str(actual_value), left_alignment),
-                                    (8, "OK", center_alignment)
-                                ]
-                                
-                                for col, value, alignment in cells:
-                                    cell = details.cell(row=row, column=col)
-                                    cell.value = value
-                                    cell.alignment = alignment
-                                    cell.border = border
-                                    cell.font = normal_font
-                                    cell.fill = ok_fill if col == 8 else no_fill
-                                
-                                row += 1
-                            except (ValueError, TypeError):
-                                element_valid = False
-                                has_missing_param = True
-                                
-                                cells = [
-                                    (1, element.is_a(), left_alignment),
-                                    (2, str(floor), left_alignment),
-                                    (3, element.GlobalId, center_alignment),
-                                    (4, getattr(element, 'Name', ''), left_alignment),
-                                    (5, pset_name, left_alignment),
-                                    (6, param_name, left_alignment),
-                                    (7, f"{actual_value} (attendu: {param_type})", left_alignment),
-                                    (8, "KO", center_alignment)
-                                ]
-                                
-                                for col, value, alignment in cells:
-                                    cell = details.cell(row=row, column=col)
-                                    cell.value = value
-                                    cell.alignment = alignment
-                                    cell.border = border
-                                    cell.font = normal_font
-                                    cell.fill = ko_fill if col == 8 else no_fill
-                                
-                                row += 1
+            # Lignes d'un même élément consécutives : le récapitulatif suit sa dernière ligne
+            element, valid_params = None, 0
+            for index, code, value in zip(row_elements, row_codes, values):
+                if index != element:
+                    if valid_params:
+                        yield element_columns(element) + ("TOUS", "TOUS", valid_params_text(valid_params), "OK")
+                    element, valid_params = index, 0
+                if code >= 0 and not full:
+                    valid_params += rollup
+                    continue
+                pset_name, param_name, status = detail_row(slots, code)
+                yield (classes[class_codes[index]], floors[floor_codes[index]], ids[index - start], names[index - start],
+                       pset_name, param_name, value, status)
+            if valid_params:
+                yield element_columns(element) + ("TOUS", "TOUS", valid_params_text(valid_params), "OK")
+    
+    def close(self):
+        self._file.close()
+
+def create_details_sheet(workbook, details):
+    """Crée l'onglet Détails avec sa seule ligne d'en-tête.
+    
+    Les lignes de détail sont ajoutées au paquet après la sauvegarde du classeur
+    (voir details_rows_xml) ; retourne la feuille et les index de ses styles.
+    """
+    sheet = workbook.create_sheet("Détails")
+    set_column_widths(sheet, details.widths)
+    sheet.freeze_panes = 'A2'
+    
+    sheet.append([styled_cell(sheet, header, "header") for header in details.headers])
+    # Index des styles dans styles.xml : les enregistrer avant la sauvegarde
+    style_ids = {style: styled_cell(sheet, None, style).style_id for style in ("cell_left", "cell_center", "status_ok", "status_ko")}
+    return sheet, style_ids
+
+def inline_cell(value, style_id):
+    """Fin d'une cellule XML en chaîne inline, après le numéro de ligne de sa référence."""
+    if value is None or value == "":
+        return f'" s="{style_id}"/>'
+    # Caractères de contrôle interdits en XML supprimés (openpyxl les refuse)
+    text = ILLEGAL_CHARACTERS_RE.sub('', str(value)).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return f'" s="{style_id}" t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+def details_rows_xml(details, style_ids, first_row=2):
+    """Génère les lignes XML de l'onglet Détails sans passer par les cellules openpyxl.
+    
+    Les fragments des valeurs répétées (classe, étage, PSet, paramètre) sont mis en cache.
+    """
+    left, center = style_ids["cell_left"], style_ids["cell_center"]
+    status_cells = {"OK": inline_cell("OK", style_ids["status_ok"]), "KO": inline_cell("KO", style_ids["status_ko"])}
+    cache = {}
+    
+    def cached(value, style_id):
+        fragment = cache.get((value, style_id))
+        if fragment is None:
+            fragment = cache[(value, style_id)] = inline_cell(value, style_id)
+        return fragment
+    
+    element = None
+    for r, (element_type, floor, global_id, name, pset_name, param_name, value, status) in enumerate(details, first_row):
+        # Lignes d'un même élément consécutives : identifiant et nom rendus une fois
+        if element != (global_id, name):
+            element = (global_id, name)
+            id_cell, name_cell = inline_cell(global_id, center), inline_cell(name, left)
+        value_cell = cached(value, center) if value == "MANQUANT" else inline_cell(value, left)
+        status_cell = status_cells.get(status) or inline_cell(status, style_ids["status_ko"])
+        yield (f'<row r="{r}"><c r="A{r}{cached(element_type, left)}<c r="B{r}{cached(floor, left)}'
+               f'<c r="C{r}{id_cell}<c r="D{r}{name_cell}<c r="E{r}{cached(pset_name, left)}'
+               f'<c r="F{r}{cached(param_name, center if param_name == "TOUS" else left)}'
+               f'<c r="G{r}{value_cell}<c r="H{r}{status_cell}</row>')
+
+def append_sheet_rows(source_path, output_path, sheet_part, rows, max_bytes=0):
+    """Recopie un classeur xlsx en ajoutant des lignes XML à la fin des données d'une feuille.
+    
+    Les lignes sont compressées au fil de l'eau ; max_bytes majore la taille de la feuille
+    pour activer ZIP64 au-delà de 2 Go.
+    """
+    with zipfile.ZipFile(source_path) as source, zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename != sheet_part:
+                target.writestr(info, data)
+                continue
+            head, tail = data.split(b'</sheetData>', 1)
+            part = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            part.compress_type = zipfile.ZIP_DEFLATED
+            with target.open(part, 'w', force_zip64=max_bytes > zipfile.ZIP64_LIMIT) as f:
+                f.write(head)
+                chunk = []
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) == 2048:
+                        f.write(''.join(chunk).encode('utf-8'))
+                        chunk = []
+                f.write(''.join(chunk).encode('utf-8'))
+                f.write(b'</sheetData>' + tail)
+
+# Configuration du moteur de validation parallèle
+VALIDATION_ENGINE = os.environ.get('CHECKERS_ENGINE', 'auto')  # auto, python ou rust
+VALIDATION_WORKERS = int(os.environ.get('CHECKERS_VALIDATION_WORKERS', os.cpu_count() or 1))
+PARALLEL_MIN_ELEMENTS = int(os.environ.get('CHECKERS_PARALLEL_MIN_ELEMENTS', 20000))  # En dessous, validation dans le processus de l'analyse
+SHARD_SIZE = int(os.environ.get('CHECKERS_SHARD_SIZE', 5000))  # Éléments par lot envoyé à un worker
+
+def validate_element(element_psets, class_rules):
+    """Vérifie les PSet et paramètres requis d'un élément.
+    
+    Retourne (valide, PSet manquant, paramètre manquant ou invalide, lignes de détail)
+    où chaque ligne de détail est (PSet, paramètre, valeur, statut) ; la valeur d'un paramètre
+    valide est la valeur brute, convertie en texte seulement à l'écriture des rapports.
+    """
+    element_valid = True
+    has_missing_pset = False
+    has_missing_param = False
+    rows = []
+    
+    for pset_name, params in class_rules:
+        if pset_name not in element_psets:
+            element_valid = False
+            has_missing_pset = True
+            rows.append((pset_name, "TOUS", "MANQUANT", "KO"))
+            continue
+        
+        pset = element_psets[pset_name]
+        for param_name, param_type, validator in params:
+            actual_value = pset.get(param_name)
             
-            # Mise à jour des statistiques
-            if element_valid:
-                elements_by_class[element.is_a()]["valid"] += 1
-                floor_stats[floor]["valid"] += 1
-            else:
-                elements_by_class[element.is_a()]["invalid"] += 1
-                floor_stats[floor]["invalid"] += 1
-                if has_missing_pset:
-                    missing_psets += 1
-                if has_missing_param:
-                    missing_params += 1
+            if actual_value is None:
+                element_valid = False
+                has_missing_param = True
+                rows.append((pset_name, param_name, "MANQUANT", "KO"))
+                continue
             
-            # Calcul de l'empreinte carbone
             try:
-                carbon_footprint = calculate_carbon_footprint(ifc_file, element)
-                print(f"Carbon footprint for {element.is_a()}: {carbon_footprint:.2f} kg CO2e")
-                total_carbon_footprint += carbon_footprint
-                carbon_footprint_by_type[element.is_a()] += carbon_footprint
-                carbon_footprint_by_floor[floor] += carbon_footprint
+                validator(actual_value)
+            except (ValueError, TypeError, OverflowError):
+                # OverflowError : int() d'un flottant infini
+                element_valid = False
+                has_missing_param = True
+                rows.append((pset_name, param_name, f"{actual_value} (attendu: {param_type})", "KO"))
+            else:
+                rows.append((pset_name, param_name, actual_value, "OK"))
+    
+    return element_valid, has_missing_pset, has_missing_param, rows
+
+_detail_slots_cache = OrderedDict()  # Borné comme _rulebook_cache
+_detail_slots_cache_lock = threading.Lock()
+
+def detail_slots(rulebook):
+    """Couples (PSet, paramètre) que peuvent porter les lignes de détail d'un Rulebook.
+    
+    Leur code est le même dans tous les processus de validation et d'une analyse à l'autre
+    tant que les exigences ne changent pas.
+    """
+    with _detail_slots_cache_lock:
+        if rulebook.digest in _detail_slots_cache:
+            _detail_slots_cache.move_to_end(rulebook.digest)
+            return _detail_slots_cache[rulebook.digest]
+    slots = Categories()
+    for class_rules in rulebook.rules.values():
+        for pset_name, params in class_rules:
+            slots.code((pset_name, "TOUS"))
+            for param_name, _, _ in params:
+                slots.code((pset_name, param_name))
+    with _detail_slots_cache_lock:
+        _detail_slots_cache[rulebook.digest] = slots
+        while len(_detail_slots_cache) > RULEBOOK_CACHE_SIZE:
+            _detail_slots_cache.popitem(last=False)
+    return slots
+
+def encode_rows(rows, slots):
+    """Code les lignes de détail d'un élément : (codes, valeurs).
+    
+    Le code d'une ligne est celui de son couple (PSet, paramètre) dans slots, complémenté (~code)
+    pour un statut KO. Les textes des défauts, très répétés ("MANQUANT"...), sont internés.
+    """
+    codes = slots.codes
+    return (array('i', [codes[pset_name, param_name] if status == "OK" else ~codes[pset_name, param_name]
+                        for pset_name, param_name, _, status in rows]),
+            tuple(value if status == "OK" else sys.intern(value) for _, _, value, status in rows))
+
+def detail_row(slots, code):
+    """(PSet, paramètre, statut) d'une ligne de détail codée par encode_rows ; slots : liste des couples."""
+    if code >= 0:
+        return slots[code] + ("OK",)
+    return slots[~code] + ("KO",)
+
+# Validateurs Python et leur équivalent dans le moteur Rust
+RUST_VALIDATORS = {
+    str: "str",
+    int: "int",
+    float: "float",
+    bool: "bool",
+    reject_unsupported_type: "unsupported",
+}
+_rust_rules_cache = OrderedDict()  # Borné comme _rulebook_cache
+_rust_rules_cache_lock = threading.Lock()
+
+def rust_rules(rulebook):
+    """Règles du Rulebook au format du moteur Rust, ou None si elles n'y sont pas représentables."""
+    with _rust_rules_cache_lock:
+        if rulebook.digest in _rust_rules_cache:
+            _rust_rules_cache.move_to_end(rulebook.digest)
+            return _rust_rules_cache[rulebook.digest]
+    rules = {}
+    for ifc_class, class_rules in rulebook.rules.items():
+        if not isinstance(ifc_class, str):
+            continue
+        entries = []
+        for pset_name, params in class_rules:
+            if not all(isinstance(param_name, str) and validator in RUST_VALIDATORS for param_name, _, validator in params):
+                rules = None
+                break
+            entries.append((pset_name, [(param_name, RUST_VALIDATORS[validator], str(param_type)) for param_name, param_type, validator in params]))
+        if rules is None:
+            break
+        rules[ifc_class] = entries
+    with _rust_rules_cache_lock:
+        _rust_rules_cache[rulebook.digest] = rules
+        while len(_rust_rules_cache) > RULEBOOK_CACHE_SIZE:
+            _rust_rules_cache.popitem(last=False)
+    return rules
+
+def validate_batch(batch, rulebook):
+    """Applique validate_element à une liste de (classe, psets), avec le moteur Rust si possible."""
+    if ifc_analyzer is not None and VALIDATION_ENGINE != 'python':
+        rules = rust_rules(rulebook)
+        if rules is not None:
+            try:
+                return ifc_analyzer.validate_elements(batch, rules)
             except Exception as e:
-                print(f"Error calculating carbon footprint for {element.is_a()}: {str(e)}")
+                if VALIDATION_ENGINE == 'rust':
+                    raise
+                print(f"Rust validation failed, falling back to Python: {str(e)}")
+    return [validate_element(element_psets, rulebook.rules.get(ifc_class, ())) for ifc_class, element_psets in batch]
+
+class ElementRecord(NamedTuple):
+    """Résultat de validation d'un élément, lignes de détail codées par encode_rows."""
+    element_id: int
+    ifc_class: str
+    floor: str
+    global_id: str
+    name: str
+    valid: bool
+    missing_pset: bool
+    missing_param: bool
+    row_codes: array
+    row_values: tuple
+
+def validate_elements(ifc_file, element_ids, rulebook, storey_index, property_index):
+    """Valide un lot d'éléments ; retourne un ElementRecord par élément."""
+    elements = [ifc_file.by_id(element_id) for element_id in element_ids]
+    results = validate_batch([(element.is_a(), property_index.get(element.id(), {})) for element in elements], rulebook)
+    slots = detail_slots(rulebook)
+    
+    records = []
+    for element, (element_valid, has_missing_pset, has_missing_param, rows) in zip(elements, results):
+        records.append(ElementRecord(element.id(), sys.intern(element.is_a()), storey_index.get(element.id(), "Sans étage"),
+                                     element.GlobalId, getattr(element, 'Name', ''), element_valid, has_missing_pset,
+                                     has_missing_param, *encode_rows(rows, slots)))
+    return records
+
+def plan_shards(elements):
+    """Découpe les éléments en lots par classe IFC puis par plages d'identifiants (ordre déterministe)."""
+    ids_by_class = defaultdict(list)
+    for element in elements:
+        ids_by_class[element.is_a()].append(element.id())
+    shards = []
+    for ifc_class in sorted(ids_by_class):
+        ids = sorted(ids_by_class[ifc_class])
+        for start in range(0, len(ids), SHARD_SIZE):
+            shards.append(ids[start:start + SHARD_SIZE])
+    return shards
+
+# État d'un worker de validation : modèle ouvert et index construits une seule fois par processus
+_validation_worker_state = {}
+
+def _init_validation_worker(ifc_file_path, rulebook, loading_mode):
+    ifc_file = open_model(ifc_file_path, loading_mode)
+    property_index, _ = build_property_index(ifc_file, rulebook)
+    _validation_worker_state.update(
+        ifc_file=ifc_file,
+        rulebook=rulebook,
+        storey_index=build_storey_index(ifc_file),
+        property_index=property_index,
+    )
+
+def _validate_shard(element_ids):
+    state = _validation_worker_state
+    return validate_elements(state["ifc_file"], element_ids, state["rulebook"], state["storey_index"],
+                             state["property_index"])
+
+def run_validation(ifc_file, ifc_file_path, rulebook, elements, property_index, loading=None):
+    """Valide les éléments, en parallèle sur plusieurs processus pour les gros modèles.
+    
+    property_index sert à la validation dans le processus courant ; les workers construisent le leur.
+    Les enregistrements sont produits dans l'ordre des lots quel que soit leur ordre d'achèvement.
+    loading (ModelLoading) : mode d'ouverture du modèle dans les workers ; chacun en ouvre une
+    copie, leur nombre est donc borné par le budget mémoire.
+    """
+    loading = loading or ModelLoading("full", 0, VALIDATION_WORKERS + 1)
+    shards = plan_shards(elements)
+    total = len(elements)
+    workers = min(VALIDATION_WORKERS, len(shards), loading.max_copies - 1)
+    
+    if workers <= 1 or total < PARALLEL_MIN_ELEMENTS:
+        storey_index = build_storey_index(ifc_file)
+        for shard in shards:
+            yield from validate_elements(ifc_file, shard, rulebook, storey_index, property_index)
+        return
+    
+    print(f"Validating {total} elements in {len(shards)} shards on {workers} processes")
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_validation_worker,
+        initargs=(ifc_file_path, rulebook, loading.mode)
+    ) as executor:
+        futures = {executor.submit(_validate_shard, shard): index for index, shard in enumerate(shards)}
+        pending_results = {}
+        next_index = 0
+        for future in concurrent.futures.as_completed(futures):
+            pending_results[futures[future]] = future.result()
+            while next_index in pending_results:
+                records = pending_results.pop(next_index)
+                next_index += 1
+                yield from records
+
+# Résultats par élément conservés avec chaque analyse, base des analyses incrémentales
+ELEMENTS_FILENAME = 'elements.pickle'
+ELEMENT_RESULTS_VERSION = 4
+
+def representation_digest(entity, memo):
+    """Empreinte d'un graphe d'entités (géométrie, placement) indépendante de la numérotation STEP."""
+    entity_id = entity.id()
+    if entity_id and entity_id in memo:
+        return memo[entity_id]
+    digest = hashlib.blake2b(entity.is_a().encode('utf-8'), digest_size=16)
+    for index in range(len(entity)):
+        digest.update(_attribute_digest(entity[index], memo))
+    digest = digest.digest()
+    if entity_id:
+        memo[entity_id] = digest
+    return digest
+
+def _attribute_digest(value, memo):
+    import ifcopenshell
+    if isinstance(value, ifcopenshell.entity_instance):
+        return representation_digest(value, memo)
+    if isinstance(value, (tuple, list)):
+        return b'(' + b','.join(_attribute_digest(item, memo) for item in value) + b')'
+    return repr(value).encode('utf-8')
+
+DIMENSION_ATTRIBUTES = ('OverallHeight', 'OverallWidth', 'OverallDepth')
+
+class ElementFingerprints:
+    """Empreinte de tout ce qui détermine le résultat d'un élément.
+    
+    Classe, nom, étage, matériau carbone, PSet requis, quantités, dimensions et, pour les éléments dont
+    l'empreinte carbone vient de la géométrie, leur représentation et leurs ouvertures. Comme le calcul
+    géométrique, l'empreinte de la géométrie est calculée une fois par representation_key.
+    """
+    def __init__(self, property_index, quantity_index, materials):
+        self.property_index = property_index
+        self.quantity_index = quantity_index
+        self.materials = materials
+        self.memo = {}
+        self.geometry = {}  # representation_key -> empreinte de la géométrie
+        self.dimensions = {}  # Classe IFC -> attributs de dimensions qu'elle porte
+    
+    def geometry_digest(self, element):
+        key = representation_key(element)
+        digest = self.geometry.get(key)
+        if digest is None:
+            if isinstance(key, tuple):
+                # Représentations types partagées : leurs quantités ne dépendent que des sources
+                digest = [representation_digest(item.MappingSource, self.memo)
+                          for representation in element.Representation.Representations for item in representation.Items]
+            else:
+                digest = [representation_digest(element.Representation, self.memo)]
+                for rel in getattr(element, 'HasOpenings', None) or ():
+                    opening = rel.RelatedOpeningElement
+                    digest += [representation_digest(opening.ObjectPlacement, self.memo) if opening.ObjectPlacement else None,
+                               representation_digest(opening.Representation, self.memo) if opening.Representation else None]
+            digest = self.geometry[key] = tuple(digest)
+        return digest
+    
+    def __call__(self, element, floor):
+        quantity = self.quantity_index.get(element.id())
+        material = self.materials.get(element.id())
+        geometry = None
+        if not quantity and material is not None and getattr(element, 'Representation', None) is not None:
+            geometry = self.geometry_digest(element)
+        psets = self.property_index.get(element.id(), {})
+        ifc_class = element.is_a()
+        # Un attribut absent coûte une exception dans ifcopenshell : on ne lit que ceux de la classe
+        dimensions = self.dimensions.get(ifc_class)
+        if dimensions is None:
+            dimensions = self.dimensions[ifc_class] = [hasattr(element, name) for name in DIMENSION_ATTRIBUTES]
+        payload = (
+            ifc_class, element.Name, floor,
+            sorted((pset_name, sorted(values.items())) for pset_name, values in psets.items()),
+            quantity, *(getattr(element, name) if present else None for name, present in zip(DIMENSION_ATTRIBUTES, dimensions)),
+            geometry, material,
+        )
+        return hashlib.blake2b(repr(payload).encode('utf-8'), digest_size=16).digest()
+
+def element_results_header(rulebook):
+    # Couples (PSet, paramètre) des codes de lignes de détail des enregistrements (voir encode_rows)
+    return {"version": ELEMENT_RESULTS_VERSION, "rulebook": rulebook.digest, "carbon": analysis_carbon_database(rulebook).digest,
+            "detail_slots": detail_slots(rulebook).values}
+
+class ElementResultsWriter:
+    """Enregistre, élément par élément, (GlobalId, empreinte, empreinte carbone, enregistrement sans id)."""
+    BATCH_SIZE = 5000
+    
+    def __init__(self, path, header):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.tmp_path, 'wb')
+        pickle.dump(header, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.batch = []
+    
+    def append(self, global_id, fingerprint, carbon_footprint, record):
+        self.batch.append((global_id, fingerprint, carbon_footprint, record[1:]))
+        if len(self.batch) >= self.BATCH_SIZE:
+            self._flush()
+    
+    def _flush(self):
+        if self.batch:
+            pickle.dump(self.batch, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.batch = []
+    
+    def close(self):
+        self._flush()
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+def load_element_results(path):
+    """Lit les résultats par élément d'une analyse : (en-tête, GlobalId -> (empreinte, carbone, enregistrement)).
+    
+    Les GlobalId en double sont associés à None et ne seront jamais réutilisés.
+    """
+    results = {}
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                break
+            for global_id, fingerprint, carbon_footprint, record in batch:
+                results[global_id] = None if global_id in results else (fingerprint, carbon_footprint, record)
+    return header, results
+
+def diff_elements(ifc_file, elements, previous_path, rulebook, fingerprint):
+    """Compare les éléments du modèle à ceux d'une analyse précédente, par GlobalId et empreinte.
+    
+    Retourne (éléments à traiter, enregistrements réutilisés triés comme plan_shards,
+    empreintes carbone réutilisées par id, empreintes calculées par id, bilan de révision).
+    """
+    header, previous = load_element_results(previous_path)
+    reusable = header == element_results_header(rulebook)
+    if not reusable:
+        print("Requirements or carbon factors changed: every element is revalidated")
+    storey_index = build_storey_index(ifc_file)
+    seen = Counter(element.GlobalId for element in elements)
+    
+    to_process = []
+    reused_records = []
+    reused_carbon = {}
+    fingerprints = {}
+    revision = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0, "reused": 0}
+    for element in elements:
+        element_id = element.id()
+        fingerprints[element_id] = fingerprint(element, storey_index.get(element_id, "Sans étage"))
+        entry = previous.get(element.GlobalId, False)
+        if entry is False:
+            revision["added"] += 1
+        elif entry is None or entry[0] != fingerprints[element_id]:
+            revision["changed"] += 1
+        else:
+            revision["unchanged"] += 1
+        if reusable and entry and entry[0] == fingerprints[element_id] and seen[element.GlobalId] == 1:
+            reused_records.append(ElementRecord(element_id, *entry[2]))
+            reused_carbon[element_id] = entry[1]
+        else:
+            to_process.append(element)
+    revision["removed"] = sum(1 for global_id in previous if global_id not in seen)
+    revision["reused"] = len(reused_records)
+    reused_records.sort(key=lambda record: (record.ifc_class, record.element_id))
+    return to_process, reused_records, reused_carbon, fingerprints, revision
+
+LIVE_STATS_INTERVAL = 1.0  # Secondes entre deux publications des statistiques partielles
+
+class PhaseTimer:
+    """Mesure la durée des phases d'une analyse.
+    
+    with timer.phase("open"): ... ; timer.timings donne {phase: secondes} dans l'ordre d'exécution.
+    """
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.timings = OrderedDict()
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - phase_start
+            self.timings[name] = self.timings.get(name, 0) + duration
+            print(f"Phase {name}: {duration:.2f}s")
+    
+    def total(self):
+        return time.perf_counter() - self.start_time
+
+def process_files(temp_dir: str, ifc_file_path: str, excel_file_path: str, output_file_path: str, progress=None, timer=None, previous_dir=None,
+                  publish_results=None, verbosity=REPORT_VERBOSITY):
+    """Analyse un modèle IFC et écrit le rapport Excel ; retourne les données du dashboard.
+    
+    previous_dir : dossier d'une analyse précédente du même modèle, dont les résultats des
+    éléments inchangés sont réutilisés (analyse incrémentale).
+    publish_results : appelée avec les données du dashboard dès la fin de la validation,
+    avant l'écriture du rapport.
+    verbosity : lignes de l'onglet Détails (voir ResultTable.rows) ; les onglets de synthèse
+    et le dashboard n'en dépendent pas.
+    """
+    timer = timer or PhaseTimer()
+    print(f"Starting analysis...")
     
-    # Statistiques globales
-    total_elements = sum(stats["total"] for stats in elements_by_class.values())
-    valid_elements = sum(stats["valid"] for stats in elements_by_class.values())
-    invalid_elements = sum(stats["invalid"] for stats in elements_by_class.values())
+    def report_progress(phase, value=None, partial=None):
+        if progress is not None:
+            progress(phase, value, partial)
     
-    # Créer l'onglet de résumé
-    create_summary_sheet(workbook, total_elements, valid_elements, invalid_elements, missing_psets, missing_params, floor_stats, elements_by_class, required_psets_and_params)
-    
-    print(f"Creating carbon footprint sheet with total: {total_carbon_footprint:.2f} kg CO2e")
-    print(f"Carbon footprint by type: {dict(carbon_footprint_by_type)}")
-    print(f"Carbon footprint by floor: {dict(carbon_footprint_by_floor)}")
-    
-    # Ajouter la feuille d'empreinte carbone
-    carbon_data = {
-        'total': total_carbon_footprint,
-        'by_type': dict(carbon_footprint_by_type),
-        'by_floor': dict(carbon_footprint_by_floor),
-        'material_mapping': IFC_TO_MATERIAL_MAPPING,
-        'material_factors': MATERIAL_CARBON_FACTORS
-    }
-    create_carbon_footprint_sheet(workbook, carbon_data)
+    # Chargement des données
+    report_progress("loading")
+    with timer.phase("requirements"):
+        rulebook = compile_requirements(excel_file_path)
+    with timer.phase("scan"):
+        scan = scan_model(ifc_file_path)
+        loading = plan_model_loading(scan)
+    print(f"Model scan: {scan.entities} entities, {sum(scan.classes[ifc_class.upper()] for ifc_class in rulebook.element_types)} "
+          f"elements to validate, {loading.mode} loading (about {loading.estimated_mb:.0f} MB)")
+    with timer.phase("open"):
+        ifc_file = open_model(ifc_file_path, loading.mode)
+    
+    # Résultats en colonnes, dont sont dérivés le rapport et le dashboard
+    table = ResultTable(temp_dir, detail_slots(rulebook))
+    
+    with timer.phase("index"):
+        elements = model_elements(ifc_file, rulebook.element_types)
+        property_index, quantity_index = build_property_index(ifc_file, rulebook)
+        carbon_database = analysis_carbon_database(rulebook)
+        materials = resolve_materials(ifc_file, elements, carbon_database)
+    fingerprint = ElementFingerprints(property_index, quantity_index, materials)
+    element_results = ElementResultsWriter(os.path.join(temp_dir, ELEMENTS_FILENAME), element_results_header(rulebook))
+    
+    # Analyse incrémentale : seuls les éléments nouveaux ou modifiés sont traités
+    revision = None
+    to_process, reused_records, carbon_by_element, fingerprints = elements, [], {}, {}
+    if previous_dir is not None:
+        report_progress("diff")
+        with timer.phase("diff"):
+            to_process, reused_records, carbon_by_element, fingerprints, revision = diff_elements(
+                ifc_file, elements, os.path.join(previous_dir, ELEMENTS_FILENAME), rulebook, fingerprint)
+        print(f"Revision: {revision}")
+    
+    # Quantités et empreinte carbone, géométrie calculée une fois par représentation
+    report_progress("carbon")
+    with timer.phase("carbon"):
+        carbon_by_element.update(compute_carbon_footprints(ifc_file, to_process, quantity_index, materials))
+    
+    report_progress("validation", 0.0)
+    with timer.phase("validation"):
+        records = run_validation(ifc_file, ifc_file_path, rulebook, to_process, property_index, loading)
+        # Même ordre qu'une analyse complète : classe puis id (voir plan_shards)
+        records = heapq.merge(records, reused_records, key=lambda record: (record.ifc_class, record.element_id))
+        next_update = time.perf_counter() + LIVE_STATS_INTERVAL
+        for count, record in enumerate(records, 1):
+            carbon_footprint = carbon_by_element.get(record.element_id, 0)
+            material = materials.get(record.element_id)
+            table.append(record.ifc_class, record.floor, record.global_id, record.name, record.valid, record.missing_pset,
+                         record.missing_param, carbon_footprint, material.name if material is not None else UNSPECIFIED_MATERIAL,
+                         record.row_codes, record.row_values)
+            element_fingerprint = fingerprints.get(record.element_id) or fingerprint(ifc_file.by_id(record.element_id), record.floor)
+            element_results.append(record.global_id, element_fingerprint, carbon_footprint, record)
+            
+            # Statistiques partielles publiées pendant la validation (dashboard progressif)
+            if progress is not None and count % 256 == 0 and time.perf_counter() >= next_update:
+                partial = dict(table.dashboard(verbosity), elements_processed=count, elements_total=len(elements))
+                report_progress("validation", count / len(elements), partial)
+                next_update = time.perf_counter() + LIVE_STATS_INTERVAL
+        element_results.close()
+    
+    # Agrégations vectorisées sur les colonnes, publiées avant l'écriture du rapport
+    results = table.dashboard(verbosity)
+    results["carbon_footprint"]["materials"] = material_catalogue(carbon_database, materials)
+    if revision is not None:
+        results["revision"] = revision
+    if publish_results is not None:
+        publish_results(dict(results))
+    report_progress("report")
+    with timer.phase("report"):
+        workbook = Workbook(write_only=True)
+        register_report_styles(workbook)
+        
+        # Créer l'onglet de résumé
+        create_results_summary_sheet(workbook, results)
+        
+        # Onglet de détails, dont les lignes sont écrites à la sauvegarde
+        details_sheet, details_styles = create_details_sheet(workbook, table)
+        
+        print(f"Creating carbon footprint sheet with total: {results['carbon_footprint']['total']:.2f} kg CO2e")
+        
+        # Ajouter la feuille d'empreinte carbone
+        create_carbon_footprint_sheet(workbook, results["carbon_footprint"])
+    
+    # Sauvegarder le fichier, puis y ajouter les lignes de détail
+    with timer.phase("save"):
+        partial_path = os.path.join(temp_dir, 'report.partial.xlsx')
+        workbook.save(partial_path)
+        print(f"Writing {table.detail_row_count(verbosity)} detail rows ({verbosity})...")
+        # Majoration de la taille de la feuille : 6 octets par caractère (UTF-8, entités XML) plus le balisage
+        max_bytes = table.row_count * (6 * sum(table.widths.values()) + 600)
+        append_sheet_rows(partial_path, output_file_path, details_sheet.path.lstrip('/'),
+                          details_rows_xml(table.rows(verbosity), details_styles), max_bytes)
+        os.remove(partial_path)
+    table.close()
+    print(f"Analysis completed in {timer.total():.2f}s")
+    
+    results["timings"] = dict(timer.timings, total=timer.total())
+    return results
+
+class JobQueueFull(Exception):
+    """Levée quand la file d'analyses a atteint sa profondeur maximale."""
+
+_job_executor = None
+_job_lock = threading.Lock()
+_pending_jobs = set()  # Analyses soumises par ce processus, en attente ou en cours
+
+# État partagé par les workers gunicorn : file d'analyses et métriques
+SHARED_STATE_PATH = os.path.join(TEMP_FOLDER, '.cache', 'state.sqlite')
+
+@contextlib.contextmanager
+def shared_state():
+    """Connexion à l'état partagé, dans une transaction qui exclut les autres écritures."""
+    os.makedirs(os.path.dirname(SHARED_STATE_PATH), exist_ok=True)
+    connection = sqlite3.connect(SHARED_STATE_PATH, timeout=30, isolation_level=None)
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("CREATE TABLE IF NOT EXISTS metrics (name TEXT NOT NULL, label TEXT NOT NULL, value REAL NOT NULL, "
+                           "PRIMARY KEY (name, label))")
+        connection.execute("CREATE TABLE IF NOT EXISTS jobs (analysis_id TEXT PRIMARY KEY, pid INTEGER NOT NULL)")
+        yield connection
+        connection.execute("COMMIT")
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def pending_job_count(connection):
+    """Analyses en attente ou en cours, tous workers gunicorn confondus.
+    
+    Les analyses d'un worker disparu (redémarré par gunicorn...) sont oubliées.
+    """
+    for (pid,) in connection.execute("SELECT DISTINCT pid FROM jobs").fetchall():
+        if pid == os.getpid():
+            stale = [(analysis_id,) for (analysis_id,) in connection.execute("SELECT analysis_id FROM jobs WHERE pid = ?", (pid,))
+                     if analysis_id not in _pending_jobs]
+            connection.executemany("DELETE FROM jobs WHERE analysis_id = ?", stale)
+        elif not process_alive(pid):
+            connection.execute("DELETE FROM jobs WHERE pid = ?", (pid,))
+    return connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+# Places d'exécution : au plus MAX_CONCURRENT_JOBS analyses en cours, tous workers gunicorn confondus
+JOB_SLOTS_DIR = os.path.join(TEMP_FOLDER, '.cache', 'slots')
+JOB_SLOT_POLL_INTERVAL = 0.5  # Secondes entre deux tentatives quand toutes les places sont prises
+
+@contextlib.contextmanager
+def job_slot():
+    """Réserve une place d'exécution ; un verrou de fichier, libéré même si le processus meurt."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(JOB_SLOTS_DIR, exist_ok=True)
+    while True:
+        for slot in range(MAX_CONCURRENT_JOBS):
+            lock = open(os.path.join(JOB_SLOTS_DIR, f"slot-{slot}.lock"), 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                continue
+            try:
+                yield
+            finally:
+                lock.close()
+            return
+        time.sleep(JOB_SLOT_POLL_INTERVAL)
+
+def get_analysis_dir(analysis_id):
+    """Retourne le dossier d'une analyse, ou None si l'identifiant est invalide."""
+    try:
+        analysis_id = str(uuid.UUID(analysis_id))
+    except ValueError:
+        return None
+    return os.path.join(TEMP_FOLDER, analysis_id)
+
+def read_job_status(analysis_dir):
+    try:
+        with open(os.path.join(analysis_dir, STATUS_FILENAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_job_status(analysis_dir, **fields):
+    """Met à jour le fichier d'état d'une analyse (partagé entre processus)."""
+    status = read_job_status(analysis_dir) or {}
+    status.update(fields)
+    status["updated_at"] = time.time()
+    path = os.path.join(analysis_dir, STATUS_FILENAME)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# Cache des résultats : même modèle + mêmes exigences + mêmes facteurs carbone => même rapport
+RESULT_CACHE_DIR = os.path.join(TEMP_FOLDER, '.cache', 'results')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('CHECKERS_RESULT_CACHE_MB', 1024)) * 1024 * 1024  # 0 désactive le cache
+RESULT_CACHE_VERSION = 5  # À incrémenter quand le contenu du rapport change
+CACHED_REPORT_FILENAME = 'report.xlsx'
+
+def result_cache_key(ifc_path, excel_path, ifc_sha256=None, verbosity=REPORT_VERBOSITY):
+    """Clé du cache : hash du modèle IFC, des exigences compilées, de la base de facteurs carbone
+    et de la verbosité du rapport."""
+    rulebook = compile_requirements(excel_path)
+    parts = [str(RESULT_CACHE_VERSION), ifc_sha256 or file_sha256(ifc_path), rulebook.digest, analysis_carbon_database(rulebook).digest,
+             verbosity]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+def _link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+def load_cached_result(cache_key, output_path):
+    """Copie le rapport en cache vers output_path et retourne le JSON du dashboard, ou None.
+    
+    Les résultats par élément sont copiés à côté du rapport pour les analyses incrémentales.
+    """
+    if RESULT_CACHE_MAX_BYTES <= 0:
+        return None
+    entry_dir = os.path.join(RESULT_CACHE_DIR, cache_key)
+    try:
+        with open(os.path.join(entry_dir, RESULT_FILENAME), encoding='utf-8') as f:
+            results = json.load(f)
+        _link_or_copy(os.path.join(entry_dir, CACHED_REPORT_FILENAME), output_path)
+        _link_or_copy(os.path.join(entry_dir, ELEMENTS_FILENAME), os.path.join(os.path.dirname(output_path), ELEMENTS_FILENAME))
+        os.utime(entry_dir)  # Date d'accès pour l'éviction LRU
+    except (OSError, ValueError):
+        return None
+    return results
+
+def store_cached_result(cache_key, results, output_path):
+    """Enregistre le rapport et le JSON du dashboard, puis applique la limite de taille."""
+    if RESULT_CACHE_MAX_BYTES <= 0:
+        return
+    entry_dir = os.path.join(RESULT_CACHE_DIR, cache_key)
+    tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        _link_or_copy(output_path, os.path.join(tmp_dir, CACHED_REPORT_FILENAME))
+        _link_or_copy(os.path.join(os.path.dirname(output_path), ELEMENTS_FILENAME), os.path.join(tmp_dir, ELEMENTS_FILENAME))
+        with open(os.path.join(tmp_dir, RESULT_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False)
+        os.replace(tmp_dir, entry_dir)
+    except OSError as e:
+        # Entrée déjà écrite par une analyse concurrente, ou disque plein
+        print(f"Could not cache result {cache_key}: {str(e)}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    evict_result_cache()
+
+def evict_result_cache():
+    """Supprime les entrées les moins récemment utilisées au-delà de RESULT_CACHE_MAX_BYTES."""
+    entries = []
+    try:
+        names = os.listdir(RESULT_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        entry_dir = os.path.join(RESULT_CACHE_DIR, name)
+        if name.endswith('.tmp'):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+        except OSError:
+            continue
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry_dir in sorted(entries):
+        if total_size <= RESULT_CACHE_MAX_BYTES:
+            break
+        print(f"Evicting cached result {os.path.basename(entry_dir)}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_size -= size
+
+# Fichiers produits par une analyse, indexés pour /download
+ARTIFACTS_FILENAME = 'artifacts.json'
+ARTIFACT_INDEX_CACHE_SIZE = 256  # Index gardés en mémoire par processus (immuables une fois l'analyse terminée)
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXPORT_FORMATS = {
+    # format -> (suffixe du fichier, type MIME)
+    'csv': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+_artifact_index_cache = OrderedDict()
+
+def iter_element_detail_rows(elements_path, verbosity="full"):
+    """Lignes de l'onglet Détails, dans l'ordre du rapport, relues depuis les résultats par élément.
+    
+    verbosity : comme ResultTable.rows.
+    """
+    full, rollup = verbosity == "full", verbosity == "rollup"
+    with open(elements_path, 'rb') as f:
+        slots = pickle.load(f)["detail_slots"]
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            for _, _, _, (ifc_class, floor, global_id, name, _, _, _, row_codes, row_values) in batch:
+                valid_params = 0
+                for code, value in zip(row_codes, row_values):
+                    if code >= 0 and not full:
+                        valid_params += rollup
+                        continue
+                    pset_name, param_name, status = detail_row(slots, code)
+                    yield (ifc_class, floor, global_id, name, pset_name, param_name, value, status)
+                if valid_params:
+                    yield (ifc_class, floor, global_id, name, "TOUS", "TOUS", valid_params_text(valid_params), "OK")
+
+def write_csv_export(elements_path, path):
+    with gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow(DETAILS_HEADERS)
+        writer.writerows(iter_element_detail_rows(elements_path))
+
+def write_parquet_export(elements_path, path, batch_size=50000):
+    schema = pyarrow.schema([(header, pyarrow.string()) for header in DETAILS_HEADERS])
+    
+    def write_batch(writer, rows):
+        columns = [[None if value is None else str(value) for value in column] for column in zip(*rows)]
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+    
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in iter_element_detail_rows(elements_path):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                write_batch(writer, batch)
+                batch = []
+        if batch:
+            write_batch(writer, batch)
+
+def write_exports(analysis_dir, output_path, exports):
+    """Écrit les exports demandés des lignes de détail ; retourne {format: chemin}."""
+    elements_path = os.path.join(analysis_dir, ELEMENTS_FILENAME)
+    base_name = os.path.splitext(os.path.basename(output_path))[0]
+    paths = {}
+    for export_format in exports:
+        path = os.path.join(analysis_dir, base_name + EXPORT_FORMATS[export_format][0])
+        if export_format == 'csv':
+            write_csv_export(elements_path, path)
+        else:
+            write_parquet_export(elements_path, path)
+        paths[export_format] = path
+    return paths
+
+# Index SQLite des lignes de détail, construit à la première consultation de /results
+DETAILS_INDEX_FILENAME = 'details.sqlite'
+RESULTS_PAGE_SIZE = 100
+RESULTS_MAX_PAGE_SIZE = 1000
+# Champs des lignes de /results et colonnes correspondantes de l'index
+DETAILS_INDEX_COLUMNS = {"type": "type", "floor": "floor", "id": "global_id", "name": "name",
+                         "pset": "pset", "param": "param", "value": "value", "status": "status"}
+DETAILS_INDEX_FILTERS = ("type", "floor", "pset", "param", "status")
+_details_index_lock = threading.Lock()
+_details_index_builds = {}  # Chemin de l'index -> verrou de sa construction
+
+def build_details_index(elements_path, path, verbosity="full"):
+    """Écrit l'index des lignes de l'onglet Détails, numérotées dans l'ordre du rapport (colonne row)."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        columns = ", ".join(f"{column} TEXT NOT NULL" for column in DETAILS_INDEX_COLUMNS.values())
+        connection.execute(f"CREATE TABLE details (row INTEGER PRIMARY KEY, {columns})")
+        placeholders = ", ".join("?" * (len(DETAILS_INDEX_COLUMNS) + 1))
+        connection.executemany(f"INSERT INTO details VALUES ({placeholders})", (
+            (row,) + tuple("" if value is None else str(value) for value in detail)
+            for row, detail in enumerate(iter_element_detail_rows(elements_path, verbosity), 1)))
+        # Index des filtres : pour un filtre seul, les lignes sortent déjà dans l'ordre du rapport
+        for name in DETAILS_INDEX_FILTERS:
+            connection.execute(f"CREATE INDEX details_{name} ON details ({DETAILS_INDEX_COLUMNS[name]})")
+        connection.commit()
+    except BaseException:
+        connection.close()
+        os.remove(tmp_path)
+        raise
+    connection.close()
+    os.replace(tmp_path, path)
+
+def write_details_index(analysis_dir, verbosity):
+    """Construit l'index des lignes de détail d'une analyse avec la verbosité de son rapport."""
+    start = time.perf_counter()
+    build_details_index(os.path.join(analysis_dir, ELEMENTS_FILENAME), os.path.join(analysis_dir, DETAILS_INDEX_FILENAME), verbosity)
+    print(f"Details index of {os.path.basename(analysis_dir)} built in {time.perf_counter() - start:.2f}s")
+
+def details_index(analysis_dir):
+    """Chemin de l'index des lignes de détail d'une analyse (mêmes lignes que l'onglet Détails).
+    
+    L'analyse le construit avec ses exports ; s'il manque encore (lecture pendant l'écriture du
+    rapport), il est construit ici, sans bloquer les requêtes des autres analyses.
+    """
+    path = os.path.join(analysis_dir, DETAILS_INDEX_FILENAME)
+    if os.path.exists(path):
+        return path
+    with _details_index_lock:
+        lock = _details_index_builds.setdefault(path, threading.Lock())
+    try:
+        with lock:
+            if not os.path.exists(path):
+                with open(os.path.join(analysis_dir, RESULT_FILENAME), encoding='utf-8') as f:
+                    verbosity = json.load(f).get("report", "full")
+                write_details_index(analysis_dir, verbosity)
+    finally:
+        with _details_index_lock:
+            _details_index_builds.pop(path, None)
+    return path
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, sort=None):
+    """Valeurs d'un curseur de pagination pour le tri sort ; lève ValueError s'il est invalide.
     
-    # Ajuster les largeurs des colonnes
-    for ws in workbook.worksheets:
-        for column in ws.columns:
-            max_length = 0
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[get_column_letter(column[0].column)].width = adjusted_width
-    
-    # Figer les volets dans l'onglet de détails
-    details.freeze_panes = 'A2'
-    
-    # Sauvegarder le fichier
-    print(f"Saving file... ({time.time() - start_time:.2f}s)")
-    workbook.save(output_file_path)
-    print(f"Analysis completed in {time.time() - start_time:.2f}s")
-    
-    # Préparation des données pour le dashboard
-    sorted_floors = sorted(floor_stats.items(), key=lambda x: sort_floor_name(x[0]))
-    return {
-        "total_elements": total_elements,
-        "valid_elements": valid_elements,
-        "missing_elements": invalid_elements,
-        "missing_psets": missing_psets,
-        "missing_params": missing_params,
-        "floors": [{"name": floor, "valid": stats["valid"], "invalid": stats["invalid"]} for floor, stats in sorted_floors],
-        "carbon_footprint": {
-            "total": total_carbon_footprint,
-            "by_type": dict(carbon_footprint_by_type),
-            "by_floor": dict(carbon_footprint_by_floor)
+    Les colonnes de l'index sont du texte, la colonne row un entier : toute autre valeur est refusée.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    value_type = str if sort else int
+    if any(type(value) is not expected for value, expected in zip(values, (value_type, int))):
+        raise ValueError("Invalid cursor")
+    return values
+
+def query_details(path, filters, sort=None, descending=False, cursor=None, limit=RESULTS_PAGE_SIZE):
+    """Page de lignes de détail filtrées ({champ: valeur}) et triées par un champ, puis dans l'ordre du rapport.
+    
+    La pagination suit un curseur (dernière valeur de tri, dernière ligne) : le coût d'une page ne
+    dépend pas de sa position. Retourne (lignes, curseur de la page suivante ou None, total filtré).
+    """
+    column = DETAILS_INDEX_COLUMNS[sort] if sort else "row"
+    conditions = [f"{DETAILS_INDEX_COLUMNS[name]} = ?" for name in filters]
+    params = list(filters.values())
+    where = " AND ".join(conditions) or "1"
+    direction, operator = ("DESC", "<") if descending else ("ASC", ">")
+    
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        total = connection.execute(f"SELECT COUNT(*) FROM details WHERE {where}", params).fetchone()[0]
+        page_conditions, page_params = list(conditions), list(params)
+        if cursor is not None:
+            page_conditions.append(f"({column}, row) {operator} (?, ?)")
+            page_params += cursor
+        fields = ", ".join(DETAILS_INDEX_COLUMNS.values())
+        rows = connection.execute(
+            f"SELECT row, {column}, {fields} FROM details WHERE {' AND '.join(page_conditions) or '1'} "
+            f"ORDER BY {column} {direction}, row {direction} LIMIT ?", page_params + [limit + 1]).fetchall()
+    finally:
+        connection.close()
+    
+    next_cursor = encode_cursor([rows[limit - 1][1], rows[limit - 1][0]]) if len(rows) > limit else None
+    return [dict(zip(DETAILS_INDEX_COLUMNS, row[2:])) for row in rows[:limit]], next_cursor, total
+
+def write_artifact_index(analysis_dir, output_path, export_paths):
+    """Indexe le rapport et les exports : nom, taille, date et SHA-256 (ETag des téléchargements)."""
+    files = {'xlsx': (output_path, XLSX_MIMETYPE)}
+    files.update((export_format, (path, EXPORT_FORMATS[export_format][1])) for export_format, path in export_paths.items())
+    index = {}
+    for name, (path, mimetype) in files.items():
+        index[name] = {
+            "filename": os.path.basename(path),
+            "mimetype": mimetype,
+            "size": os.path.getsize(path),
+            "modified": os.path.getmtime(path),
+            "sha256": file_sha256(path),
         }
+    with open(os.path.join(analysis_dir, ARTIFACTS_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    return index
+
+def read_artifact_index(analysis_id, analysis_dir):
+    with _job_lock:
+        if analysis_id in _artifact_index_cache:
+            _artifact_index_cache.move_to_end(analysis_id)
+            return _artifact_index_cache[analysis_id]
+    try:
+        with open(os.path.join(analysis_dir, ARTIFACTS_FILENAME), encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _job_lock:
+        _artifact_index_cache[analysis_id] = index
+        while len(_artifact_index_cache) > ARTIFACT_INDEX_CACHE_SIZE:
+            _artifact_index_cache.popitem(last=False)
+    return index
+
+def write_results(analysis_dir, results):
+    """Écrit les résultats d'une analyse ; remplacement atomique, ils peuvent être lus pendant l'analyse."""
+    path = os.path.join(analysis_dir, RESULT_FILENAME)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+def remove_sources(analysis_dir, *paths):
+    """Supprime les fichiers déposés une fois l'analyse terminée : seuls les rapports, les résultats
+    et elements.pickle (analyses incrémentales) sont conservés. Le classeur partagé d'un lot reste
+    dans le dossier du lot."""
+    for path in paths:
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(analysis_dir):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def run_analysis_job(analysis_id, analysis_dir, ifc_path, excel_path, output_path, ifc_sha256=None, previous_dir=None, exports=(),
+                     verbosity=REPORT_VERBOSITY):
+    """Exécute une analyse dans un processus de la file et publie son avancement.
+    
+    L'analyse reste en attente (queued) tant que les MAX_CONCURRENT_JOBS places d'exécution
+    sont prises. Une analyse incrémentale (previous_dir) ne passe pas par le cache de résultats :
+    son bilan de révision dépend de l'analyse de référence.
+    """
+    with job_slot():
+        return _run_analysis_job(analysis_id, analysis_dir, ifc_path, excel_path, output_path, ifc_sha256, previous_dir, exports,
+                                 verbosity)
+
+def _run_analysis_job(analysis_id, analysis_dir, ifc_path, excel_path, output_path, ifc_sha256, previous_dir, exports, verbosity):
+    def progress(phase, value=None, partial=None):
+        fields = dict(status="running", phase=phase, progress=value)
+        if partial is not None:
+            fields["partial"] = partial
+        write_job_status(analysis_dir, **fields)
+
+    def publish_results(results):
+        # Dashboard disponible pendant l'écriture du rapport Excel
+        write_results(analysis_dir, dict(results, analysis_id=analysis_id, cached=False))
+        write_job_status(analysis_dir, results_ready=True)
+
+    write_job_status(analysis_dir, status="running", phase="loading", progress=None, results_ready=False, started_at=time.time())
+    timer = PhaseTimer()
+    profiler = cProfile.Profile() if PROFILE_ANALYSES else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        cache_key = results = None
+        if previous_dir is None:
+            with timer.phase("cache"):
+                cache_key = result_cache_key(ifc_path, excel_path, ifc_sha256, verbosity)
+                results = load_cached_result(cache_key, output_path)
+        cached = results is not None
+        if cached:
+            print(f"Analysis {analysis_id} served from cache {cache_key}")
+        else:
+            results = process_files(analysis_dir, ifc_path, excel_path, output_path, progress=progress, timer=timer,
+                                    previous_dir=previous_dir, publish_results=publish_results, verbosity=verbosity)
+            if cache_key is not None:
+                store_cached_result(cache_key, results, output_path)
+        
+        # Exports demandés et index des fichiers téléchargeables
+        progress("artifacts")
+        with timer.phase("artifacts"):
+            # Index de /results : construit ici plutôt qu'à la première requête
+            try:
+                write_details_index(analysis_dir, verbosity)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Could not build details index of {analysis_id}: {str(e)}")
+            export_paths = write_exports(analysis_dir, output_path, exports)
+            write_artifact_index(analysis_dir, output_path, export_paths)
+    except Exception as e:
+        print(f"Error during analysis {analysis_id}: {str(e)}")
+        write_job_status(analysis_dir, status="error", phase="error", error=f"Analysis failed: {str(e)}")
+        return None
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(analysis_dir, PROFILE_FILENAME))
+        remove_sources(analysis_dir, ifc_path, excel_path)
+
+    results["analysis_id"] = analysis_id
+    results["cached"] = cached
+    results["timings"] = dict(timer.timings, total=timer.total())
+    write_results(analysis_dir, results)
+    write_job_status(analysis_dir, status="done", phase="done", progress=1.0, cached=cached, finished_at=time.time())
+    print(f"Analysis {analysis_id} completed successfully")
+    return results
+
+def get_job_executor():
+    global _job_executor
+    if _job_executor is None:
+        # 'spawn' évite de forker un worker gunicorn multi-threadé
+        _job_executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=MAX_CONCURRENT_JOBS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _job_executor
+
+def _on_job_done(analysis_id, analysis_dir, future):
+    global _job_executor
+    with _job_lock:
+        _pending_jobs.discard(analysis_id)
+        try:
+            with shared_state() as connection:
+                connection.execute("DELETE FROM jobs WHERE analysis_id = ?", (analysis_id,))
+        except sqlite3.Error as e:
+            print(f"Could not dequeue analysis {analysis_id}: {str(e)}")
+        try:
+            results = future.result()
+            record_analysis_metrics(results)
+        except concurrent.futures.process.BrokenProcessPool as e:
+            # Un processus a été tué (mémoire...) : le pool est inutilisable, on le recrée
+            print(f"Job pool broken by analysis {analysis_id}: {str(e)}")
+            _job_executor = None
+            record_analysis_metrics(None)
+            write_job_status(analysis_dir, status="error", phase="error", error="Analysis worker crashed")
+        except Exception as e:
+            print(f"Unexpected error in analysis {analysis_id}: {str(e)}")
+            record_analysis_metrics(None)
+            write_job_status(analysis_dir, status="error", phase="error", error=str(e))
+
+# Métriques des analyses de tous les workers, exposées au format Prometheus sur /metrics
+PHASE_DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def increment_metrics(connection, increments):
+    """Ajoute des incréments [(nom, libellé, valeur)] aux métriques partagées."""
+    connection.executemany("INSERT INTO metrics VALUES (?, ?, ?) "
+                           "ON CONFLICT (name, label) DO UPDATE SET value = value + excluded.value", increments)
+
+def duration_increments(phase, seconds):
+    increments = [("phase_bucket", f"{phase}:{i}", 1) for i, bound in enumerate(PHASE_DURATION_BUCKETS) if seconds <= bound]
+    return increments + [("phase_sum", phase, seconds), ("phase_count", phase, 1)]
+
+def record_analysis_metrics(results):
+    """Comptabilise une analyse terminée."""
+    if results is None:
+        increments = [("analyses", "error", 1)]
+    else:
+        # Analyses incrémentales et cache désactivé : pas de consultation du cache
+        if "revision" in results or RESULT_CACHE_MAX_BYTES <= 0:
+            lookup = "bypasses"
+        else:
+            lookup = "hits" if results["cached"] else "misses"
+        increments = [("analyses", "done", 1), ("result_cache", lookup, 1)]
+        for phase, seconds in results.get("timings", {}).items():
+            increments += duration_increments(phase, seconds)
+    try:
+        with shared_state() as connection:
+            increment_metrics(connection, increments)
+    except sqlite3.Error as e:
+        print(f"Could not record analysis metrics: {str(e)}")
+
+def read_metrics():
+    """{nom: {libellé: valeur}} des métriques partagées."""
+    metrics = defaultdict(dict)
+    with shared_state() as connection:
+        for name, label, value in connection.execute("SELECT name, label, value FROM metrics"):
+            metrics[name][label] = value
+    return metrics
+
+def result_cache_stats(metrics=None):
+    metrics = read_metrics() if metrics is None else metrics
+    return {key: int(metrics["result_cache"].get(key, 0)) for key in ("hits", "misses", "bypasses")}
+
+def render_metrics():
+    """Texte d'exposition Prometheus des compteurs et histogrammes."""
+    metrics = read_metrics()
+    with shared_state() as connection:
+        pending = pending_job_count(connection)
+    cache_stats = result_cache_stats(metrics)
+    lines = [
+        "# HELP checkers_analyses_total Analyses terminées par statut.",
+        "# TYPE checkers_analyses_total counter",
+    ]
+    for job_status, count in sorted(metrics["analyses"].items()):
+        lines.append(f'checkers_analyses_total{{status="{job_status}"}} {int(count)}')
+    lines += [
+        "# HELP checkers_result_cache_total Analyses terminées par résultat de la consultation du cache (bypass : sans consultation).",
+        "# TYPE checkers_result_cache_total counter",
+        f'checkers_result_cache_total{{result="hit"}} {cache_stats["hits"]}',
+        f'checkers_result_cache_total{{result="miss"}} {cache_stats["misses"]}',
+        f'checkers_result_cache_total{{result="bypass"}} {cache_stats["bypasses"]}',
+        "# HELP checkers_jobs_pending Analyses en cours ou en attente.",
+        "# TYPE checkers_jobs_pending gauge",
+        f"checkers_jobs_pending {pending}",
+        "# HELP checkers_phase_duration_seconds Durée des phases d'analyse.",
+        "# TYPE checkers_phase_duration_seconds histogram",
+    ]
+    for phase, count in sorted(metrics["phase_count"].items()):
+        for i, bound in enumerate(PHASE_DURATION_BUCKETS):
+            lines.append(f'checkers_phase_duration_seconds_bucket{{phase="{phase}",le="{bound}"}} '
+                         f'{int(metrics["phase_bucket"].get(f"{phase}:{i}", 0))}')
+        lines.append(f'checkers_phase_duration_seconds_bucket{{phase="{phase}",le="+Inf"}} {int(count)}')
+        lines.append(f'checkers_phase_duration_seconds_sum{{phase="{phase}"}} {metrics["phase_sum"][phase]}')
+        lines.append(f'checkers_phase_duration_seconds_count{{phase="{phase}"}} {int(count)}')
+    return "\n".join(lines) + "\n"
+
+def job_queue_full():
+    with shared_state() as connection:
+        return pending_job_count(connection) >= MAX_CONCURRENT_JOBS + MAX_QUEUED_JOBS
+
+def submit_analyses(jobs):
+    """Place des analyses dans la file bornée, toutes ou aucune ; lève JobQueueFull si elle est pleine.
+    
+    jobs : arguments de run_analysis_job de chaque analyse.
+    """
+    # La file est comptée dans l'état partagé : les autres workers n'admettent rien pendant la soumission
+    with _job_lock, shared_state() as connection:
+        if pending_job_count(connection) + len(jobs) > MAX_CONCURRENT_JOBS + MAX_QUEUED_JOBS:
+            raise JobQueueFull()
+        futures = []
+        for job in jobs:
+            analysis_id, analysis_dir = job[:2]
+            previous_dir = job[6]
+            write_job_status(analysis_dir, status="queued", phase="queued", progress=None, queued_at=time.time(),
+                             previous_analysis_id=os.path.basename(previous_dir) if previous_dir else None)
+            futures.append((analysis_id, analysis_dir, get_job_executor().submit(run_analysis_job, *job)))
+            _pending_jobs.add(analysis_id)
+            connection.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?)", (analysis_id, os.getpid()))
+    for analysis_id, analysis_dir, future in futures:
+        future.add_done_callback(functools.partial(_on_job_done, analysis_id, analysis_dir))
+
+def submit_analysis(analysis_id, analysis_dir, ifc_path, excel_path, output_path, ifc_sha256=None, previous_dir=None, exports=(),
+                    verbosity=REPORT_VERBOSITY):
+    """Place une analyse dans la file bornée ; lève JobQueueFull si elle est pleine."""
+    submit_analyses([(analysis_id, analysis_dir, ifc_path, excel_path, output_path, ifc_sha256, previous_dir, exports, verbosity)])
+
+# Analyses fédérées : plusieurs modèles (architecture, structure, fluides...) contre un même classeur d'exigences
+BATCH_FILENAME = 'batch.json'
+COMBINED_REPORT_FILENAME = 'combined.xlsx'
+BATCH_MAX_MODELS = int(os.environ.get('CHECKERS_BATCH_MAX_MODELS', 20))
+BATCH_MAX_ARCHIVE_BYTES = int(os.environ.get('CHECKERS_BATCH_MAX_ARCHIVE_MB', 2048)) * 1024 * 1024  # Taille décompressée maximale d'une archive
+BATCH_MAX_UPLOAD_BYTES = int(os.environ.get('CHECKERS_BATCH_MAX_UPLOAD_MB', 2048)) * 1024 * 1024  # Taille maximale d'une requête /upload/batch
+_combined_report_lock = threading.Lock()
+
+def extract_ifc_archive(archive_path, directory):
+    """Extrait les fichiers .ifc d'une archive zip ; retourne [(nom, UploadStream)].
+    
+    Chaque modèle passe par un UploadStream : même contrôle d'en-tête et même hachage
+    que les fichiers envoyés directement.
+    """
+    models = []
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [member for member in archive.infolist()
+                   if not member.is_dir() and member.filename.lower().endswith('.ifc')]
+        if sum(member.file_size for member in members) > BATCH_MAX_ARCHIVE_BYTES:
+            raise InvalidUpload("Archive too large once extracted")
+        for member in members:
+            name = os.path.basename(member.filename)
+            stream = UploadStream(directory, name)
+            try:
+                with archive.open(member) as source:
+                    shutil.copyfileobj(source, stream, 1024 * 1024)
+            except InvalidUpload as e:
+                raise InvalidUpload(f"{name}: {str(e)}")
+            models.append((name, stream))
+    return models
+
+def write_batch(batch_dir, batch):
+    path = os.path.join(batch_dir, BATCH_FILENAME)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(batch, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+def read_batch(batch_id):
+    """Retourne (dossier, description) d'une analyse fédérée, ou (None, None) si elle n'existe pas."""
+    batch_dir = get_analysis_dir(batch_id)
+    if batch_dir is None:
+        return None, None
+    try:
+        with open(os.path.join(batch_dir, BATCH_FILENAME), encoding='utf-8') as f:
+            return batch_dir, json.load(f)
+    except (OSError, ValueError):
+        return None, None
+
+def batch_model_states(batch):
+    """État de chaque modèle d'une analyse fédérée, avec ses résultats une fois terminé."""
+    models = []
+    for model in batch["models"]:
+        analysis_dir = os.path.join(TEMP_FOLDER, model["analysis_id"])
+        job_status = read_job_status(analysis_dir) or {"status": "error", "error": "Analysis not found"}
+        state = dict(model, status=job_status.get("status"), phase=job_status.get("phase"), progress=job_status.get("progress"))
+        if job_status.get("error"):
+            state["error"] = job_status["error"]
+        if state["status"] == "done":
+            try:
+                with open(os.path.join(analysis_dir, RESULT_FILENAME), encoding='utf-8') as f:
+                    state["results"] = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading results of {model['analysis_id']}: {str(e)}")
+                state.update(status="error", error="Results not available")
+        models.append(state)
+    return models
+
+def batch_status_of(models):
+    statuses = {model["status"] for model in models}
+    if statuses & {"queued", "running"}:
+        return "queued" if statuses == {"queued"} else "running"
+    return "done" if statuses == {"done"} else "error"
+
+def combine_results(models):
+    """Résultats cumulés des modèles d'une analyse fédérée ; étages et types de même nom sont additionnés."""
+    combined = {key: sum(model["results"][key] for model in models)
+                for key in ("total_elements", "valid_elements", "missing_elements", "missing_psets", "missing_params", "detail_rows")}
+    floor_stats = defaultdict(lambda: {"valid": 0, "invalid": 0})
+    type_stats = defaultdict(lambda: {"total": 0, "valid": 0, "invalid": 0})
+    carbon_by_type = defaultdict(float)
+    carbon_by_floor = defaultdict(float)
+    carbon_by_material = defaultdict(float)
+    carbon_by_type_material = defaultdict(float)
+    materials = {}
+    for model in models:
+        results = model["results"]
+        for floor in results["floors"]:
+            floor_stats[floor["name"]]["valid"] += floor["valid"]
+            floor_stats[floor["name"]]["invalid"] += floor["invalid"]
+        for element_type in results["types"]:
+            for key in ("total", "valid", "invalid"):
+                type_stats[element_type["name"]][key] += element_type[key]
+        for element_type, carbon in results["carbon_footprint"]["by_type"].items():
+            carbon_by_type[element_type] += carbon
+        for floor, carbon in results["carbon_footprint"]["by_floor"].items():
+            carbon_by_floor[floor] += carbon
+        for material, carbon in results["carbon_footprint"]["by_material"].items():
+            carbon_by_material[material] += carbon
+        for group in results["carbon_footprint"]["by_type_material"]:
+            carbon_by_type_material[(group["type"], group["material"])] += group["carbon"]
+        for material, data in results["carbon_footprint"]["materials"].items():
+            materials.setdefault(material, data)
+    
+    combined["floors"] = [dict(stats, name=floor) for floor, stats in sorted(floor_stats.items(), key=lambda x: sort_floor_name(x[0]))]
+    combined["types"] = [dict(stats, name=element_type) for element_type, stats in sorted(type_stats.items())]
+    combined["carbon_footprint"] = {
+        "total": sum(model["results"]["carbon_footprint"]["total"] for model in models),
+        "by_type": dict(carbon_by_type),
+        "by_floor": dict(carbon_by_floor),
+        "by_material": dict(carbon_by_material),
+        "by_type_material": [{"type": element_type, "material": material, "carbon": carbon}
+                             for (element_type, material), carbon in carbon_by_type_material.items()],
+        "materials": materials,
     }
+    combined["models"] = [{
+        "name": model["name"],
+        "analysis_id": model["analysis_id"],
+        "total_elements": model["results"]["total_elements"],
+        "valid_elements": model["results"]["valid_elements"],
+        "missing_elements": model["results"]["missing_elements"],
+        "carbon_footprint": model["results"]["carbon_footprint"]["total"],
+    } for model in models]
+    return combined
+
+def create_models_sheet(workbook, combined):
+    """Onglet de répartition par modèle d'une analyse fédérée."""
+    sheet = workbook.create_sheet("Modèles")
+    rows = [[(header, "header") for header in ["Modèle", "Total", "Valides", "Invalides", "Taux de validité", "Empreinte carbone (kg CO2e)"]]]
+    for model in combined["models"]:
+        total = model["total_elements"]
+        valid_rate = model["valid_elements"] / total if total > 0 else 0
+        rows.append([
+            (model["name"], "label"),
+            (total, "value"),
+            (model["valid_elements"], "value"),
+            (model["missing_elements"], "value"),
+            (valid_rate, rate_style(valid_rate)),
+            (f"{model['carbon_footprint']:.2f}", "carbon_right"),
+        ])
+    set_column_widths(sheet, column_widths(rows))
+    sheet.freeze_panes = 'A2'
+    write_styled_rows(sheet, rows)
+
+def write_combined_report(path, combined):
+    """Rapport Excel d'une analyse fédérée : résumé cumulé, répartition par modèle et bilan carbone."""
+    workbook = Workbook(write_only=True)
+    register_report_styles(workbook)
+    create_results_summary_sheet(workbook, combined)
+    create_models_sheet(workbook, combined)
+    create_carbon_footprint_sheet(workbook, combined["carbon_footprint"])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+
+# Nettoyage de TEMP_FOLDER : dossiers d'analyse et de lot expirés ou au-delà du quota
+TEMP_TTL_HOURS = float(os.environ.get('CHECKERS_TEMP_TTL_HOURS', 24))  # Durée de vie depuis la dernière modification (0 : illimitée)
+TEMP_QUOTA_MB = int(os.environ.get('CHECKERS_TEMP_QUOTA_MB', 0))  # Taille maximale des dossiers d'analyse et de lot (0 : illimitée)
+JANITOR_INTERVAL = int(os.environ.get('CHECKERS_JANITOR_INTERVAL', 300))  # Secondes entre deux passages (0 désactive le nettoyage)
+INCOMPLETE_DIR_GRACE = 3600  # Dossier sans état (réception en cours) conservé une heure
+JANITOR_LOCK_FILENAME = '.janitor.lock'
+_janitor_started = False
+
+class TempEntry(NamedTuple):
+    name: str
+    path: str
+    modified: float
+    status: dict  # État de l'analyse, None pour un lot ou un dossier en cours de réception
+    batch: dict  # Description du lot, None pour une analyse
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+def temp_entries():
+    """Dossiers d'analyse et de lot de TEMP_FOLDER (les caches .cache et .rulebooks sont ignorés)."""
+    entries = []
+    for name in os.listdir(TEMP_FOLDER):
+        try:
+            uuid.UUID(name)
+        except ValueError:
+            continue
+        path = os.path.join(TEMP_FOLDER, name)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            continue
+        batch = read_batch(name)[1]
+        entries.append(TempEntry(name, path, modified, None if batch else read_job_status(path), batch))
+    return entries
+
+def protected_entries(entries, now):
+    """Noms des dossiers à conserver : analyses en attente ou en cours (sauf état figé depuis le TTL),
+    leurs analyses de référence, les lots dont un modèle est conservé et les réceptions en cours."""
+    ttl = TEMP_TTL_HOURS * 3600
+    protected = set()
+    for entry in entries:
+        age = now - entry.modified
+        if entry.batch is not None:
+            continue
+        status = (entry.status or {}).get("status")
+        if status is None:
+            if age < INCOMPLETE_DIR_GRACE:
+                protected.add(entry.name)
+        elif status in ("queued", "running") and (not ttl or age < ttl):
+            protected.add(entry.name)
+            if entry.status.get("previous_analysis_id"):
+                protected.add(entry.status["previous_analysis_id"])
+    for entry in entries:
+        if entry.batch is not None and any(model["analysis_id"] in protected for model in entry.batch["models"]):
+            protected.add(entry.name)
+    return protected
+
+def remove_temp_entry(entry, reason):
+    print(f"Removing {reason} {'batch' if entry.batch is not None else 'analysis'} directory {entry.name}")
+    shutil.rmtree(entry.path, ignore_errors=True)
+    with _job_lock:
+        _artifact_index_cache.pop(entry.name, None)
+
+def sweep_temp_folder(now=None):
+    """Supprime les dossiers expirés (TEMP_TTL_HOURS), puis les plus anciens au-delà de TEMP_QUOTA_MB.
+    
+    Retourne le nombre de dossiers supprimés.
+    """
+    now = now or time.time()
+    entries = temp_entries()
+    protected = protected_entries(entries, now)
+    candidates = sorted((entry for entry in entries if entry.name not in protected), key=lambda entry: entry.modified)
+    
+    removed = 0
+    if TEMP_TTL_HOURS:
+        expired = [entry for entry in candidates if now - entry.modified > TEMP_TTL_HOURS * 3600]
+        for entry in expired:
+            remove_temp_entry(entry, "expired")
+        removed += len(expired)
+        candidates = candidates[len(expired):]
+    
+    if TEMP_QUOTA_MB:
+        quota = TEMP_QUOTA_MB * 1024 * 1024
+        sizes = {entry.name: directory_size(entry.path) for entry in entries}
+        total = sum(size for name, size in sizes.items() if name in protected) + sum(sizes[entry.name] for entry in candidates)
+        for entry in candidates:
+            if total <= quota:
+                break
+            remove_temp_entry(entry, "over quota")
+            total -= sizes[entry.name]
+            removed += 1
+        if total > quota:
+            print(f"Temp folder still over quota ({total / (1024 * 1024):.0f} MB): remaining analyses are in progress")
+    return removed
+
+def janitor_sweep():
+    """Un passage du nettoyage, sauf si un autre worker est en train de le faire."""
+    with open(os.path.join(TEMP_FOLDER, JANITOR_LOCK_FILENAME), 'a') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0
+        return sweep_temp_folder()
+
+def janitor_loop():
+    while True:
+        try:
+            removed = janitor_sweep()
+            if removed:
+                print(f"Temp folder sweep removed {removed} directories")
+        except Exception as e:
+            print(f"Temp folder sweep failed: {str(e)}")
+        time.sleep(JANITOR_INTERVAL)
+
+def start_janitor():
+    """Démarre le nettoyage périodique de TEMP_FOLDER, premier passage immédiat ; une fois par processus."""
+    global _janitor_started
+    if _janitor_started or not JANITOR_INTERVAL or not (TEMP_TTL_HOURS or TEMP_QUOTA_MB):
+        return
+    _janitor_started = True
+    threading.Thread(target=janitor_loop, name="temp-janitor", daemon=True).start()
+
+# Démarrage : préparation avant le fork des workers gunicorn (--preload), puis une fois par worker
+WARM_UP = os.environ.get('CHECKERS_WARM_UP', '1') == '1'
+DEFAULT_REQUIREMENTS_PATH = os.environ.get('CHECKERS_DEFAULT_REQUIREMENTS',
+                                           os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parametres_requis.xlsx'))
+# Modules importés à la première utilisation, chargés d'avance par le préchauffage
+ANALYSIS_MODULES = ("pandas", "openpyxl.chart", "ifcopenshell.geom", "ifcopenshell.util.element", "ifcopenshell.util.shape")
+_worker_started = False
+_worker_start_lock = threading.Lock()
+
+def warm_up():
+    """Importe les modules d'analyse, puis charge la base carbone et compile les exigences par défaut."""
+    start = time.perf_counter()
+    try:
+        for name in ANALYSIS_MODULES:
+            importlib.import_module(name)
+        default_carbon_database()
+        if os.path.exists(DEFAULT_REQUIREMENTS_PATH):
+            compile_requirements(DEFAULT_REQUIREMENTS_PATH)
+    except Exception as e:
+        print(f"Warm-up failed: {str(e)}")
+        return
+    print(f"Process {os.getpid()} warmed up in {time.perf_counter() - start:.2f}s")
+
+def create_app():
+    """Application WSGI : `gunicorn --preload "Checkers:create_app()"`.
+    
+    Avec --preload, l'appel a lieu une fois dans le processus maître et les workers forkés héritent
+    des modules importés et des exigences compilées. Aucun thread ni processus n'est démarré ici :
+    chacun ne survivrait pas au fork, voir init_worker.
+    """
+    create_folders()
+    if WARM_UP:
+        warm_up()
+    return app
+
+def init_worker():
+    """Démarre, une fois par processus servant des requêtes, le nettoyage de TEMP_FOLDER et,
+    avec CHECKERS_WARM_UP, les processus d'analyse, préchauffés avant la première analyse."""
+    global _worker_started
+    with _worker_start_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+    create_folders()
+    start_janitor()
+    if WARM_UP:
+        with _job_lock:
+            executor = get_job_executor()
+        for _ in range(MAX_CONCURRENT_JOBS):
+            executor.submit(warm_up)
+
+@app.before_request
+def start_worker():
+    if not _worker_started:
+        init_worker()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.errorhandler(413)
+def request_too_large(e):
+    limit = request.max_content_length
+    return jsonify({"error": f"Request too large (max {limit // (1024 * 1024)} MB for the whole request)"}), 413
+
 @app.route('/upload', methods=['POST'])
 def upload():
     try:
         print("Starting upload...")
-        if 'ifc_file' not in request.files or 'excel_file' not in request.files:
-            print("Missing files in request")
-            return jsonify({"error": "Missing file"}), 400
-        
-        ifc_file = request.files['ifc_file']
-        excel_file = request.files['excel_file']
-        
-        print(f"Received files: IFC={ifc_file.filename}, Excel={excel_file.filename}")
+        if job_queue_full():
+            print("Analysis queue is full")
+            return jsonify({"error": "Too many analyses in progress, please retry later"}), 503, {"Retry-After": "30"}
         
-        if ifc_file.filename == '' or excel_file.filename == '':
-            print("Empty filenames")
-            return jsonify({"error": "No selected file"}), 400
-        
-        if not allowed_file(ifc_file.filename) or not allowed_file(excel_file.filename):
-            print("Invalid file types")
-            return jsonify({"error": "Invalid file type"}), 400
-        
-        # Générer un ID unique pour cette analyse
+        # Générer un ID unique pour cette analyse ; les fichiers y sont écrits pendant la réception
         analysis_id = str(uuid.uuid4())
         analysis_dir = os.path.join(TEMP_FOLDER, analysis_id)
         print(f"Creating analysis directory: {analysis_dir}")
@@ -949,50 +3097,472 @@ def upload():
         except Exception as e:
             print(f"Error creating analysis directory: {str(e)}")
             return jsonify({"error": f"Could not create analysis directory: {str(e)}"}), 500
+        request.upload_dir = analysis_dir
         
-        # Sauvegarder les fichiers
-        ifc_path = os.path.join(analysis_dir, secure_filename(ifc_file.filename))
-        excel_path = os.path.join(analysis_dir, secure_filename(excel_file.filename))
-        output_path = os.path.join(analysis_dir, f'output_{os.path.splitext(ifc_file.filename)[0]}.xlsx')
+        try:
+            response = receive_analysis(analysis_id, analysis_dir)
+        except Exception:
+            shutil.rmtree(analysis_dir, ignore_errors=True)
+            raise
+        if response[1] != 202:
+            shutil.rmtree(analysis_dir, ignore_errors=True)
+        return response
         
-        print(f"Saving files to: {ifc_path}, {excel_path}")
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        print(f"Unexpected error during upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def requested_exports():
+    """Formats du champ `exports` du formulaire ; lève ValueError pour un format indisponible."""
+    exports = [export_format.strip() for export_format in request.form.get('exports', '').split(',') if export_format.strip()]
+    unknown_formats = [export_format for export_format in exports if export_format not in EXPORT_FORMATS]
+    if unknown_formats:
+        raise ValueError(f"Unknown export format: {', '.join(unknown_formats)}")
+    if 'parquet' in exports and pyarrow is None:
+        raise ValueError("Parquet export is not available (pyarrow is not installed)")
+    return exports
+
+def requested_verbosity():
+    """Verbosité du champ `report` du formulaire ; lève ValueError pour une valeur inconnue."""
+    verbosity = request.form.get('report', '').strip() or REPORT_VERBOSITY
+    if verbosity not in REPORT_VERBOSITIES:
+        raise ValueError(f"Unknown report verbosity: {verbosity} (expected {', '.join(REPORT_VERBOSITIES)})")
+    return verbosity
+
+def receive_analysis(analysis_id, analysis_dir):
+    """Reçoit les fichiers du formulaire d'upload dans analysis_dir et place l'analyse dans la file."""
+    try:
+        files = request.files
+    except InvalidUpload as e:
+        print(f"Upload rejected: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    
+    if 'ifc_file' not in files or 'excel_file' not in files:
+        print("Missing files in request")
+        return jsonify({"error": "Missing file"}), 400
+    
+    ifc_file = files['ifc_file']
+    excel_file = files['excel_file']
+    
+    print(f"Received files: IFC={ifc_file.filename}, Excel={excel_file.filename}")
+    
+    if ifc_file.filename == '' or excel_file.filename == '':
+        print("Empty filenames")
+        return jsonify({"error": "No selected file"}), 400
+    
+    if not allowed_file(ifc_file.filename) or not allowed_file(excel_file.filename):
+        print("Invalid file types")
+        return jsonify({"error": "Invalid file type"}), 400
+    
+    # Exports bruts des lignes de détail en plus du rapport Excel
+    try:
+        exports = requested_exports()
+        verbosity = requested_verbosity()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Analyse incrémentale par rapport à une analyse précédente du modèle
+    previous_dir = None
+    previous_analysis_id = request.form.get('previous_analysis_id')
+    if previous_analysis_id:
+        previous_dir = get_analysis_dir(previous_analysis_id)
+        if previous_dir is None or not os.path.exists(os.path.join(previous_dir, ELEMENTS_FILENAME)):
+            print(f"Previous analysis {previous_analysis_id} not found")
+            return jsonify({"error": "Previous analysis not found"}), 404
+    
+    # Déplacer les fichiers reçus à leur nom définitif
+    ifc_path = os.path.join(analysis_dir, secure_filename(ifc_file.filename))
+    excel_path = os.path.join(analysis_dir, secure_filename(excel_file.filename))
+    output_path = os.path.join(analysis_dir, f'output_{os.path.splitext(ifc_file.filename)[0]}.xlsx')
+    
+    print(f"Saving files to: {ifc_path}, {excel_path}")
+    try:
+        ifc_sha256 = ifc_file.stream.save(ifc_path)
+        excel_file.stream.save(excel_path)
+    except InvalidUpload as e:
+        print(f"Upload rejected: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error saving files: {str(e)}")
+        return jsonify({"error": f"Could not save files: {str(e)}"}), 500
+    
+    # Placer l'analyse dans la file
+    try:
+        submit_analysis(analysis_id, analysis_dir, ifc_path, excel_path, output_path, ifc_sha256, previous_dir, exports, verbosity)
+    except JobQueueFull:
+        print("Analysis queue is full")
+        return jsonify({"error": "Too many analyses in progress, please retry later"}), 503, {"Retry-After": "30"}
+    
+    print(f"Analysis {analysis_id} queued (IFC schema {ifc_file.stream.schema}, {ifc_file.stream.size} bytes)")
+    return jsonify({
+        "analysis_id": analysis_id,
+        "status": "queued",
+        "status_url": url_for('status', analysis_id=analysis_id),
+        "download_url": url_for('download', analysis_id=analysis_id)
+    }), 202
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    try:
+        print("Starting batch upload...")
+        if job_queue_full():
+            print("Analysis queue is full")
+            return jsonify({"error": "Too many analyses in progress, please retry later"}), 503, {"Retry-After": "30"}
+        
+        batch_id = str(uuid.uuid4())
+        batch_dir = os.path.join(TEMP_FOLDER, batch_id)
+        print(f"Creating batch directory: {batch_dir}")
         try:
-            ifc_file.save(ifc_path)
-            excel_file.save(excel_path)
+            os.makedirs(batch_dir, exist_ok=True)
         except Exception as e:
-            print(f"Error saving files: {str(e)}")
-            return jsonify({"error": f"Could not save files: {str(e)}"}), 500
+            print(f"Error creating batch directory: {str(e)}")
+            return jsonify({"error": f"Could not create batch directory: {str(e)}"}), 500
+        request.upload_dir = batch_dir
         
-        # Analyser les fichiers
-        print("Starting analysis...")
+        # Dossiers d'analyse des modèles, supprimés avec le lot si celui-ci est refusé
+        model_dirs = []
         try:
-            results = process_files(analysis_dir, ifc_path, excel_path, output_path)
-            results["analysis_id"] = analysis_id
-            print("Analysis completed successfully")
-            return jsonify(results)
-        except Exception as e:
-            print(f"Error during analysis: {str(e)}")
-            return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+            response = receive_batch(batch_id, batch_dir, model_dirs)
+        except Exception:
+            for directory in [batch_dir] + model_dirs:
+                shutil.rmtree(directory, ignore_errors=True)
+            raise
+        if response[1] != 202:
+            for directory in [batch_dir] + model_dirs:
+                shutil.rmtree(directory, ignore_errors=True)
+        return response
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"Unexpected error during upload: {str(e)}")
+        print(f"Unexpected error during batch upload: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/download/<analysis_id>')
-def download(analysis_id):
+def receive_batch(batch_id, batch_dir, model_dirs):
+    """Reçoit les modèles d'une analyse fédérée et place une analyse par modèle dans la file.
+    
+    Les modèles sont envoyés dans le champ `ifc_files` (plusieurs fichiers .ifc et/ou archives .zip),
+    le classeur d'exigences commun dans `excel_file`.
+    """
+    try:
+        files = request.files
+    except InvalidUpload as e:
+        print(f"Upload rejected: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    
+    ifc_files = [ifc_file for ifc_file in files.getlist('ifc_files') if ifc_file.filename]
+    excel_file = files.get('excel_file')
+    if not ifc_files or excel_file is None or excel_file.filename == '':
+        print("Missing files in request")
+        return jsonify({"error": "Missing file"}), 400
+    
+    print(f"Received batch: IFC={[ifc_file.filename for ifc_file in ifc_files]}, Excel={excel_file.filename}")
+    
+    if not allowed_file(excel_file.filename) or not all(
+            allowed_file(ifc_file.filename) or ifc_file.filename.lower().endswith('.zip') for ifc_file in ifc_files):
+        print("Invalid file types")
+        return jsonify({"error": "Invalid file type"}), 400
+    
+    try:
+        exports = requested_exports()
+        verbosity = requested_verbosity()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Réception du classeur et des modèles, archives extraites
+    excel_path = os.path.join(batch_dir, secure_filename(excel_file.filename))
+    models = []
+    try:
+        excel_file.stream.save(excel_path)
+        for ifc_file in ifc_files:
+            if ifc_file.filename.lower().endswith('.zip'):
+                archive_path = os.path.join(batch_dir, secure_filename(ifc_file.filename))
+                ifc_file.stream.save(archive_path)
+                models += extract_ifc_archive(archive_path, batch_dir)
+                os.remove(archive_path)
+            else:
+                models.append((ifc_file.filename, ifc_file.stream))
+    except InvalidUpload as e:
+        print(f"Upload rejected: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except zipfile.BadZipFile:
+        print("Invalid zip archive")
+        return jsonify({"error": "Invalid zip archive"}), 400
+    except Exception as e:
+        print(f"Error saving files: {str(e)}")
+        return jsonify({"error": f"Could not save files: {str(e)}"}), 500
+    
+    if not models:
+        return jsonify({"error": "No IFC file in request"}), 400
+    if len(models) > BATCH_MAX_MODELS:
+        return jsonify({"error": f"Too many models in batch (max {BATCH_MAX_MODELS})"}), 400
+    
+    # Exigences compilées une seule fois : les analyses du lot les lisent depuis le cache
     try:
+        compile_requirements(excel_path)
+    except Exception as e:
+        print(f"Invalid requirements file: {str(e)}")
+        return jsonify({"error": f"Invalid requirements file: {str(e)}"}), 400
+    
+    jobs = []
+    batch_models = []
+    names = Counter()
+    for name, stream in models:
+        analysis_id = str(uuid.uuid4())
         analysis_dir = os.path.join(TEMP_FOLDER, analysis_id)
-        if not os.path.exists(analysis_dir):
+        os.makedirs(analysis_dir, exist_ok=True)
+        model_dirs.append(analysis_dir)
+        
+        filename = secure_filename(name) or 'model.ifc'
+        ifc_path = os.path.join(analysis_dir, filename)
+        output_path = os.path.join(analysis_dir, f'output_{os.path.splitext(filename)[0]}.xlsx')
+        try:
+            ifc_sha256 = stream.save(ifc_path)
+        except InvalidUpload as e:
+            print(f"Upload rejected: {name}: {str(e)}")
+            return jsonify({"error": f"{name}: {str(e)}"}), 400
+        
+        names[name] += 1
+        if names[name] > 1:
+            name = f"{name} ({names[name]})"
+        write_job_status(analysis_dir, batch_id=batch_id)
+        jobs.append((analysis_id, analysis_dir, ifc_path, excel_path, output_path, ifc_sha256, None, exports, verbosity))
+        batch_models.append({"name": name, "analysis_id": analysis_id})
+    
+    write_batch(batch_dir, {"batch_id": batch_id, "requirements": os.path.basename(excel_path), "models": batch_models,
+                            "created_at": time.time()})
+    try:
+        submit_analyses(jobs)
+    except JobQueueFull:
+        print("Analysis queue is full")
+        return jsonify({"error": "Too many analyses in progress, please retry later"}), 503, {"Retry-After": "30"}
+    
+    print(f"Batch {batch_id} queued ({len(jobs)} models)")
+    return jsonify({
+        "batch_id": batch_id,
+        "status": "queued",
+        "models": [dict(model, status_url=url_for('status', analysis_id=model["analysis_id"])) for model in batch_models],
+        "status_url": url_for('batch_status', batch_id=batch_id),
+        "download_url": url_for('download_batch', batch_id=batch_id)
+    }), 202
+
+@app.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    batch_dir, batch = read_batch(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    
+    models = batch_model_states(batch)
+    response = {"batch_id": batch_id, "status": batch_status_of(models), "models": []}
+    for model in models:
+        model["status_url"] = url_for('status', analysis_id=model["analysis_id"])
+        if model["status"] == "done":
+            model["download_url"] = url_for('download', analysis_id=model["analysis_id"])
+        response["models"].append(model)
+    if response["status"] == "done":
+        response["results"] = combine_results(models)
+        response["download_url"] = url_for('download_batch', batch_id=batch_id)
+    return jsonify(response)
+
+@app.route('/batch/<batch_id>/download')
+def download_batch(batch_id):
+    try:
+        batch_dir, batch = read_batch(batch_id)
+        if batch is None:
+            return jsonify({"error": "Batch not found"}), 404
+        
+        models = batch_model_states(batch)
+        batch_state = batch_status_of(models)
+        if batch_state != "done":
+            return jsonify({"error": "Batch not finished", "status": batch_state}), 409
+        
+        # Rapport combiné construit au premier téléchargement, à partir des résultats des modèles
+        report_path = os.path.join(batch_dir, COMBINED_REPORT_FILENAME)
+        with _combined_report_lock:
+            if not os.path.exists(report_path):
+                write_combined_report(report_path, combine_results(models))
+        return send_file(report_path, mimetype=XLSX_MIMETYPE, as_attachment=True,
+                         download_name=f"combined_{batch_id}.xlsx", conditional=True)
+        
+    except Exception as e:
+        print(f"Error during batch download: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def complete_job_status(analysis_id, analysis_dir, job_status):
+    """Ajoute à l'état d'une analyse ses résultats, dès la fin de la validation, et ses liens de
+    téléchargement une fois terminée.
+    
+    Lève OSError ou ValueError si les résultats sont illisibles.
+    """
+    job_status["analysis_id"] = analysis_id
+    if job_status.get("status") == "done" or (job_status.get("status") == "running" and job_status.get("results_ready")):
+        with open(os.path.join(analysis_dir, RESULT_FILENAME), encoding='utf-8') as f:
+            job_status["results"] = json.load(f)
+        job_status.pop("partial", None)
+    if job_status.get("status") == "done":
+        artifacts = read_artifact_index(analysis_id, analysis_dir) or {}
+        job_status["downloads"] = {name: url_for('download', analysis_id=analysis_id, artifact=name) for name in artifacts}
+    return job_status
+
+@app.route('/status/<analysis_id>')
+def status(analysis_id):
+    analysis_dir = get_analysis_dir(analysis_id)
+    job_status = read_job_status(analysis_dir) if analysis_dir else None
+    if job_status is None:
+        return jsonify({"error": "Analysis not found"}), 404
+    
+    try:
+        return jsonify(complete_job_status(analysis_id, analysis_dir, job_status))
+    except (OSError, ValueError) as e:
+        print(f"Error reading results of {analysis_id}: {str(e)}")
+        return jsonify({"error": "Results not available"}), 500
+
+@app.route('/results/<analysis_id>')
+def analysis_results(analysis_id):
+    # Lignes de détail paginées : filtres type, floor, pset, param, status ; sort=champ ou -champ ; cursor ; limit
+    analysis_dir = get_analysis_dir(analysis_id)
+    job_status = read_job_status(analysis_dir) if analysis_dir else None
+    if job_status is None:
+        return jsonify({"error": "Analysis not found"}), 404
+    if job_status.get("status") != "done" and not (job_status.get("status") == "running" and job_status.get("results_ready")):
+        return jsonify({"error": "Analysis not finished", "status": job_status.get("status")}), 409
+    
+    filters = {name: request.args[name] for name in DETAILS_INDEX_FILTERS if request.args.get(name)}
+    sort = request.args.get('sort', '')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-') or None
+    if sort is not None and sort not in DETAILS_INDEX_COLUMNS:
+        return jsonify({"error": f"Unknown sort field: {sort}"}), 400
+    try:
+        limit = int(request.args.get('limit', RESULTS_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= RESULTS_MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {RESULTS_MAX_PAGE_SIZE}"}), 400
+    try:
+        cursor = decode_cursor(request.args['cursor'], sort) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        rows, next_cursor, total = query_details(details_index(analysis_dir), filters, sort, descending, cursor, limit)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error querying details of {analysis_id}: {str(e)}")
+        return jsonify({"error": "Results not available"}), 500
+    return jsonify({"analysis_id": analysis_id, "total": total, "rows": rows, "next_cursor": next_cursor})
+
+# Flux Server-Sent Events de l'avancement d'une analyse
+EVENTS_POLL_INTERVAL = 0.5  # Secondes entre deux lectures du fichier d'état
+EVENTS_KEEPALIVE = 15  # Commentaire envoyé sans changement d'état, pour que les proxys gardent la connexion
+EVENTS_MAX_DURATION = 600  # Au-delà, le flux se ferme et EventSource se reconnecte
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/events/<analysis_id>')
+def events(analysis_id):
+    # Événements `progress` à chaque changement d'état, puis `done` (résultats) ou `failed`
+    analysis_dir = get_analysis_dir(analysis_id)
+    if analysis_dir is None or read_job_status(analysis_dir) is None:
+        return jsonify({"error": "Analysis not found"}), 404
+    
+    def stream():
+        yield f"retry: {int(EVENTS_POLL_INTERVAL * 4000)}\n\n"
+        started = last_sent = time.monotonic()
+        last_update = None
+        while time.monotonic() - started < EVENTS_MAX_DURATION:
+            job_status = read_job_status(analysis_dir)
+            if job_status is None:
+                yield sse_event("failed", {"analysis_id": analysis_id, "error": "Analysis not found"})
+                return
+            if job_status.get("updated_at") != last_update:
+                last_update = job_status.get("updated_at")
+                last_sent = time.monotonic()
+                if job_status.get("status") == "error":
+                    yield sse_event("failed", dict(job_status, analysis_id=analysis_id))
+                    return
+                try:
+                    job_status = complete_job_status(analysis_id, analysis_dir, job_status)
+                except (OSError, ValueError) as e:
+                    print(f"Error reading results of {analysis_id}: {str(e)}")
+                    yield sse_event("failed", {"analysis_id": analysis_id, "error": "Results not available"})
+                    return
+                if job_status.get("status") == "done":
+                    yield sse_event("done", job_status)
+                    return
+                yield sse_event("progress", job_status)
+            elif time.monotonic() - last_sent >= EVENTS_KEEPALIVE:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(EVENTS_POLL_INTERVAL)
+    
+    # X-Accel-Buffering : nginx transmet les événements sans les mettre en tampon
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/cache/stats')
+def cache_stats():
+    try:
+        stats = result_cache_stats()
+    except sqlite3.Error as e:
+        print(f"Error reading metrics: {str(e)}")
+        return jsonify({"error": "Metrics not available"}), 500
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics():
+    try:
+        body = render_metrics()
+    except sqlite3.Error as e:
+        print(f"Error reading metrics: {str(e)}")
+        return jsonify({"error": "Metrics not available"}), 500
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route('/profile/<analysis_id>')
+def profile(analysis_id):
+    analysis_dir = get_analysis_dir(analysis_id)
+    profile_path = os.path.join(analysis_dir, PROFILE_FILENAME) if analysis_dir else None
+    if profile_path is None or not os.path.exists(profile_path):
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(profile_path, as_attachment=True, download_name=f"{analysis_id}.pstats")
+
+@app.route('/download/<analysis_id>')
+@app.route('/download/<analysis_id>/<artifact>')
+def download(analysis_id, artifact='xlsx'):
+    try:
+        analysis_dir = get_analysis_dir(analysis_id)
+        if analysis_dir is None or not os.path.exists(analysis_dir):
             return jsonify({"error": "Analysis not found"}), 404
         
-        # Trouver le fichier Excel de sortie
-        output_files = [f for f in os.listdir(analysis_dir) if f.startswith('output_') and f.endswith('.xlsx')]
-        if not output_files:
-            return jsonify({"error": "Output file not found"}), 404
+        job_status = read_job_status(analysis_dir) or {}
+        if job_status.get("status") != "done":
+            return jsonify({"error": "Analysis not finished", "status": job_status.get("status")}), 409
+        
+        artifacts = read_artifact_index(analysis_id, analysis_dir)
+        if artifacts is None:
+            # Analyse antérieure à l'index : il est construit une fois depuis le rapport présent
+            output_files = [f for f in os.listdir(analysis_dir) if f.startswith('output_') and f.endswith('.xlsx')]
+            if not output_files:
+                return jsonify({"error": "Output file not found"}), 404
+            artifacts = write_artifact_index(analysis_dir, os.path.join(analysis_dir, output_files[0]), {})
+        if artifact not in artifacts:
+            return jsonify({"error": f"No {artifact} export for this analysis"}), 404
         
-        output_path = os.path.join(analysis_dir, output_files[0])
-        return send_file(output_path, as_attachment=True, download_name=output_files[0])
+        # ETag fort (SHA-256) et Last-Modified : reprise des téléchargements par requêtes Range
+        entry = artifacts[artifact]
+        response = send_file(os.path.join(analysis_dir, entry["filename"]), mimetype=entry["mimetype"], as_attachment=True,
+                             download_name=entry["filename"], conditional=True, etag=entry["sha256"],
+                             last_modified=entry["modified"])
+        response.headers["Accept-Ranges"] = "bytes"  # Werkzeug ne l'annonce que sur les réponses partielles
+        return response
         
+    except FileNotFoundError:
+        # Dossier supprimé par le nettoyage de TEMP_FOLDER entre-temps
+        return jsonify({"error": "Analysis not found"}), 404
     except Exception as e:
         print(f"Error during download: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -1000,4 +3570,4 @@ def download(analysis_id):
 if __name__ == '__main__':
     # Configuration du port via variable d'environnement pour Vercel
     port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
@@ -0,0 +1,200 @@
+"""Benchmark de l'analyse complète (process_files) sur des modèles synthétiques.
+
+Usage :
+    python benchmarks/bench.py                                       # 1k et 10k éléments
+    python benchmarks/bench.py --sizes 1000 10000 100000 1000000 --output baseline.json
+    python benchmarks/bench.py --output new.json --compare baseline.json
+
+Chaque mesure tourne dans un processus neuf : durée totale, durée et pic de mémoire (RSS)
+à la fin de chaque phase, lignes de détail écrites. Les modèles générés sont conservés dans
+--workdir et réutilisés tant que les paramètres de génération ne changent pas.
+Avec --compare, le script s'arrête avec un code de retour non nul si la durée ou le pic de
+mémoire d'une taille dépasse la référence de plus de --tolerance.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+import synthetic
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_once(ifc_path, excel_path):
+    """Exécute une analyse complète dans le processus courant et retourne ses mesures."""
+    import Checkers
+
+    class RssPhaseTimer(Checkers.PhaseTimer):
+        def __init__(self):
+            super().__init__()
+            self.peak_rss = {}
+
+        @contextlib.contextmanager
+        def phase(self, name):
+            with super().phase(name):
+                yield
+            self.peak_rss[name] = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Exigences compilées à froid à chaque mesure
+        Checkers.RULEBOOK_CACHE_DIR = temp_dir
+        output_path = os.path.join(temp_dir, 'report.xlsx')
+        timer = RssPhaseTimer()
+        start = time.perf_counter()
+        results = Checkers.process_files(temp_dir, ifc_path, excel_path, output_path, timer=timer)
+        wall = time.perf_counter() - start
+        report_bytes = os.path.getsize(output_path)
+
+    return {
+        "wall_s": wall,
+        "peak_rss_mb": peak_rss_mb(),
+        "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "elements": results["total_elements"],
+        "detail_rows": results["detail_rows"],
+        "report_bytes": report_bytes,
+        "phases": {name: {"seconds": seconds, "peak_rss_mb": timer.peak_rss[name]} for name, seconds in timer.timings.items()},
+    }
+
+
+def run_in_subprocess(ifc_path, excel_path):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_path = f.name
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--run', ifc_path, excel_path, result_path],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(result_path, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def generation_params(args):
+    return {
+        "classes": args.classes,
+        "storeys": args.storeys,
+        "psets": args.psets,
+        "params": args.params,
+        "missing": args.missing,
+        "mistyped": args.mistyped,
+        "quantities": args.quantities,
+        "shared_geometry": args.shared_geometry,
+        "seed": args.seed,
+    }
+
+
+def ensure_model(workdir, size, params):
+    """Génère (ou réutilise) le modèle et le classeur d'exigences d'une taille donnée."""
+    key = hashlib.sha256(json.dumps([size, params], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    ifc_path = os.path.join(workdir, f"bench_{size}_{key}.ifc")
+    excel_path = os.path.join(workdir, f"bench_{key}.xlsx")
+    if not os.path.exists(excel_path):
+        synthetic.generate_requirements(excel_path, params["classes"], params["psets"], params["params"])
+    generate_s = None
+    if not os.path.exists(ifc_path):
+        start = time.perf_counter()
+        synthetic.generate_model(ifc_path + '.tmp', size, **params)
+        os.replace(ifc_path + '.tmp', ifc_path)
+        generate_s = time.perf_counter() - start
+    return ifc_path, excel_path, generate_s
+
+
+def compare(reference, current, tolerance):
+    """Affiche les écarts avec une exécution de référence ; retourne False en cas de régression."""
+    ok = True
+    print(f"\n{'Taille':>10} {'Mesure':<28} {'Référence':>12} {'Actuel':>12} {'Écart':>8}")
+    for size, run in current["runs"].items():
+        before = reference["runs"].get(size)
+        if before is None:
+            continue
+        rows = [("wall_s", before["wall_s"], run["wall_s"], True),
+                ("peak_rss_mb", before["peak_rss_mb"], run["peak_rss_mb"], True)]
+        rows += [(f"phase {name}", before["phases"][name]["seconds"], phase["seconds"], False)
+                 for name, phase in run["phases"].items() if name in before["phases"]]
+        for label, old, new, gated in rows:
+            ratio = new / old - 1 if old else 0
+            regression = gated and ratio > tolerance
+            ok = ok and not regression
+            print(f"{size:>10} {label:<28} {old:>12.3f} {new:>12.3f} {ratio:>+7.0%}{' !' if regression else ''}")
+        if before["detail_rows"] != run["detail_rows"]:
+            ok = False
+            print(f"{size:>10} detail_rows différent : {before['detail_rows']} -> {run['detail_rows']}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="nombres d'éléments")
+    parser.add_argument('--classes', nargs='+', default=synthetic.DEFAULT_CLASSES)
+    parser.add_argument('--storeys', type=int, default=5)
+    parser.add_argument('--psets', type=int, default=2, help="PSet requis par élément")
+    parser.add_argument('--params', type=int, default=4, help="paramètres requis par PSet")
+    parser.add_argument('--missing', type=float, default=0.1, help="fraction de paramètres absents")
+    parser.add_argument('--mistyped', type=float, default=0.05, help="fraction de paramètres de type invalide")
+    parser.add_argument('--quantities', type=float, default=0.5, help="fraction d'éléments avec IfcElementQuantity")
+    parser.add_argument('--shared-geometry', action='store_true', help="géométrie partagée par type (IfcMappedItem)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help="mesures par taille, la plus rapide est retenue")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'checkers-bench'))
+    parser.add_argument('--output', help="fichier JSON des résultats")
+    parser.add_argument('--compare', help="résultats de référence à comparer")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="régression tolérée (0.2 = +20 %%)")
+    parser.add_argument('--run', nargs=3, metavar=('IFC', 'EXCEL', 'RESULT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        ifc_path, excel_path, result_path = args.run
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump(run_once(ifc_path, excel_path), f)
+        return 0
+
+    os.makedirs(args.workdir, exist_ok=True)
+    params = generation_params(args)
+    import ifcopenshell
+    report = {
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "ifcopenshell": ifcopenshell.version,
+        "cpu_count": os.cpu_count(),
+        "environment": {name: value for name, value in os.environ.items() if name.startswith('CHECKERS_')},
+        "generation": params,
+        "runs": {},
+    }
+    for size in args.sizes:
+        ifc_path, excel_path, generate_s = ensure_model(args.workdir, size, params)
+        runs = [run_in_subprocess(ifc_path, excel_path) for _ in range(args.repeat)]
+        run = min(runs, key=lambda r: r["wall_s"])
+        run["ifc_bytes"] = os.path.getsize(ifc_path)
+        if generate_s is not None:
+            run["generate_s"] = generate_s
+        report["runs"][str(size)] = run
+        phases = ', '.join(f"{name} {phase['seconds']:.2f}s" for name, phase in run["phases"].items())
+        print(f"{size:>8} éléments : {run['wall_s']:.2f}s, {run['peak_rss_mb']:.0f} Mo, {run['detail_rows']} lignes ({phases})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            reference = json.load(f)
+        if not compare(reference, report, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
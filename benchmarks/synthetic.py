@@ -0,0 +1,135 @@
+"""Génère des modèles IFC et des classeurs d'exigences synthétiques pour les benchmarks.
+
+Usage :
+    python benchmarks/synthetic.py modele.ifc exigences.xlsx 10000
+"""
+import random
+import sys
+
+import ifcopenshell
+import ifcopenshell.api
+import ifcopenshell.guid
+import pandas as pd
+
+DEFAULT_CLASSES = ["IfcWall", "IfcDoor", "IfcWindow", "IfcSlab", "IfcBeam", "IfcColumn"]
+PARAM_TYPES = ["String", "Int", "Float", "Bool"]
+# Dimensions hors-tout des classes qui en ont (estimation de quantité sans géométrie)
+OVERALL_DIMENSIONS = {"IfcDoor": (2.1, 0.9), "IfcWindow": (1.2, 1.0)}
+
+
+def pset_names(psets):
+    return [f"Pset_Bench{k}" for k in range(psets)]
+
+
+def param_specs(params):
+    """Paramètres requis de chaque PSet : (nom, type), les types alternant String/Int/Float/Bool."""
+    return [(f"Param{j}", PARAM_TYPES[j % len(PARAM_TYPES)]) for j in range(params)]
+
+
+def generate_requirements(path, classes=DEFAULT_CLASSES, psets=2, params=4):
+    """Écrit un classeur d'exigences : chaque classe requiert tous les paramètres de chaque PSet."""
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        pd.DataFrame({"IFC_Class": list(classes)}).to_excel(writer, sheet_name="Element_Types", index=False)
+        for pset_name in pset_names(psets):
+            rows = [(ifc_class, param_name, param_type) for ifc_class in classes for param_name, param_type in param_specs(params)]
+            pd.DataFrame(rows, columns=["IFC_Class", "Parametre", "Type"]).to_excel(writer, sheet_name=pset_name, index=False)
+
+
+def _value(ifc_file, param_type, index, mistyped):
+    if mistyped and param_type in ("Int", "Float"):
+        return ifc_file.create_entity("IfcLabel", "n/a")
+    if param_type == "Int":
+        return ifc_file.create_entity("IfcInteger", index)
+    if param_type == "Float":
+        return ifc_file.create_entity("IfcReal", index * 0.5)
+    if param_type == "Bool":
+        return ifc_file.create_entity("IfcBoolean", index % 2 == 0)
+    return ifc_file.create_entity("IfcLabel", f"V{index}")
+
+
+def _shared_representations(ifc_file, classes):
+    """Un type par classe, avec une représentation boîte partagée par ses occurrences (IfcMappedItem)."""
+    model = ifcopenshell.api.run("context.add_context", ifc_file, context_type="Model")
+    body = ifcopenshell.api.run("context.add_context", ifc_file, context_type="Model", context_identifier="Body",
+                                target_view="MODEL_VIEW", parent=model)
+    origin = ifc_file.createIfcCartesianTransformationOperator3D(LocalOrigin=ifc_file.createIfcCartesianPoint((0.0, 0.0, 0.0)))
+    shared = {}
+    for ifc_class in classes:
+        element_type = ifcopenshell.api.run("root.create_entity", ifc_file, ifc_class=f"{ifc_class}Type", name=f"{ifc_class[3:]} type")
+        representation = ifcopenshell.api.run("geometry.add_wall_representation", ifc_file, context=body, length=1.0, height=1.0, thickness=0.2)
+        ifcopenshell.api.run("geometry.assign_representation", ifc_file, product=element_type, representation=representation)
+        mapped_item = ifc_file.createIfcMappedItem(element_type.RepresentationMaps[0], origin)
+        shared[ifc_class] = (element_type, body, mapped_item)
+    return shared
+
+
+def generate_model(path, elements, classes=DEFAULT_CLASSES, storeys=5, psets=2, params=4,
+                   missing=0.1, mistyped=0.05, quantities=0.5, shared_geometry=False, seed=0):
+    """Écrit un modèle IFC4 de `elements` éléments répartis sur `storeys` étages.
+
+    Chaque paramètre requis est absent avec la probabilité `missing` et de type invalide avec
+    la probabilité `mistyped` ; un PSet sans paramètre est omis. Une fraction `quantities` des
+    éléments reçoit un IfcElementQuantity (volume) ; avec `shared_geometry`, chaque élément
+    instancie la représentation de son type, sinon il n'a pas de géométrie.
+    """
+    rng = random.Random(seed)
+    ifc_file = ifcopenshell.file(schema="IFC4")
+    project = ifcopenshell.api.run("root.create_entity", ifc_file, ifc_class="IfcProject", name="Benchmark")
+    ifcopenshell.api.run("unit.assign_unit", ifc_file)
+    site = ifcopenshell.api.run("root.create_entity", ifc_file, ifc_class="IfcSite", name="Site")
+    building = ifcopenshell.api.run("root.create_entity", ifc_file, ifc_class="IfcBuilding", name="Bâtiment")
+    ifcopenshell.api.run("aggregate.assign_object", ifc_file, relating_object=project, products=[site])
+    ifcopenshell.api.run("aggregate.assign_object", ifc_file, relating_object=site, products=[building])
+    storey_entities = []
+    for level in range(storeys):
+        storey = ifcopenshell.api.run("root.create_entity", ifc_file, ifc_class="IfcBuildingStorey",
+                                      name="Rez-de-chaussée" if level == 0 else f"R+{level}")
+        ifcopenshell.api.run("aggregate.assign_object", ifc_file, relating_object=building, products=[storey])
+        storey_entities.append(storey)
+
+    shared = _shared_representations(ifc_file, classes) if shared_geometry else {}
+    contained = [[] for _ in storey_entities]
+    typed = {ifc_class: [] for ifc_class in shared}
+    specs = param_specs(params)
+
+    # Entités créées directement : l'API ifcopenshell est trop lente pour un million d'éléments
+    for index in range(elements):
+        ifc_class = classes[index % len(classes)]
+        element = ifc_file.create_entity(ifc_class, GlobalId=ifcopenshell.guid.new(), Name=f"{ifc_class[3:]} {index}")
+        if ifc_class in OVERALL_DIMENSIONS:
+            element.OverallHeight, element.OverallWidth = OVERALL_DIMENSIONS[ifc_class]
+        contained[rng.randrange(storeys)].append(element)
+
+        if ifc_class in shared:
+            _, body, mapped_item = shared[ifc_class]
+            element.Representation = ifc_file.createIfcProductDefinitionShape(Representations=[
+                ifc_file.createIfcShapeRepresentation(body, "Body", "MappedRepresentation", [mapped_item])])
+            typed[ifc_class].append(element)
+
+        for pset_name in pset_names(psets):
+            properties = [
+                ifc_file.createIfcPropertySingleValue(param_name, None, _value(ifc_file, param_type, index, rng.random() < mistyped), None)
+                for param_name, param_type in specs if rng.random() >= missing
+            ]
+            if properties:
+                pset = ifc_file.createIfcPropertySet(ifcopenshell.guid.new(), None, pset_name, None, properties)
+                ifc_file.createIfcRelDefinesByProperties(ifcopenshell.guid.new(), None, None, None, [element], pset)
+
+        if rng.random() < quantities:
+            volume = ifc_file.createIfcQuantityVolume("NetVolume", None, None, rng.uniform(0.1, 5.0))
+            quantity_set = ifc_file.createIfcElementQuantity(ifcopenshell.guid.new(), None, "Qto_Bench", None, None, [volume])
+            ifc_file.createIfcRelDefinesByProperties(ifcopenshell.guid.new(), None, None, None, [element], quantity_set)
+
+    for storey, storey_elements in zip(storey_entities, contained):
+        if storey_elements:
+            ifc_file.createIfcRelContainedInSpatialStructure(ifcopenshell.guid.new(), None, None, None, storey_elements, storey)
+    for ifc_class, class_elements in typed.items():
+        if class_elements:
+            ifc_file.createIfcRelDefinesByType(ifcopenshell.guid.new(), None, None, None, class_elements, shared[ifc_class][0])
+
+    ifc_file.write(path)
+
+
+if __name__ == '__main__':
+    generate_model(sys.argv[1], int(sys.argv[3]) if len(sys.argv) > 3 else 1000)
+    generate_requirements(sys.argv[2])
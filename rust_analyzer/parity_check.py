@@ -0,0 +1,87 @@
+"""Compare le moteur de validation Rust (ifc_analyzer) au moteur Python de Checkers.py.
+
+Usage :
+    python rust_analyzer/parity_check.py                          # cas générés aléatoirement
+    python rust_analyzer/parity_check.py modele.ifc exigences.xlsx  # éléments d'un modèle réel
+
+Le script s'arrête avec un code de retour non nul à la première divergence.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import Checkers
+import ifc_analyzer
+
+# Valeurs choisies pour couvrir les cas limites des conversions int()/float()
+SAMPLE_VALUES = [
+    None, True, False, 0, 7, -12, 10 ** 20, 0.0, 3.5, -1e-7, 1e16, float('nan'), float('inf'), float('-inf'),
+    "", " ", "abc", "12", " 12 ", "-3", "+4", "1_000", "1__0", "_1", "1_", "3.5", ".5", "5.",
+    "1e5", "1E-3", "1_0.5", "inf", "-Infinity", "nan", "0x10", "12abc", "EI60", "Vrai",
+    [1, 2], ["a"],
+]
+TYPES = ["String", "string", "Int", "int", "Float", "Number", "Bool", "bool", "Date", float('nan'), 3]
+
+
+def random_rulebook(rng):
+    rules = {}
+    for ifc_class in ("IfcWall", "IfcDoor", "IfcSlab"):
+        rules[ifc_class] = tuple(
+            (f"Pset_{p}", tuple(
+                (f"Param_{i}", param_type, Checkers.type_validator(param_type))
+                for i, param_type in enumerate(rng.sample(TYPES, rng.randint(1, 4)))
+            ))
+            for p in range(rng.randint(1, 3))
+        )
+    return Checkers.Rulebook(digest=f"random-{rng.random()}", element_types=frozenset(rules), rules=rules, required_params={})
+
+
+def random_psets(rng):
+    psets = {}
+    for p in range(3):
+        if rng.random() < 0.8:
+            psets[f"Pset_{p}"] = {f"Param_{i}": rng.choice(SAMPLE_VALUES) for i in range(4) if rng.random() < 0.8}
+    return psets
+
+
+def compare(batch, rulebook):
+    expected = [Checkers.validate_element(psets, rulebook.rules.get(ifc_class, ())) for ifc_class, psets in batch]
+    actual = ifc_analyzer.validate_elements(batch, Checkers.rust_rules(rulebook))
+    for (ifc_class, psets), want, got in zip(batch, expected, actual):
+        # Valeurs des paramètres valides brutes côté Python, converties en texte par le moteur Rust
+        want = (want[0], want[1], want[2], [(pset, param, str(value), status) for pset, param, value, status in want[3]])
+        got = (got[0], got[1], got[2], [tuple(row) for row in got[3]])
+        if want != got:
+            print(f"Divergence pour {ifc_class} {psets}:\n  Python: {want}\n  Rust:   {got}")
+            return False
+    return len(expected) == len(actual)
+
+
+def check_random(iterations=200, seed=0):
+    rng = random.Random(seed)
+    for _ in range(iterations):
+        rulebook = random_rulebook(rng)
+        batch = [(rng.choice(["IfcWall", "IfcDoor", "IfcSlab", "IfcBeam"]), random_psets(rng)) for _ in range(50)]
+        if not compare(batch, rulebook):
+            return False
+    print(f"{iterations} lots aléatoires identiques")
+    return True
+
+
+def check_model(ifc_path, excel_path):
+    ifc_file = Checkers.open_model(ifc_path)
+    rulebook = Checkers.compile_requirements(excel_path)
+    property_index, _ = Checkers.build_property_index(ifc_file, rulebook)
+    batch = [(element.is_a(), property_index.get(element.id(), {}))
+             for element in ifc_file.by_type('IfcProduct') if element.is_a() in rulebook.element_types]
+    if compare(batch, rulebook):
+        print(f"{len(batch)} éléments identiques")
+        return True
+    return False
+
+
+if __name__ == '__main__':
+    ok = check_model(*sys.argv[1:3]) if len(sys.argv) >= 3 else check_random()
+    sys.exit(0 if ok else 1)
@@ -1,127 +1,281 @@
 use pyo3::prelude::*;
-use pyo3::types::{PyDict, PyList};
+use pyo3::types::{PyBool, PyDict, PyFloat, PyList, PyLong, PyString, PyTuple};
 use rayon::prelude::*;
 use std::collections::HashMap;
-use serde::{Serialize, Deserialize};
 
-#[derive(Serialize, Deserialize)]
-struct ElementStats {
-    total: usize,
-    valid: usize,
-    missing_pset: usize,
-    missing_param: usize,
+// Valeur d'un paramètre, réduite à ce qui détermine le résultat de str()/int()/float()/bool() en Python
+enum Value {
+    Bool,
+    Int,
+    Float(f64),
+    Str(String),
+    Other,
 }
 
-#[derive(Serialize, Deserialize)]
-struct FloorStats {
-    valid: usize,
-    invalid: usize,
+struct Param {
+    value: Value,
+    text: String, // str(valeur) côté Python
 }
 
-#[pyfunction]
-fn analyze_elements(
-    py: Python,
-    elements: &PyList,
-    required_psets: &PyDict,
-    element_psets: &PyDict,
-) -> PyResult<PyObject> {
-    // Conversion des données Python en structures Rust
-    let elements: Vec<String> = elements
-        .iter()
-        .map(|e| e.extract::<String>())
-        .collect::<Result<Vec<_>, _>>()?;
+// Paramètre absent (None Python) => None
+type Pset = HashMap<String, Option<Param>>;
 
-    let required_psets: HashMap<String, HashMap<String, Vec<String>>> = required_psets
-        .extract()?;
+struct Element {
+    ifc_class: String,
+    psets: HashMap<String, Pset>,
+}
 
-    let element_psets: HashMap<String, HashMap<String, HashMap<String, String>>> = element_psets
-        .extract()?;
+#[derive(Clone, Copy)]
+enum Validator {
+    Str,
+    Int,
+    Float,
+    Bool,
+    Unsupported,
+}
 
-    // Statistiques globales
-    let mut stats = ElementStats {
-        total: elements.len(),
-        valid: 0,
-        missing_pset: 0,
-        missing_param: 0,
-    };
+struct ParamRule {
+    name: String,
+    validator: Validator,
+    type_display: String, // str(type) du fichier d'exigences, pour le message "(attendu: ...)"
+}
 
-    // Statistiques par étage
-    let mut floor_stats: HashMap<String, FloorStats> = HashMap::new();
-
-    // Analyse parallèle des éléments
-    let results: Vec<(bool, String, usize, usize)> = elements.par_iter()
-        .map(|element_id| {
-            let mut missing_pset = 0;
-            let mut missing_param = 0;
-            let mut is_valid = true;
-
-            if let Some(element_data) = element_psets.get(element_id) {
-                for (pset_name, required_params) in &required_psets {
-                    if let Some(pset) = element_data.get(pset_name) {
-                        for param_name in required_params.values().flatten() {
-                            if !pset.contains_key(param_name) {
-                                missing_param += 1;
-                                is_valid = false;
-                            }
-                        }
-                    } else {
-                        missing_pset += 1;
-                        is_valid = false;
-                    }
-                }
-            }
+struct PsetRule {
+    name: String,
+    params: Vec<ParamRule>,
+}
 
-            let floor = element_data
-                .get("floor")
-                .map(|f| f.to_string())
-                .unwrap_or_else(|| "unknown".to_string());
+struct Row {
+    pset: String,
+    param: String,
+    value: String,
+    status: &'static str,
+}
 
-            (is_valid, floor, missing_pset, missing_param)
+struct ElementResult {
+    valid: bool,
+    missing_pset: bool,
+    missing_param: bool,
+    rows: Vec<Row>,
+}
+
+fn extract_value(value: &PyAny) -> PyResult<Option<Param>> {
+    if value.is_none() {
+        return Ok(None);
+    }
+    let text = value.str()?.to_str()?.to_owned();
+    // bool avant int : en Python, bool est une sous-classe de int
+    let value = if value.is_instance_of::<PyBool>()? {
+        Value::Bool
+    } else if value.is_instance_of::<PyLong>()? {
+        Value::Int
+    } else if value.is_instance_of::<PyFloat>()? {
+        Value::Float(value.extract::<f64>()?)
+    } else if value.is_instance_of::<PyString>()? {
+        Value::Str(text.clone())
+    } else {
+        Value::Other
+    };
+    Ok(Some(Param { value, text }))
+}
+
+// Chiffres séparés par des '_' isolés, comme l'accepte Python
+fn python_digits(s: &str) -> bool {
+    let chars: Vec<char> = s.chars().collect();
+    !chars.is_empty()
+        && chars.iter().enumerate().all(|(i, c)| {
+            c.is_ascii_digit()
+                || (*c == '_'
+                    && i > 0
+                    && i + 1 < chars.len()
+                    && chars[i - 1].is_ascii_digit()
+                    && chars[i + 1].is_ascii_digit())
         })
-        .collect();
+}
 
-    // Agrégation des résultats
-    for (is_valid, floor, mp, mm) in results {
-        if is_valid {
-            stats.valid += 1;
+fn strip_sign(s: &str) -> &str {
+    s.strip_prefix('+').or_else(|| s.strip_prefix('-')).unwrap_or(s)
+}
+
+// int(str) en Python
+fn python_int_parses(s: &str) -> bool {
+    python_digits(strip_sign(s.trim()))
+}
+
+// float(str) en Python
+fn python_float_parses(s: &str) -> bool {
+    let t = s.trim();
+    let unsigned = strip_sign(t).to_ascii_lowercase();
+    if unsigned == "inf" || unsigned == "infinity" || unsigned == "nan" {
+        return true;
+    }
+    let chars: Vec<char> = t.chars().collect();
+    for (i, c) in chars.iter().enumerate() {
+        if *c == '_'
+            && !(i > 0 && i + 1 < chars.len() && chars[i - 1].is_ascii_digit() && chars[i + 1].is_ascii_digit())
+        {
+            return false;
         }
-        stats.missing_pset += mp;
-        stats.missing_param += mm;
+    }
+    let cleaned: String = chars.into_iter().filter(|c| *c != '_').collect();
+    cleaned
+        .chars()
+        .all(|c| c.is_ascii_digit() || matches!(c, '.' | 'e' | 'E' | '+' | '-'))
+        && cleaned.parse::<f64>().is_ok()
+}
 
-        let floor_stat = floor_stats
-            .entry(floor)
-            .or_insert(FloorStats { valid: 0, invalid: 0 });
+fn accepts(validator: Validator, value: &Value) -> bool {
+    match validator {
+        Validator::Str | Validator::Bool => true,
+        Validator::Unsupported => false,
+        Validator::Int => match value {
+            Value::Bool | Value::Int => true,
+            // int(nan) lève ValueError, int(inf) OverflowError
+            Value::Float(f) => f.is_finite(),
+            Value::Str(s) => python_int_parses(s),
+            Value::Other => false,
+        },
+        Validator::Float => match value {
+            Value::Bool | Value::Int | Value::Float(_) => true,
+            Value::Str(s) => python_float_parses(s),
+            Value::Other => false,
+        },
+    }
+}
 
-        if is_valid {
-            floor_stat.valid += 1;
-        } else {
-            floor_stat.invalid += 1;
+// Même algorithme que validate_element() dans Checkers.py
+fn validate_element(element: &Element, rules: &HashMap<String, Vec<PsetRule>>) -> ElementResult {
+    let mut result = ElementResult {
+        valid: true,
+        missing_pset: false,
+        missing_param: false,
+        rows: Vec::new(),
+    };
+    let class_rules = match rules.get(&element.ifc_class) {
+        Some(class_rules) => class_rules,
+        None => return result,
+    };
+
+    for pset_rule in class_rules {
+        let pset = match element.psets.get(&pset_rule.name) {
+            Some(pset) => pset,
+            None => {
+                result.valid = false;
+                result.missing_pset = true;
+                result.rows.push(Row {
+                    pset: pset_rule.name.clone(),
+                    param: "TOUS".to_string(),
+                    value: "MANQUANT".to_string(),
+                    status: "KO",
+                });
+                continue;
+            }
+        };
+
+        for param_rule in &pset_rule.params {
+            let (value, status) = match pset.get(&param_rule.name) {
+                Some(Some(param)) => {
+                    if accepts(param_rule.validator, &param.value) {
+                        (param.text.clone(), "OK")
+                    } else {
+                        (format!("{} (attendu: {})", param.text, param_rule.type_display), "KO")
+                    }
+                }
+                _ => ("MANQUANT".to_string(), "KO"),
+            };
+            if status == "KO" {
+                result.valid = false;
+                result.missing_param = true;
+            }
+            result.rows.push(Row {
+                pset: pset_rule.name.clone(),
+                param: param_rule.name.clone(),
+                value,
+                status,
+            });
         }
     }
+    result
+}
 
-    // Conversion des résultats en dictionnaire Python
-    let result = PyDict::new(py);
-    result.set_item("total_elements", stats.total)?;
-    result.set_item("valid_elements", stats.valid)?;
-    result.set_item("missing_psets", stats.missing_pset)?;
-    result.set_item("missing_params", stats.missing_param)?;
-
-    let floors: Vec<(&String, &FloorStats)> = floor_stats.iter().collect();
-    let py_floors = PyList::empty(py);
-    for (floor_name, stats) in floors {
-        let floor_dict = PyDict::new(py);
-        floor_dict.set_item("name", floor_name)?;
-        floor_dict.set_item("valid", stats.valid)?;
-        floor_dict.set_item("invalid", stats.invalid)?;
-        py_floors.append(floor_dict.into())?;
+fn extract_rules(rules: &PyDict) -> PyResult<HashMap<String, Vec<PsetRule>>> {
+    let mut compiled = HashMap::new();
+    for (ifc_class, class_rules) in rules.iter() {
+        let mut pset_rules = Vec::new();
+        for pset_rule in class_rules.downcast::<PyList>()?.iter() {
+            let (name, params): (String, Vec<(String, String, String)>) = pset_rule.extract()?;
+            let params = params
+                .into_iter()
+                .map(|(name, validator, type_display)| ParamRule {
+                    name,
+                    validator: match validator.as_str() {
+                        "str" => Validator::Str,
+                        "int" => Validator::Int,
+                        "float" => Validator::Float,
+                        "bool" => Validator::Bool,
+                        _ => Validator::Unsupported,
+                    },
+                    type_display,
+                })
+                .collect();
+            pset_rules.push(PsetRule { name, params });
+        }
+        compiled.insert(ifc_class.extract::<String>()?, pset_rules);
+    }
+    Ok(compiled)
+}
+
+fn extract_element(element: &PyAny) -> PyResult<Element> {
+    let element = element.downcast::<PyTuple>()?;
+    let ifc_class: String = element.get_item(0)?.extract()?;
+    let mut psets = HashMap::new();
+    for (pset_name, values) in element.get_item(1)?.downcast::<PyDict>()?.iter() {
+        let mut pset = Pset::new();
+        for (param_name, value) in values.downcast::<PyDict>()?.iter() {
+            pset.insert(param_name.str()?.to_str()?.to_owned(), extract_value(value)?);
+        }
+        psets.insert(pset_name.extract::<String>()?, pset);
     }
-    result.set_item("floors", py_floors)?;
+    Ok(Element { ifc_class, psets })
+}
 
-    Ok(result.into())
+/// Valide un lot d'éléments contre les règles du fichier d'exigences.
+///
+/// elements : liste de (classe IFC, {PSet: {paramètre: valeur}})
+/// rules : {classe IFC: [(PSet, [(paramètre, validateur, type affiché)])]},
+///         validateur parmi "str", "int", "float", "bool", "unsupported"
+///
+/// Retourne, dans l'ordre des éléments, des tuples
+/// (valide, PSet manquant, paramètre manquant, [(PSet, paramètre, valeur, statut)]).
+#[pyfunction]
+fn validate_elements(py: Python, elements: &PyList, rules: &PyDict) -> PyResult<PyObject> {
+    let rules = extract_rules(rules)?;
+    let elements = elements
+        .iter()
+        .map(extract_element)
+        .collect::<PyResult<Vec<_>>>()?;
+
+    // Validation parallèle, sans le GIL
+    let results: Vec<ElementResult> = py.allow_threads(|| {
+        elements
+            .par_iter()
+            .map(|element| validate_element(element, &rules))
+            .collect()
+    });
+
+    let output = PyList::empty(py);
+    for result in results {
+        let rows = PyList::empty(py);
+        for row in result.rows {
+            rows.append((row.pset, row.param, row.value, row.status))?;
+        }
+        output.append((result.valid, result.missing_pset, result.missing_param, rows))?;
+    }
+    Ok(output.into())
 }
 
 #[pymodule]
 fn ifc_analyzer(_py: Python, m: &PyModule) -> PyResult<()> {
-    m.add_function(wrap_pyfunction!(analyze_elements, m)?)?;
+    m.add_function(wrap_pyfunction!(validate_elements, m)?)?;
     Ok(())
 }
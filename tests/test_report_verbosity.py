@@ -0,0 +1,48 @@
+"""Nombre de lignes de l'onglet Détails selon la verbosité du rapport (full, rollup, failures)."""
+import os
+import sys
+
+import pytest
+from openpyxl import load_workbook
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+
+import Checkers
+import synthetic
+
+
+@pytest.fixture(scope='module')
+def model(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('model')
+    ifc_path, excel_path = str(directory / 'model.ifc'), str(directory / 'requirements.xlsx')
+    synthetic.generate_model(ifc_path, 200, missing=0.2, mistyped=0.1)
+    synthetic.generate_requirements(excel_path)
+    return ifc_path, excel_path
+
+
+@pytest.mark.parametrize('verbosity', Checkers.REPORT_VERBOSITIES)
+def test_detail_rows_match_details_sheet(model, tmp_path, verbosity):
+    ifc_path, excel_path = model
+    output_path = str(tmp_path / 'report.xlsx')
+    results = Checkers.process_files(str(tmp_path), ifc_path, excel_path, output_path, verbosity=verbosity)
+    
+    sheet = load_workbook(output_path, read_only=True)["Détails"]
+    sheet_rows = sum(1 for _ in sheet.iter_rows(min_row=2, values_only=True))
+    assert results["report"] == verbosity
+    assert results["detail_rows"] == sheet_rows
+    # /results indexe les mêmes lignes que l'onglet Détails
+    elements_path = str(tmp_path / Checkers.ELEMENTS_FILENAME)
+    assert sum(1 for _ in Checkers.iter_element_detail_rows(elements_path, verbosity)) == sheet_rows
+
+
+def test_detail_rows_by_verbosity(model, tmp_path):
+    ifc_path, excel_path = model
+    counts = {}
+    for verbosity in Checkers.REPORT_VERBOSITIES:
+        directory = tmp_path / verbosity
+        directory.mkdir()
+        counts[verbosity] = Checkers.process_files(str(directory), ifc_path, excel_path, str(directory / 'report.xlsx'),
+                                                   verbosity=verbosity)["detail_rows"]
+    assert 0 < counts["failures"] < counts["rollup"] < counts["full"]
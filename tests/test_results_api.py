@@ -0,0 +1,98 @@
+"""Pagination de /results : filtres, tri et curseur, comparés aux lignes de l'onglet Détails."""
+import base64
+import json
+import os
+import shutil
+import sys
+import uuid
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+
+import Checkers
+import synthetic
+
+
+@pytest.fixture(scope='module')
+def analysis(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('model')
+    ifc_path, excel_path = str(directory / 'model.ifc'), str(directory / 'requirements.xlsx')
+    synthetic.generate_model(ifc_path, 300, missing=0.2, mistyped=0.1)
+    synthetic.generate_requirements(excel_path)
+    
+    analysis_id = str(uuid.uuid4())
+    analysis_dir = os.path.join(Checkers.TEMP_FOLDER, analysis_id)
+    os.makedirs(analysis_dir)
+    try:
+        results = Checkers.run_analysis_job(analysis_id, analysis_dir, ifc_path, excel_path, os.path.join(analysis_dir, 'report.xlsx'))
+        assert results is not None
+        yield analysis_id, analysis_dir
+    finally:
+        shutil.rmtree(analysis_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Pas de processus d'analyse préchauffés pour ces requêtes
+    monkeypatch.setattr(Checkers, 'WARM_UP', False)
+    return Checkers.app.test_client()
+
+
+def expected_rows(analysis_dir, filters, sort, descending):
+    fields = list(Checkers.DETAILS_INDEX_COLUMNS)
+    rows = [dict(zip(fields, ("" if value is None else str(value) for value in detail)))
+            for detail in Checkers.iter_element_detail_rows(os.path.join(analysis_dir, Checkers.ELEMENTS_FILENAME))]
+    numbered = [(row[sort] if sort else number, number, row) for number, row in enumerate(rows)
+                if all(row[name] == value for name, value in filters.items())]
+    return [row for _, _, row in sorted(numbered, key=lambda item: item[:2], reverse=descending)]
+
+
+def fetch_all(client, analysis_id, params):
+    rows, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, limit=7, **({"cursor": cursor} if cursor else {}))
+        response = client.get(f'/results/{analysis_id}', query_string=query)
+        assert response.status_code == 200
+        page = response.get_json()
+        rows += page["rows"]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows, page["total"], pages
+
+
+def test_index_built_by_analysis(analysis):
+    _, analysis_dir = analysis
+    assert os.path.exists(os.path.join(analysis_dir, Checkers.DETAILS_INDEX_FILENAME))
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {"status": "KO"},
+    {"sort": "name"},
+    {"status": "KO", "sort": "-param"},
+    {"type": "IfcWall", "sort": "floor"},
+    {"status": "OK", "sort": "-value"},
+])
+def test_filter_sort_cursor_paging(analysis, client, params):
+    analysis_id, analysis_dir = analysis
+    sort = params.get("sort", "")
+    filters = {name: value for name, value in params.items() if name != "sort"}
+    expected = expected_rows(analysis_dir, filters, sort.lstrip('-') or None, sort.startswith('-'))
+    assert expected
+    
+    rows, total, pages = fetch_all(client, analysis_id, params)
+    assert rows == expected
+    assert total == len(expected)
+    assert pages == -(-len(expected) // 7)
+
+
+@pytest.mark.parametrize('values', [[[1], 2], [{"a": 1}, 2], ["x", True], [None, 2], [1]])
+def test_invalid_cursor(analysis, client, values):
+    analysis_id, _ = analysis
+    cursor = base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+    response = client.get(f'/results/{analysis_id}', query_string={"sort": "name", "cursor": cursor})
+    assert response.status_code == 400
@@ -0,0 +1,27 @@
+"""Parité du moteur de validation Rust (ifc_analyzer) avec le moteur Python, si le module est compilé."""
+import os
+import sys
+
+import pytest
+
+ifc_analyzer = pytest.importorskip("ifc_analyzer")
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'rust_analyzer'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+
+import parity_check
+import synthetic
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_random_batches(seed):
+    assert parity_check.check_random(iterations=100, seed=seed)
+
+
+def test_synthetic_model(tmp_path):
+    ifc_path, excel_path = str(tmp_path / 'model.ifc'), str(tmp_path / 'requirements.xlsx')
+    synthetic.generate_model(ifc_path, 500, missing=0.2, mistyped=0.1)
+    synthetic.generate_requirements(excel_path)
+    assert parity_check.check_model(ifc_path, excel_path)